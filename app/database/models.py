@@ -3,7 +3,11 @@
 from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime, date
 from sqlalchemy.dialects.postgresql import JSON
+from sqlalchemy import event, inspect, text
+from sqlalchemy.orm import Session, object_session
+from sqlalchemy.schema import CreateColumn
 from decimal import Decimal
+from typing import Dict, Tuple
 
 db = SQLAlchemy()
 
@@ -65,6 +69,9 @@ class Reseller(db.Model):
     # Avatar/initials for display
     avatar_initials = db.Column(db.String(5))
     
+    # Bumped whenever sales or structure anywhere in this reseller's subtree change
+    subtree_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    
     # Timestamps
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -79,14 +86,26 @@ class Reseller(db.Model):
                                      foreign_keys='CommissionCalculation.source_reseller_id',
                                      backref='source', lazy=True)
     
+    __table_args__ = (
+        # Children of a sponsor in id order: tree expansion and keyset paging
+        db.Index('ix_resellers_sponsor_id', 'sponsor_id', 'id'),
+        # Member listing filters and sort keys, each ending in id for the keyset
+        db.Index('ix_resellers_name', 'first_name', 'last_name', 'id'),
+        db.Index('ix_resellers_join_date', 'join_date', 'id'),
+        db.Index('ix_resellers_level', 'level', 'id'),
+        db.Index('ix_resellers_organization', 'organization_id', 'id'),
+        db.Index('ix_resellers_territory', 'territory', 'id'),
+        db.Index('ix_resellers_active', 'active_status', 'id'),
+    )
+    
     @property
     def full_name(self):
         return f"{self.first_name} {self.last_name}"
     
     @property
     def direct_downlines(self):
-        """Get direct downlines (children)"""
-        return Reseller.query.filter_by(sponsor_id=self.id).all()
+        """Get direct downlines (children); no query once HierarchyLoader has run"""
+        return self.downlines
     
     def get_monthly_sales(self, month):
         """Get sales for a specific month"""
@@ -123,6 +142,10 @@ class Reseller(db.Model):
         
         return result
 
+def _entered_amount(column: str):
+    """Column default: a row written outside the sales ledger is all manually entered"""
+    return lambda context: context.get_current_parameters().get(column) or 0
+
 class MonthlySales(db.Model):
     """Monthly sales records for each reseller"""
     __tablename__ = 'monthly_sales'
@@ -137,11 +160,31 @@ class MonthlySales(db.Model):
     standard_sales = db.Column(db.Numeric(12, 2), default=0)
     basic_sales = db.Column(db.Numeric(12, 2), default=0)
     
+    # The manually entered part of each amount (sales updates and imports);
+    # confirmed ledger sales make up the rest, so neither overwrites the other
+    manual_gppis = db.Column(db.Numeric(12, 2), nullable=False,
+                             default=_entered_amount('gppis'), server_default='0')
+    manual_premium_sales = db.Column(db.Numeric(12, 2), nullable=False,
+                                     default=_entered_amount('premium_sales'), server_default='0')
+    manual_standard_sales = db.Column(db.Numeric(12, 2), nullable=False,
+                                      default=_entered_amount('standard_sales'), server_default='0')
+    manual_basic_sales = db.Column(db.Numeric(12, 2), nullable=False,
+                                   default=_entered_amount('basic_sales'), server_default='0')
+    
+    # Optimistic concurrency: bumped by every upsert
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+    # GPPIS before the latest upsert, returned so uplines can be adjusted without a read
+    previous_gppis = db.Column(db.Numeric(12, 2), nullable=False, default=0, server_default='0')
+    
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     # Unique constraint
-    __table_args__ = (db.UniqueConstraint('reseller_id', 'month', name='_reseller_month_uc'),)
+    __table_args__ = (
+        db.UniqueConstraint('reseller_id', 'month', name='_reseller_month_uc'),
+        # Member listing sorted by a month's sales
+        db.Index('ix_monthly_sales_month_gppis', 'month', 'gppis', 'reseller_id'),
+    )
     
     def to_dict(self):
         return {
@@ -151,7 +194,75 @@ class MonthlySales(db.Model):
             'gppis': float(self.gppis),
             'premium_sales': float(self.premium_sales),
             'standard_sales': float(self.standard_sales),
-            'basic_sales': float(self.basic_sales)
+            'basic_sales': float(self.basic_sales),
+            'version': self.version
+        }
+
+# Products a sale may be booked against and the MonthlySales column each rolls into
+SALES_PRODUCT_COLUMNS = {
+    'SUNX-PREMIUM': 'premium_sales',
+    'SUNX-STANDARD': 'standard_sales',
+    'SUNX-BASIC': 'basic_sales'
+}
+SALES_STATUSES = ('confirmed', 'pending', 'cancelled')  # Only confirmed sales count
+# Share of GPPIS each product column is assumed to hold, in SALES_PRODUCT_COLUMNS
+# order, for sales recorded only as a total
+DEFAULT_PRODUCT_SPLIT = (Decimal('0.4'), Decimal('0.4'), Decimal('0.2'))
+
+def product_breakdown(gppis, products) -> Tuple[Decimal, ...]:
+    """
+    (premium, standard, basic) sales behind a GPPIS total
+    Product columns may cover only part of it (total-only rows, ledger sales
+    on such rows, signed adjustments); the rest follows DEFAULT_PRODUCT_SPLIT.
+    Columns adding up to more than the total no longer describe it, so then
+    the whole total is split.
+    """
+    zero = Decimal('0')
+    gppis = gppis or zero
+    products = tuple(amount or zero for amount in products)
+    recorded = sum(products, zero)
+    if recorded > gppis:
+        products, recorded = (zero,) * len(products), zero
+    remainder = gppis - recorded
+    return tuple(amount + remainder * share for amount, share in zip(products, DEFAULT_PRODUCT_SPLIT))
+# MonthlySales amount columns and the column holding each one's manually entered part
+MANUAL_SALES_COLUMNS = {
+    'gppis': 'manual_gppis',
+    'premium_sales': 'manual_premium_sales',
+    'standard_sales': 'manual_standard_sales',
+    'basic_sales': 'manual_basic_sales'
+}
+
+class SalesTransaction(db.Model):
+    """Individual sales; confirmed ones roll up into MonthlySales"""
+    __tablename__ = 'sales_transactions'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    reseller_id = db.Column(db.Integer, db.ForeignKey('resellers.id'), nullable=False)
+    product = db.Column(db.String(50), nullable=False)  # 'SUNX-PREMIUM', etc.
+    amount = db.Column(db.Numeric(12, 2), nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='confirmed')
+    sale_type = db.Column(db.String(20))  # 'POS', 'Sale Order'
+    transacted_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    month = db.Column(db.String(7), nullable=False)  # Derived from transacted_at
+    
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    __table_args__ = (
+        db.Index('ix_sales_transactions_reseller_month', 'reseller_id', 'month'),
+    )
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'reseller_id': self.reseller_id,
+            'product': self.product,
+            'amount': float(self.amount),
+            'status': self.status,
+            'sale_type': self.sale_type,
+            'transacted_at': self.transacted_at.isoformat() if self.transacted_at else None,
+            'month': self.month
         }
 
 class CommissionRule(db.Model):
@@ -205,6 +316,12 @@ class CommissionCalculation(db.Model):
     
     calculated_at = db.Column(db.DateTime, default=datetime.utcnow)
     
+    __table_args__ = (
+        # History breakdowns group on these; the amount makes the index covering
+        db.Index('ix_commission_calc_reseller_month_type',
+                 'reseller_id', 'month', 'commission_type', 'commission_amount'),
+    )
+    
     def to_dict(self):
         return {
             'id': self.id,
@@ -267,9 +384,569 @@ class MonthlySummary(db.Model):
             'promotion_eligible': self.promotion_eligible
         }
 
+class GroupSalesAggregate(db.Model):
+    """Maintained per-month group sales (GGPIS) for each reseller"""
+    __tablename__ = 'group_sales_aggregates'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    reseller_id = db.Column(db.Integer, db.ForeignKey('resellers.id'), nullable=False)
+    month = db.Column(db.String(7), nullable=False)  # Format: 'YYYY-MM'
+    
+    # Sales metrics
+    gppis = db.Column(db.Numeric(12, 2), default=0)
+    ggpis = db.Column(db.Numeric(14, 2), default=0)  # Personal plus all downline sales
+    
+    # Qualification inputs, kept in step with sales changes
+    active_status = db.Column(db.Boolean, default=False)
+    active_bps = db.Column(db.Integer, default=0)  # Active BPs in first level
+    active_ibos_downline = db.Column(db.Integer, default=0)  # Active IBOs in entire downline
+    qualified_tier = db.Column(db.String(50))  # Group override or BD service fee tier
+    
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    # Unique constraint
+    __table_args__ = (db.UniqueConstraint('month', 'reseller_id', name='_group_sales_month_reseller_uc'),)
+    
+    def to_dict(self):
+        return {
+            'reseller_id': self.reseller_id,
+            'month': self.month,
+            'gppis': float(self.gppis),
+            'ggpis': float(self.ggpis),
+            'active_status': self.active_status,
+            'active_bps': self.active_bps,
+            'active_ibos_downline': self.active_ibos_downline,
+            'qualified_tier': self.qualified_tier
+        }
+
+class ResellerClosure(db.Model):
+    """Ancestor/descendant pairs of the sponsor tree (closure table)"""
+    __tablename__ = 'reseller_closure'
+    
+    ancestor_id = db.Column(db.Integer, db.ForeignKey('resellers.id'), primary_key=True)
+    descendant_id = db.Column(db.Integer, db.ForeignKey('resellers.id'), primary_key=True)
+    depth = db.Column(db.Integer, nullable=False)  # 0 for the reseller itself
+    
+    __table_args__ = (
+        db.Index('ix_reseller_closure_descendant', 'descendant_id', 'depth'),
+    )
+
+@event.listens_for(Reseller, 'after_insert')
+def _closure_after_insert(mapper, connection, target):
+    """Link a new reseller to itself and to every upline of its sponsor"""
+    connection.execute(text(
+        "INSERT INTO reseller_closure (ancestor_id, descendant_id, depth) "
+        "SELECT ancestor_id, :id, depth + 1 FROM reseller_closure "
+        "WHERE descendant_id = :sponsor_id "
+        "UNION ALL SELECT :id, :id, 0"
+    ), {'id': target.id, 'sponsor_id': target.sponsor_id})
+
+@event.listens_for(Reseller, 'after_update')
+def _closure_after_update(mapper, connection, target):
+    """Re-attach the reseller's whole subtree when its sponsor changes"""
+    if not db.inspect(target).attrs.sponsor_id.history.has_changes():
+        return
+    
+    # Detach the subtree from its old uplines
+    connection.execute(text(
+        "DELETE FROM reseller_closure "
+        "WHERE descendant_id IN (SELECT descendant_id FROM reseller_closure WHERE ancestor_id = :id) "
+        "AND ancestor_id NOT IN (SELECT descendant_id FROM reseller_closure WHERE ancestor_id = :id)"
+    ), {'id': target.id})
+    
+    # Attach it under every upline of the new sponsor
+    connection.execute(text(
+        "INSERT INTO reseller_closure (ancestor_id, descendant_id, depth) "
+        "SELECT up.ancestor_id, sub.descendant_id, up.depth + sub.depth + 1 "
+        "FROM reseller_closure up CROSS JOIN reseller_closure sub "
+        "WHERE up.descendant_id = :sponsor_id AND sub.ancestor_id = :id"
+    ), {'id': target.id, 'sponsor_id': target.sponsor_id})
+
+def rebuild_reseller_closure():
+    """Rebuild the closure table from the sponsor links (backfill/repair)"""
+    sponsors = dict(db.session.query(Reseller.id, Reseller.sponsor_id).all())
+    
+    rows = []
+    for reseller_id in sponsors:
+        depth = 0
+        current_id = reseller_id
+        seen = set()
+        while current_id is not None and current_id not in seen:
+            seen.add(current_id)
+            rows.append({'ancestor_id': current_id, 'descendant_id': reseller_id, 'depth': depth})
+            current_id = sponsors.get(current_id)
+            depth += 1
+    
+    ResellerClosure.query.delete()
+    if rows:
+        db.session.execute(db.insert(ResellerClosure), rows)
+    db.session.commit()
+    return len(rows)
+
+# Label space reserved after each subtree so new downlines fit without renumbering
+TOUR_GAP = 2 ** 32
+
+class ResellerTour(db.Model):
+    """Euler-tour (entry/exit) labels of the sponsor tree"""
+    __tablename__ = 'reseller_tour'
+    
+    reseller_id = db.Column(db.Integer, db.ForeignKey('resellers.id'), primary_key=True)
+    tour_in = db.Column(db.BigInteger, nullable=False)   # Subtree labels lie in [tour_in, tour_out]
+    tour_out = db.Column(db.BigInteger, nullable=False)
+    depth = db.Column(db.Integer, nullable=False)  # 0 for root resellers
+    
+    __table_args__ = (
+        db.Index('ix_reseller_tour_in', 'tour_in'),
+    )
+
+_tour_version = 0
+
+def tour_version() -> int:
+    """Counter bumped whenever tour labels change in this process"""
+    return _tour_version
+
+def _bump_tour_version():
+    global _tour_version
+    _tour_version += 1
+
+def _label_tour(sponsors):
+    """Assign gapped tour labels to every reseller reachable from a root"""
+    children = {}
+    for reseller_id, sponsor_id in sorted(sponsors.items()):
+        children.setdefault(sponsor_id if sponsor_id in sponsors else None, []).append(reseller_id)
+    
+    rows = []
+    counter = 0
+    tour_in = {}
+    stack = [(root, 0, False) for root in reversed(children.get(None, []))]
+    while stack:
+        reseller_id, depth, finished = stack.pop()
+        if finished:
+            counter += TOUR_GAP
+            rows.append({'reseller_id': reseller_id, 'tour_in': tour_in[reseller_id],
+                         'tour_out': counter, 'depth': depth})
+            counter += 1
+            continue
+        tour_in[reseller_id] = counter
+        counter += 1
+        stack.append((reseller_id, depth, True))
+        for child_id in reversed(children.get(reseller_id, [])):
+            stack.append((child_id, depth + 1, False))
+    
+    return rows
+
+def _relabel_tour(connection):
+    """Renumber the whole tour from the sponsor links"""
+    sponsors = dict(connection.execute(text("SELECT id, sponsor_id FROM resellers")).all())
+    connection.execute(text("DELETE FROM reseller_tour"))
+    rows = _label_tour(sponsors)
+    if rows:
+        connection.execute(ResellerTour.__table__.insert(), rows)
+    _bump_tour_version()
+
+def _place_tour_subtree(connection, root_id, sponsor_id):
+    """
+    Relabel a new reseller, or a moved subtree, inside the free label space
+    at the end of its sponsor's range; renumber everything when it is full
+    """
+    current = connection.execute(text(
+        "SELECT tour_in, tour_out, depth FROM reseller_tour WHERE reseller_id = :id"
+    ), {'id': root_id}).first()
+    
+    if current:
+        members = connection.execute(text(
+            "SELECT reseller_id, tour_in, tour_out, depth FROM reseller_tour "
+            "WHERE tour_in BETWEEN :lo AND :hi"
+        ), {'lo': current.tour_in, 'hi': current.tour_out}).all()
+        outside = "AND NOT (t.tour_in BETWEEN :lo AND :hi)"
+        bounds = {'lo': current.tour_in, 'hi': current.tour_out}
+    else:
+        members = []
+        outside = ""
+        bounds = {}
+    size = max(len(members), 1)
+    
+    if sponsor_id is None:
+        last = connection.execute(text(
+            f"SELECT MAX(t.tour_out) FROM reseller_tour t WHERE 1 = 1 {outside}"
+        ), bounds).scalar()
+        lo = last if last is not None else -1
+        hi = lo + 2 * TOUR_GAP * size
+        depth = 0
+    else:
+        sponsor = connection.execute(text(
+            "SELECT tour_in, tour_out, depth FROM reseller_tour WHERE reseller_id = :id"
+        ), {'id': sponsor_id}).first()
+        if not sponsor:
+            _relabel_tour(connection)
+            return
+        last_child = connection.execute(text(
+            "SELECT MAX(t.tour_out) FROM reseller_tour t JOIN resellers r ON r.id = t.reseller_id "
+            f"WHERE r.sponsor_id = :sponsor_id AND r.id != :id {outside}"
+        ), {'sponsor_id': sponsor_id, 'id': root_id, **bounds}).scalar()
+        lo = last_child if last_child is not None else sponsor.tour_in
+        hi = sponsor.tour_out
+        depth = sponsor.depth + 1
+    
+    # Use at most half of the free space, leaving the rest for later siblings
+    step = min((hi - lo - 1) // 2 // (2 * size), TOUR_GAP >> 12)
+    if step < 1:
+        _relabel_tour(connection)
+        return
+    
+    if not current:
+        connection.execute(ResellerTour.__table__.insert(), {
+            'reseller_id': root_id, 'tour_in': lo + 1,
+            'tour_out': lo + 1 + (2 * size - 1) * step, 'depth': depth
+        })
+    else:
+        # Order-preserving map of the old labels keeps the subtree nesting intact
+        labels = sorted(label for m in members for label in (m.tour_in, m.tour_out))
+        position = {label: lo + 1 + index * step for index, label in enumerate(labels)}
+        connection.execute(ResellerTour.__table__.update().where(
+            ResellerTour.__table__.c.reseller_id == db.bindparam('member_id')
+        ), [
+            {'member_id': m.reseller_id, 'tour_in': position[m.tour_in],
+             'tour_out': position[m.tour_out], 'depth': depth + m.depth - current.depth}
+            for m in members
+        ])
+    
+    _bump_tour_version()
+
+@event.listens_for(Reseller, 'after_insert')
+def _tour_after_insert(mapper, connection, target):
+    """Give a new reseller tour labels under its sponsor"""
+    _place_tour_subtree(connection, target.id, target.sponsor_id)
+
+@event.listens_for(Reseller, 'after_update')
+def _tour_after_update(mapper, connection, target):
+    """Move the reseller's tour range when its sponsor changes"""
+    if db.inspect(target).attrs.sponsor_id.history.has_changes():
+        _place_tour_subtree(connection, target.id, target.sponsor_id)
+
+@event.listens_for(Reseller, 'after_update')
+def _group_sales_after_update(mapper, connection, target):
+    """Drop maintained group sales when a reseller moves or changes level"""
+    attrs = db.inspect(target).attrs
+    if attrs.sponsor_id.history.has_changes() or attrs.level.history.has_changes():
+        # Every seeded month holds the reseller's tier and its uplines' active counts
+        connection.execute(GroupSalesAggregate.__table__.delete())
+
+def rebuild_reseller_tour():
+    """Renumber the Euler tour from the sponsor links (backfill/repair)"""
+    _relabel_tour(db.session.connection())
+    db.session.commit()
+
+class DataVersion(db.Model):
+    """Change counters read endpoints derive ETag/Last-Modified from"""
+    __tablename__ = 'data_versions'
+    
+    scope = db.Column(db.String(20), primary_key=True)  # 'global', 'hierarchy' or 'YYYY-MM'
+    version = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+# Every write bumps 'global'; structure and rule changes also bump 'hierarchy'
+GLOBAL_SCOPE = 'global'
+HIERARCHY_SCOPE = 'hierarchy'
+_HIERARCHY_MODELS = (Organization, Reseller, CommissionRule)
+_MONTH_MODELS = (MonthlySales, SalesTransaction, CommissionCalculation, MonthlySummary)
+
+def _dialect_insert(dialect_name: str):
+    """insert() construct with ON CONFLICT support for the database in use"""
+    if dialect_name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert
+
+def bump_data_versions(connection, scopes):
+    """Increment the given scopes (and 'global') inside the current transaction"""
+    now = datetime.utcnow()
+    table = DataVersion.__table__
+    insert = _dialect_insert(connection.dialect.name)
+    # One upsert per scope, so concurrent first writes to a new scope cannot collide
+    for scope in sorted(set(scopes) | {GLOBAL_SCOPE}):
+        statement = insert(table).values(scope=scope, version=1, updated_at=now)
+        connection.execute(statement.on_conflict_do_update(
+            index_elements=['scope'],
+            set_={'version': table.c.version + 1, 'updated_at': statement.excluded.updated_at}
+        ))
+
+def bump_month_versions(*months):
+    """For bulk writes that bypass the unit of work (e.g. month close)"""
+    bump_data_versions(db.session.connection(), months)
+
+def get_data_versions(scopes):
+    """{scope: (version, updated_at)} for the scopes that have been written"""
+    rows = db.session.query(
+        DataVersion.scope, DataVersion.version, DataVersion.updated_at
+    ).filter(DataVersion.scope.in_(list(scopes))).all()
+    return {scope: (version, updated_at) for scope, version, updated_at in rows}
+
+@event.listens_for(Session, 'before_flush')
+def _collect_changed_scopes(session, flush_context, instances):
+    scopes = session.info.setdefault('changed_scopes', set())
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if obj in session.dirty and not session.is_modified(obj):
+            continue
+        if isinstance(obj, _HIERARCHY_MODELS):
+            scopes.add(HIERARCHY_SCOPE)
+        elif isinstance(obj, _MONTH_MODELS) and obj.month:
+            scopes.add(obj.month)
+        elif isinstance(obj, _MONTH_MODELS):
+            scopes.add(GLOBAL_SCOPE)
+
+@event.listens_for(Session, 'after_flush')
+def _bump_changed_scopes(session, flush_context):
+    scopes = session.info.pop('changed_scopes', None)
+    if scopes:
+        bump_data_versions(session.connection(), scopes)
+
+# Resellers per subtree version UPDATE; keeps IN lists under driver parameter limits
+SUBTREE_VERSION_BATCH_SIZE = 1000
+
+def bump_subtree_versions(connection, reseller_ids):
+    """Increment the subtree version of each reseller and all of its uplines"""
+    reseller_ids = sorted({reseller_id for reseller_id in reseller_ids if reseller_id is not None})
+    # Raw SQL so Reseller.updated_at is left alone
+    statement = text(
+        "UPDATE resellers SET subtree_version = subtree_version + 1 "
+        "WHERE id IN (SELECT ancestor_id FROM reseller_closure WHERE descendant_id IN :ids)"
+    ).bindparams(db.bindparam('ids', expanding=True))
+    for start in range(0, len(reseller_ids), SUBTREE_VERSION_BATCH_SIZE):
+        connection.execute(statement, {'ids': reseller_ids[start:start + SUBTREE_VERSION_BATCH_SIZE]})
+
+def bump_reseller_versions(*reseller_ids):
+    """For sales writes that bypass the unit of work (bulk import, upserts)"""
+    bump_subtree_versions(db.session.connection(), reseller_ids)
+
+def _history_values(obj, name):
+    """Current value of an attribute plus any value it had before this flush"""
+    history = inspect(obj).attrs[name].history
+    return [getattr(obj, name)] + list(history.deleted)
+
+@event.listens_for(Session, 'before_flush')
+def _collect_changed_subtrees(session, flush_context, instances):
+    changed = session.info.setdefault('changed_subtrees', set())
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if obj in session.dirty and not session.is_modified(obj):
+            continue
+        if isinstance(obj, (MonthlySales, SalesTransaction)):
+            changed.update(_history_values(obj, 'reseller_id'))
+        elif isinstance(obj, Reseller):
+            # New and removed resellers change their sponsor's subtree; a move
+            # changes the old sponsor's chain as well as the new one
+            if obj in session.dirty:
+                changed.add(obj.id)
+            changed.update(_history_values(obj, 'sponsor_id'))
+
+@event.listens_for(Session, 'after_flush')
+def _bump_changed_subtrees(session, flush_context):
+    # Runs after the closure listeners, so moved subtrees bump their new uplines
+    changed = session.info.pop('changed_subtrees', None)
+    if changed:
+        bump_subtree_versions(session.connection(), changed)
+
+def monthly_sales_upsert(row: Dict = None, additive: bool = False,
+                         expected_version: int = None, update_only: bool = False,
+                         ledger: bool = False):
+    """
+    Single round-trip write of a MonthlySales row, RETURNING
+    (id, gppis, previous_gppis, version)
+    Without a row the statement takes executemany parameters (plain upserts only).
+    Writes set the manually entered part of the amounts; ledger=True instead
+    adds confirmed ledger sales on top of it (always additive).
+    additive adds the values to the stored ones instead of replacing them.
+    expected_version None upserts; 0 only creates; N only updates version N.
+    update_only never creates (e.g. for negative deltas).
+    No row comes back when the version check or a negative result rejects it.
+    """
+    table = MonthlySales.__table__
+    returning = (table.c.id, table.c.gppis, table.c.previous_gppis, table.c.version)
+    
+    def amounts(new):
+        values = {}
+        for column, manual in MANUAL_SALES_COLUMNS.items():
+            if ledger:
+                values[column] = table.c[column] + new[column]
+            elif additive:
+                values[column] = table.c[column] + new[column]
+                values[manual] = table.c[manual] + new[column]
+            else:
+                # Replace the manual part; the ledger's part stays
+                values[column] = table.c[column] - table.c[manual] + new[column]
+                values[manual] = new[column]
+        return values
+    
+    if expected_version or update_only:
+        # Must already exist (at that version, when one is given)
+        where = [table.c.reseller_id == row['reseller_id'], table.c.month == row['month']]
+        if expected_version:
+            where.append(table.c.version == expected_version)
+        if ledger:
+            where.append(table.c.gppis - table.c.manual_gppis + row['gppis'] >= 0)
+        elif additive:
+            where.append(table.c.manual_gppis + row['gppis'] >= 0)
+        return table.update().where(*where).values(
+            previous_gppis=table.c.gppis,
+            version=table.c.version + 1,
+            updated_at=row.get('updated_at', datetime.utcnow()),
+            **amounts(row)
+        ).returning(*returning)
+    
+    statement = _dialect_insert(db.engine.dialect.name)(table)
+    if row is not None:
+        statement = statement.values(**row)
+    
+    if expected_version == 0:
+        return statement.on_conflict_do_nothing(
+            index_elements=['reseller_id', 'month']
+        ).returning(*returning)
+    
+    excluded = statement.excluded
+    return statement.on_conflict_do_update(
+        index_elements=['reseller_id', 'month'],
+        set_=dict(
+            previous_gppis=table.c.gppis,
+            version=table.c.version + 1,
+            updated_at=excluded.updated_at,
+            **amounts(excluded)
+        )
+    ).returning(*returning)
+
+# =============================================
+# Sales ledger rollup: MonthlySales follows SalesTransaction
+# =============================================
+
+@event.listens_for(SalesTransaction, 'before_insert')
+@event.listens_for(SalesTransaction, 'before_update')
+def _sale_month(mapper, connection, target):
+    target.transacted_at = target.transacted_at or datetime.utcnow()
+    target.month = target.transacted_at.strftime('%Y-%m')
+
+@event.listens_for(SalesTransaction, 'after_insert')
+def _rollup_after_insert(mapper, connection, target):
+    _apply_sale_rollup(connection, target, [_sale_contribution(target, _current_value)])
+
+@event.listens_for(SalesTransaction, 'after_update')
+def _rollup_after_update(mapper, connection, target):
+    _apply_sale_rollup(connection, target, [
+        _sale_contribution(target, _previous_value, sign=-1),
+        _sale_contribution(target, _current_value)
+    ])
+
+@event.listens_for(SalesTransaction, 'after_delete')
+def _rollup_after_delete(mapper, connection, target):
+    _apply_sale_rollup(connection, target, [_sale_contribution(target, _previous_value, sign=-1)])
+
+def _current_value(target, name):
+    return getattr(target, name)
+
+def _previous_value(target, name):
+    history = inspect(target).attrs[name].history
+    return history.deleted[0] if history.deleted else getattr(target, name)
+
+def _sale_contribution(target, value, sign: int = 1):
+    """((reseller_id, month), column, signed amount) a sale adds to the rollup, or None"""
+    if value(target, 'status') != 'confirmed':
+        return None
+    key = (value(target, 'reseller_id'), value(target, 'month'))
+    amount = sign * Decimal(str(value(target, 'amount')))
+    return key, SALES_PRODUCT_COLUMNS[value(target, 'product')], amount
+
+def _apply_sale_rollup(connection, target, contributions):
+    """
+    Add the sales' net effect to their MonthlySales rows without rescanning the month
+    (old, new) GPPIS per changed row is left in session.info['sales_rollup']
+    so the caller can push the change up to the uplines
+    """
+    deltas = {}
+    for contribution in contributions:
+        if contribution:
+            key, column, amount = contribution
+            columns = deltas.setdefault(key, dict.fromkeys(SALES_PRODUCT_COLUMNS.values(), Decimal('0')))
+            columns[column] += amount
+    
+    changes = object_session(target).info.setdefault('sales_rollup', {})
+    now = datetime.utcnow()
+    for (reseller_id, month), columns in deltas.items():
+        gppis = sum(columns.values())
+        if not any(columns.values()):
+            continue
+        
+        row = connection.execute(monthly_sales_upsert(dict(
+            columns, reseller_id=reseller_id, month=month, gppis=gppis,
+            previous_gppis=Decimal('0'), version=1, created_at=now, updated_at=now,
+            **dict.fromkeys(MANUAL_SALES_COLUMNS.values(), Decimal('0'))
+        ), additive=True, update_only=gppis < 0, ledger=True)).first()
+        if row is None:
+            raise ValueError(f"Sales for reseller {reseller_id} in {month} would go negative")
+        
+        _, new_gppis, old_gppis, _ = row
+        first_old = changes[(reseller_id, month)][0] if (reseller_id, month) in changes else old_gppis
+        changes[(reseller_id, month)] = (first_old, new_gppis)
+
+def _add_missing_columns():
+    """
+    ALTER existing tables to add columns introduced after they were created
+    Returns the (table, column) names that were added
+    """
+    added = set()
+    inspector = db.inspect(db.engine)
+    with db.engine.begin() as connection:
+        for table in db.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing:
+                    spec = CreateColumn(column).compile(dialect=db.engine.dialect)
+                    connection.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {spec}"))
+                    added.add((table.name, column.name))
+    return added
+
+def _backfill_manual_sales():
+    """
+    Split MonthlySales rows written before manual_* existed: the manual part
+    is whatever confirmed ledger sales do not account for (never below zero)
+    """
+    table = MonthlySales.__table__
+    sales = SalesTransaction.__table__
+    
+    def manual_part(column, *criteria):
+        ledger = db.select(db.func.coalesce(db.func.sum(sales.c.amount), 0)).where(
+            sales.c.reseller_id == table.c.reseller_id,
+            sales.c.month == table.c.month,
+            sales.c.status == 'confirmed',
+            *criteria
+        ).scalar_subquery()
+        remainder = db.func.coalesce(table.c[column], 0) - ledger
+        return db.case((remainder > 0, remainder), else_=0)
+    
+    values = {MANUAL_SALES_COLUMNS['gppis']: manual_part('gppis')}
+    for product, column in SALES_PRODUCT_COLUMNS.items():
+        values[MANUAL_SALES_COLUMNS[column]] = manual_part(column, sales.c.product == product)
+    with db.engine.begin() as connection:
+        connection.execute(table.update().values(**values))
+
 def init_db():
     """Initialize the database with all tables"""
     db.create_all()
+    
+    # create_all skips tables that already exist, so add any newer columns and indexes
+    added = _add_missing_columns()
+    if ('monthly_sales', 'manual_gppis') in added:
+        _backfill_manual_sales()
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(db.engine, checkfirst=True)
+    
+    # Backfill the closure table for databases created before it existed
+    if Reseller.query.first() and not ResellerClosure.query.first():
+        rebuild_reseller_closure()
+    if Reseller.query.first() and not ResellerTour.query.first():
+        rebuild_reseller_tour()
+    
     print("✅ Database tables created successfully!")
 
 def drop_db():
@@ -0,0 +1,79 @@
+# app/services/commission_cache.py - Versioned Commission Result Cache
+
+from config import Config
+from collections import OrderedDict
+from typing import Dict, Hashable, Optional, Tuple
+import copy
+import threading
+
+class CommissionResultCache:
+    """
+    Bounded LRU of calculate_monthly_commissions results.
+    Entries are keyed by (reseller, month) and stamped with the
+    (subtree_version, rules_version) they were computed at. Writes never
+    touch the cache: they bump versions, so an entry whose stamp no longer
+    matches is a miss and is replaced by the next result.
+    """
+    
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: OrderedDict = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.evictions = 0
+    
+    def get(self, key: Hashable, version: Tuple) -> Optional[Dict]:
+        """A copy of the cached result computed at `version`, else None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != version:
+                self.misses += 1
+                if entry is not None:
+                    self.stale += 1
+                    del self._entries[key]
+                return None
+            
+            self._entries.move_to_end(key)
+            self.hits += 1
+            result = entry[1]
+        return copy.deepcopy(result)
+    
+    def put(self, key: Hashable, version: Tuple, result: Dict):
+        """Store a result, evicting the least recently used entries past the bound"""
+        if self.max_entries <= 0:
+            return
+        
+        result = copy.deepcopy(result)
+        with self._lock:
+            self._entries[key] = (version, result)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+    
+    def clear(self):
+        """Drop every entry; counters keep running"""
+        with self._lock:
+            self._entries.clear()
+    
+    def stats(self) -> Dict:
+        """Counters for sizing the cache"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'stale': self.stale,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else None
+            }
+
+_cache = CommissionResultCache(Config.COMMISSION_CACHE_SIZE)
+
+def get_commission_cache() -> CommissionResultCache:
+    """The process-wide commission result cache"""
+    return _cache
@@ -2,13 +2,26 @@
 
 from database.models import (
     db, Reseller, MonthlySales, CommissionCalculation, 
-    MonthlySummary, CommissionRule
+    MonthlySummary, CommissionRule, GroupSalesAggregate,
+    DEFAULT_PRODUCT_SPLIT, SALES_PRODUCT_COLUMNS
+)
+from services.commission_cache import get_commission_cache
+from services.hierarchy_index import get_hierarchy_index
+from services.month_data import activate_month_data, deactivate_month_data, month_data_scope, previous_month
+from services.rule_plan import (
+    CompiledRulePlan, current_rule_plan, get_rule_plan, rules_version, use_rule_plan
 )
-from config import Config
 from decimal import Decimal
-from typing import Dict, List, Optional, Tuple
+from typing import Dict, Iterator, List, Optional, Tuple
+from collections import namedtuple
 import logging
 
+# Lightweight, detached view of a reseller used by whole-network passes
+NetworkNode = namedtuple('NetworkNode', ['id', 'sponsor_id', 'level', 'full_name'])
+
+# Outright discount products, in MonthlySales (premium, standard, basic) column order
+PRODUCTS = tuple(SALES_PRODUCT_COLUMNS)
+
 class CommissionEngine:
     """
     Core commission calculation engine for SUNX MLM system
@@ -16,14 +29,82 @@ class CommissionEngine:
     """
     
     def __init__(self):
-        self.rules = Config.COMMISSION_RULES
+        self.hierarchy_index = get_hierarchy_index()
+        self.result_cache = get_commission_cache()
         self.logger = logging.getLogger(__name__)
     
+    @property
+    def plan(self) -> CompiledRulePlan:
+        """Rule plan of the month being calculated, else today's"""
+        return current_rule_plan() or get_rule_plan()
+    
+    @property
+    def rules(self) -> Dict:
+        return self.plan.rules
+    
     def calculate_monthly_commissions(self, reseller_id: int, month: str) -> Dict:
         """
         Calculate all commissions for a specific reseller and month
-        Returns complete commission breakdown
+        Returns complete commission breakdown, from the result cache while
+        nothing in the reseller's subtree and no rule has changed
+        """
+        # Versions are read before any data, so a result is never stamped newer than its inputs
+        version = (self._subtree_version(reseller_id), rules_version())
+        key = (reseller_id, month)
+        if version[0] is not None:
+            cached = self.result_cache.get(key, version)
+            if cached is not None:
+                return cached
+        
+        # Sales loaded earlier in this request may predate the version just read
+        token = activate_month_data()
+        try:
+            with use_rule_plan(get_rule_plan(month)):
+                result = self._calculate_monthly_commissions(reseller_id, month)
+        finally:
+            deactivate_month_data(token)
+        
+        self.result_cache.put(key, version, result)
+        return result
+    
+    def _subtree_version(self, reseller_id: int) -> Optional[int]:
+        """Current subtree version of a reseller, None if it does not exist"""
+        return db.session.query(Reseller.subtree_version).filter_by(id=reseller_id).scalar()
+    
+    def verify_month(self, month: str, limit: int = 20) -> Dict:
+        """
+        Diff every reseller's served result (result cache, maintained group
+        sales) against a recompute from sales alone. Nothing is written; an
+        empty mismatch list means the cache and the aggregate are current
         """
+        reseller_ids = [reseller_id for (reseller_id,) in db.session.query(Reseller.id).order_by(Reseller.id)]
+        served = {reseller_id: self.calculate_monthly_commissions(reseller_id, month)
+                  for reseller_id in reseller_ids}
+        
+        # Recompute with the month's aggregate rows gone, then put them back
+        savepoint = db.session.begin_nested()
+        token = activate_month_data()
+        try:
+            GroupSalesAggregate.query.filter_by(month=month).delete(synchronize_session=False)
+            with use_rule_plan(get_rule_plan(month)):
+                recomputed = {reseller_id: self._calculate_monthly_commissions(reseller_id, month)
+                              for reseller_id in reseller_ids}
+        finally:
+            deactivate_month_data(token)
+            savepoint.rollback()
+        
+        mismatches = [
+            {'reseller_id': reseller_id, 'served': served[reseller_id], 'recomputed': recomputed[reseller_id]}
+            for reseller_id in reseller_ids if served[reseller_id] != recomputed[reseller_id]
+        ]
+        return {
+            'month': month,
+            'resellers': len(reseller_ids),
+            'mismatched': len(mismatches),
+            'mismatches': mismatches[:limit]
+        }
+    
+    def _calculate_monthly_commissions(self, reseller_id: int, month: str) -> Dict:
         reseller = Reseller.query.get(reseller_id)
         if not reseller:
             raise ValueError(f"Reseller {reseller_id} not found")
@@ -33,23 +114,14 @@ class CommissionEngine:
         ggpis = self._calculate_ggpis(reseller_id, month)
         
         # Initialize commission structure
-        commissions = {
-            'reseller_id': reseller_id,
-            'reseller_name': reseller.full_name,
-            'level': reseller.level,
-            'month': month,
-            'gppis': float(gppis),
-            'ggpis': float(ggpis),
-            'active_status': self._check_active_status(reseller, gppis),
-            'commissions': [],
-            'total_commission': 0,
-            'qualifications': {}
-        }
+        commissions = self._new_commission_record(reseller, month, gppis, ggpis)
         
         try:
             # Calculate different commission types based on level
             if reseller.level in ['BP', 'IBO', 'BD']:
-                self._calculate_outright_discount(commissions, reseller, month, gppis)
+                self._calculate_outright_discount(
+                    commissions, reseller, month, gppis, self._get_product_sales(reseller_id, month)
+                )
             
             if reseller.level == 'IBO':
                 self._calculate_group_override(commissions, reseller, month, ggpis)
@@ -78,60 +150,401 @@ class CommissionEngine:
         
         return commissions
     
-    def _get_gppis(self, reseller_id: int, month: str) -> Decimal:
-        """Get Gross Personal Paid-In Sales for reseller and month"""
-        sales = MonthlySales.query.filter_by(
-            reseller_id=reseller_id,
-            month=month
-        ).first()
-        return sales.gppis if sales else Decimal('0')
+    def _new_commission_record(self, reseller, month: str, gppis: Decimal,
+                               ggpis: Decimal) -> Dict:
+        """Initialize the commission structure returned for one reseller"""
+        return {
+            'reseller_id': reseller.id,
+            'reseller_name': reseller.full_name,
+            'level': reseller.level,
+            'month': month,
+            'gppis': float(gppis),
+            'ggpis': float(ggpis),
+            'active_status': self._check_active_status(reseller, gppis),
+            'commissions': [],
+            'total_commission': 0,
+            'qualifications': {}
+        }
     
-    def _calculate_ggpis(self, reseller_id: int, month: str, visited=None) -> Decimal:
+    def close_month(self, month: str) -> Dict[int, Dict]:
         """
-        Calculate Gross Group Paid-In Sales (including all downline sales)
-        Uses recursive traversal with cycle detection
+        Calculate commissions for every reseller in a single pass
+        Loads the sponsor graph and the month's sales once, then walks the
+        tree bottom-up. Each result matches calculate_monthly_commissions.
         """
-        if visited is None:
-            visited = set()
+        with month_data_scope(), use_rule_plan(get_rule_plan(month)):
+            return self._close_month(month)
+    
+    def _close_month(self, month: str) -> Dict[int, Dict]:
+        nodes, children = self._load_network()
+        prev_month = self._get_previous_month(month)
+        sales = self._load_sales([month, prev_month])
+        
+        order, unreachable = self._post_order(nodes, children)
+        results = self._close_nodes(
+            order, nodes, children, month,
+            sales.get(month, {}), sales.get(prev_month, {})
+        )
         
-        if reseller_id in visited:
-            return Decimal('0')  # Prevent infinite loops
+        # Resellers caught in a sponsor cycle are never reached from a root
+        for reseller_id in unreachable:
+            self.logger.warning(f"Reseller {reseller_id} is not reachable from a root sponsor")
+            results[reseller_id] = self.calculate_monthly_commissions(reseller_id, month)
         
-        visited.add(reseller_id)
+        total = sum(r['total_commission'] for r in results.values())
+        self.logger.info(f"Closed {month} for {len(results)} resellers: ₱{total:,.2f}")
         
-        # Start with personal sales
-        personal_sales = self._get_gppis(reseller_id, month)
-        group_sales = personal_sales
+        return results
+    
+    def calculate_batch(self, reseller_ids: Optional[List[int]],
+                        months: List[str]) -> Iterator[Tuple[str, Dict[int, Dict]]]:
+        """
+        Commissions for many resellers over a range of months
+        The network and every month's sales are loaded once, and the union of
+        the requested subtrees is aggregated once per month, so a subtree
+        shared by several requested resellers is only summed once.
+        None means every reseller. Yields (month, {reseller_id: result}).
+        """
+        with month_data_scope():
+            nodes, children = self._load_network()
+            if reseller_ids is None:
+                order, unreachable = self._post_order(nodes, children)
+                targets = order
+            else:
+                missing = [reseller_id for reseller_id in reseller_ids if reseller_id not in nodes]
+                if missing:
+                    raise ValueError(f"Resellers not found: {', '.join(map(str, missing))}")
+                order, unreachable = self._subtree_order(reseller_ids, nodes, children)
+                requested = set(reseller_ids)
+                targets = [reseller_id for reseller_id in order if reseller_id in requested]
+            
+            sales = self._load_sales(sorted(set(months) | {self._get_previous_month(m) for m in months}))
+            
+            for month in months:
+                with use_rule_plan(get_rule_plan(month)):
+                    month_sales = sales[month]
+                    ggpis, active_ibos = self._aggregate_nodes(order, nodes, children, month_sales)
+                    results = self._close_aggregated(
+                        targets, nodes, children, month, month_sales,
+                        sales[self._get_previous_month(month)], ggpis, active_ibos
+                    )
+                    
+                    for reseller_id in unreachable:
+                        self.logger.warning(f"Reseller {reseller_id} is not reachable from a root sponsor")
+                        results[reseller_id] = self.calculate_monthly_commissions(reseller_id, month)
+                
+                yield month, results
+    
+    def _subtree_order(self, reseller_ids: List[int], nodes: Dict[int, NetworkNode],
+                       children: Dict[int, List[int]]) -> Tuple[List[int], List[int]]:
+        """
+        Post-order over the union of the given resellers' subtrees
+        Resellers caught in a sponsor cycle are returned separately
+        """
+        reachable = []
+        unreachable = []
+        for reseller_id in reseller_ids:
+            seen = set()
+            current = reseller_id
+            while current in nodes and current not in seen:
+                seen.add(current)
+                current = nodes[current].sponsor_id
+            (unreachable if current in nodes else reachable).append(reseller_id)
+        
+        order, _ = self._walk_post_order(reachable, children)
+        return order, unreachable
+    
+    def _load_network(self) -> Tuple[Dict[int, NetworkNode], Dict[int, List[int]]]:
+        """Load every reseller and build the children index in one query"""
+        rows = db.session.query(
+            Reseller.id,
+            Reseller.sponsor_id,
+            Reseller.level,
+            Reseller.first_name,
+            Reseller.last_name
+        ).order_by(Reseller.id).all()
+        
+        nodes = {}
+        children = {}
+        for reseller_id, sponsor_id, level, first_name, last_name in rows:
+            nodes[reseller_id] = NetworkNode(
+                reseller_id, sponsor_id, level, f"{first_name} {last_name}"
+            )
+            children.setdefault(sponsor_id, []).append(reseller_id)
         
-        # Add all downline sales recursively
-        downlines = Reseller.query.filter_by(sponsor_id=reseller_id).all()
-        for downline in downlines:
-            downline_ggpis = self._calculate_ggpis(downline.id, month, visited.copy())
-            group_sales += downline_ggpis
+        return nodes, children
+    
+    def _load_product_sales(self, month: str) -> Dict[int, Tuple[Decimal, Decimal, Decimal]]:
+        """(premium, standard, basic) sales for every reseller that records them"""
+        with month_data_scope() as month_data:
+            return month_data.product_sales(month)
+    
+    def _load_sales(self, months: List[str]) -> Dict[str, Dict[int, Decimal]]:
+        """Load GPPIS for the given months in one query, keyed by month and reseller"""
+        with month_data_scope() as month_data:
+            month_data.load(months, with_previous=False)
+            return {month: month_data.sales(month) for month in months}
+    
+    def _post_order(self, nodes: Dict[int, NetworkNode],
+                    children: Dict[int, List[int]]) -> Tuple[List[int], List[int]]:
+        """
+        Order resellers so every downline comes before its sponsor
+        Returns the order plus any resellers not reachable from a root
+        """
+        roots = [n.id for n in nodes.values() if n.sponsor_id not in nodes]
+        order, visited = self._walk_post_order(roots, children)
         
-        return group_sales
+        unreachable = [reseller_id for reseller_id in nodes if reseller_id not in visited]
+        return order, unreachable
+    
+    def _walk_post_order(self, roots: List[int],
+                         children: Dict[int, List[int]]) -> Tuple[List[int], set]:
+        """Iterative post-order below the given roots; returns the order and the visited set"""
+        order = []
+        visited = set()
+        
+        for root in roots:
+            stack = [(root, False)]
+            while stack:
+                reseller_id, expanded = stack.pop()
+                if expanded:
+                    order.append(reseller_id)
+                    continue
+                if reseller_id in visited:
+                    continue
+                visited.add(reseller_id)
+                stack.append((reseller_id, True))
+                for child_id in reversed(children.get(reseller_id, [])):
+                    stack.append((child_id, False))
+        
+        return order, visited
+    
+    def _close_nodes(self, order: List[int], nodes: Dict[int, NetworkNode],
+                     children: Dict[int, List[int]], month: str,
+                     sales: Dict[int, Decimal], prev_sales: Dict[int, Decimal],
+                     seeded: Dict[int, Tuple[Decimal, int]] = None,
+                     product_sales: Dict[int, Tuple[Decimal, Decimal, Decimal]] = None
+                     ) -> Dict[int, Dict]:
+        """
+        Compute group sales and commissions for nodes given in post-order
+        seeded holds (ggpis, active_ibos) for children aggregated elsewhere
+        """
+        ggpis, active_ibos = self._aggregate_nodes(order, nodes, children, sales, seeded)
+        return self._close_aggregated(
+            order, nodes, children, month, sales, prev_sales, ggpis, active_ibos, product_sales
+        )
+    
+    def _close_aggregated(self, order: List[int], nodes: Dict[int, NetworkNode],
+                          children: Dict[int, List[int]], month: str,
+                          sales: Dict[int, Decimal], prev_sales: Dict[int, Decimal],
+                          ggpis: Dict[int, Decimal], active_ibos: Dict[int, int],
+                          product_sales: Dict[int, Tuple[Decimal, Decimal, Decimal]] = None
+                          ) -> Dict[int, Dict]:
+        """
+        Build commissions for nodes whose group aggregates are already known
+        product_sales defaults to the month's recorded product columns
+        """
+        zero = Decimal('0')
+        if product_sales is None:
+            product_sales = self._load_product_sales(month)
+        
+        results = {}
+        for reseller_id in order:
+            results[reseller_id] = self._close_node(
+                nodes[reseller_id], month,
+                sales.get(reseller_id, zero), ggpis[reseller_id], active_ibos[reseller_id],
+                [nodes[child_id] for child_id in children.get(reseller_id, [])],
+                sales, ggpis, prev_sales.get(reseller_id, zero), product_sales.get(reseller_id)
+            )
+        
+        return results
+    
+    def _aggregate_nodes(self, order: List[int], nodes: Dict[int, NetworkNode],
+                         children: Dict[int, List[int]],
+                         sales: Dict[int, Decimal],
+                         seeded: Dict[int, Tuple[Decimal, int]] = None
+                         ) -> Tuple[Dict[int, Decimal], Dict[int, int]]:
+        """
+        Accumulate GGPIS and active IBO counts bottom-up
+        Returns GGPIS per node and the number of active IBOs strictly below it
+        """
+        zero = Decimal('0')
+        ibo_threshold = self.plan.active_thresholds['IBO_BD_CALC']
+        
+        ggpis = {}
+        active_ibos = {}
+        for reseller_id, (group_sales, active_below) in (seeded or {}).items():
+            ggpis[reseller_id] = group_sales
+            active_ibos[reseller_id] = active_below
+        
+        for reseller_id in order:
+            group_sales = sales.get(reseller_id, zero)
+            active_below = 0
+            for child_id in children.get(reseller_id, []):
+                group_sales += ggpis[child_id]
+                active_below += active_ibos[child_id]
+                if (nodes[child_id].level == 'IBO' and
+                        sales.get(child_id, zero) >= ibo_threshold):
+                    active_below += 1
+            
+            ggpis[reseller_id] = group_sales
+            active_ibos[reseller_id] = active_below
+        
+        return ggpis, active_ibos
+    
+    def aggregate_month(self, month: str) -> Dict[int, Dict]:
+        """
+        Compute per-reseller group aggregates for a month in a single pass
+        Used to seed the maintained GGPIS aggregate
+        """
+        with use_rule_plan(get_rule_plan(month)):
+            return self._aggregate_month(month)
+    
+    def _aggregate_month(self, month: str) -> Dict[int, Dict]:
+        zero = Decimal('0')
+        bp_threshold = self.plan.active_thresholds['BP']
+        nodes, children = self._load_network()
+        sales = self._load_sales([month])[month]
+        
+        order, unreachable = self._post_order(nodes, children)
+        ggpis, active_ibos = self._aggregate_nodes(order, nodes, children, sales)
+        
+        for reseller_id in unreachable:
+            ggpis[reseller_id] = self._calculate_ggpis(reseller_id, month)
+            active_ibos[reseller_id] = self._count_active_ibos_downline(reseller_id, month)
+        
+        aggregates = {}
+        for reseller_id, node in nodes.items():
+            gppis = sales.get(reseller_id, zero)
+            active_bps = sum(
+                1 for child_id in children.get(reseller_id, [])
+                if nodes[child_id].level == 'BP' and sales.get(child_id, zero) >= bp_threshold
+            )
+            aggregates[reseller_id] = {
+                'reseller_id': reseller_id,
+                'month': month,
+                'gppis': gppis,
+                'ggpis': ggpis[reseller_id],
+                'active_status': self._check_active_status(node, gppis),
+                'active_bps': active_bps,
+                'active_ibos_downline': active_ibos[reseller_id],
+                'qualified_tier': self.qualified_tier(
+                    node.level, gppis, ggpis[reseller_id], active_bps, active_ibos[reseller_id]
+                )
+            }
+        
+        return aggregates
+    
+    def qualified_tier(self, level: str, gppis: Decimal, ggpis: Decimal,
+                       active_bps: int, active_ibos: int) -> Optional[str]:
+        """Tier name an IBO (group override) or BD (service fee) qualifies for"""
+        plan = self.plan
+        
+        if level == 'IBO':
+            tier = plan.group_override_tier(active_bps, ggpis)
+            return tier.name if tier else None
+        
+        if level == 'BD':
+            if (gppis < plan.active_thresholds['BD'] or
+                    active_ibos < plan.service_fee_min_active_ibos):
+                return None
+            tier = plan.service_fee_tier(ggpis)
+            return tier.name if tier else None
+        
+        return None
+    
+    def _close_node(self, node: NetworkNode, month: str, gppis: Decimal, ggpis: Decimal,
+                    active_ibos_count: int, direct: List[NetworkNode],
+                    sales: Dict[int, Decimal], group_sales: Dict[int, Decimal],
+                    prev_gppis: Decimal, products: Tuple[Decimal, Decimal, Decimal] = None) -> Dict:
+        """Build one reseller's commissions from already aggregated figures"""
+        zero = Decimal('0')
+        commissions = self._new_commission_record(node, month, gppis, ggpis)
+        
+        if node.level in ['BP', 'IBO', 'BD']:
+            self._calculate_outright_discount(commissions, node, month, gppis, products)
+        
+        if node.level == 'IBO':
+            bp_threshold = self.plan.active_thresholds['BP']
+            active_bp_count = sum(
+                1 for child in direct
+                if child.level == 'BP' and sales.get(child.id, zero) >= bp_threshold
+            )
+            self._apply_group_override(commissions, active_bp_count, ggpis)
+            self._apply_lifetime_incentive(commissions, gppis, [
+                (child.full_name, sales.get(child.id, zero))
+                for child in direct if child.level == 'IBO'
+            ])
+        
+        if node.level == 'BD':
+            self._apply_bd_service_fee(commissions, gppis, ggpis, active_ibos_count)
+            self._apply_bd_override(commissions, ggpis, [
+                (child.full_name, group_sales[child.id])
+                for child in direct if child.level == 'BD'
+            ])
+        
+        if node.level == 'BP':
+            commissions['qualifications']['promotion'] = self._promotion_eligibility(
+                gppis, prev_gppis
+            )
+        
+        commissions['total_commission'] = sum(
+            c['amount'] for c in commissions['commissions']
+        )
+        
+        return commissions
+    
+    def _get_gppis(self, reseller_id: int, month: str) -> Decimal:
+        """Get Gross Personal Paid-In Sales for reseller and month"""
+        with month_data_scope() as month_data:
+            return month_data.gppis(reseller_id, month)
+    
+    def _get_product_sales(self, reseller_id: int, month: str) -> Optional[Tuple[Decimal, Decimal, Decimal]]:
+        """Recorded (premium, standard, basic) sales, or None when only a total exists"""
+        return self._load_product_sales(month).get(reseller_id)
+    
+    def _calculate_ggpis(self, reseller_id: int, month: str) -> Decimal:
+        """
+        Calculate Gross Group Paid-In Sales (including all downline sales)
+        Served from the maintained aggregate, else one closure-table sum
+        """
+        aggregate = self._get_group_aggregate(reseller_id, month)
+        if aggregate:
+            return aggregate.ggpis
+        
+        return self.hierarchy_index.group_sales(reseller_id, month)
+    
+    def _get_group_aggregate(self, reseller_id: int, month: str) -> Optional[GroupSalesAggregate]:
+        """Get the maintained group sales row, if the month has been seeded"""
+        return GroupSalesAggregate.query.filter_by(
+            reseller_id=reseller_id,
+            month=month
+        ).first()
     
     def _check_active_status(self, reseller: Reseller, gppis: Decimal) -> bool:
         """Check if reseller meets active status requirements"""
-        threshold = self.rules['active_thresholds'][reseller.level]
+        threshold = self.plan.active_thresholds[reseller.level]
         return gppis >= threshold
     
     def _calculate_outright_discount(self, commissions: Dict, reseller: Reseller, 
-                                   month: str, gppis: Decimal):
-        """Calculate outright discount commissions based on product sales"""
+                                   month: str, gppis: Decimal,
+                                   products: Tuple[Decimal, Decimal, Decimal] = None):
+        """
+        Calculate outright discount commissions based on product sales
+        products are the month's recorded (premium, standard, basic) sales;
+        months that only record a total fall back to the default split
+        """
         if gppis <= 0:
             return
         
-        # For demo purposes, assume even distribution across product categories
-        sales_breakdown = {
-            'SUNX-PREMIUM': gppis * Decimal('0.4'),
-            'SUNX-STANDARD': gppis * Decimal('0.4'),
-            'SUNX-BASIC': gppis * Decimal('0.2')
-        }
+        if products is None:
+            products = tuple(gppis * share for share in DEFAULT_PRODUCT_SPLIT)
+        sales_breakdown = dict(zip(PRODUCTS, products))
         
+        rates = self.plan.outright_rates[reseller.level]
         for product, sales_amount in sales_breakdown.items():
             if sales_amount > 0:
-                rate = Decimal(str(self.rules['outright_discount'][product][reseller.level]))
+                rate = rates[product]
                 commission_amount = sales_amount * rate
                 
                 commissions['commissions'].append({
@@ -155,41 +568,31 @@ class CommissionEngine:
         active_bps = []
         for bp in direct_bps:
             bp_gppis = self._get_gppis(bp.id, month)
-            if bp_gppis >= self.rules['active_thresholds']['BP']:
+            if bp_gppis >= self.plan.active_thresholds['BP']:
                 active_bps.append(bp)
         
-        active_bp_count = len(active_bps)
-        
-        # Determine override tier
-        override_tier = None
-        rules = self.rules['group_override']
-        
-        if (active_bp_count >= rules['diamond']['min_active_bps'] and 
-            ggpis >= rules['diamond']['min_ggpis']):
-            override_tier = 'diamond'
-        elif (active_bp_count >= rules['gold']['min_active_bps'] and 
-              ggpis >= rules['gold']['min_ggpis']):
-            override_tier = 'gold'
-        elif (active_bp_count >= rules['silver']['min_active_bps'] and 
-              ggpis >= rules['silver']['min_ggpis']):
-            override_tier = 'silver'
+        self._apply_group_override(commissions, len(active_bps), ggpis)
+    
+    def _apply_group_override(self, commissions: Dict, active_bp_count: int, ggpis: Decimal):
+        """Add the group override line for a known active BP count"""
+        override_tier = self.plan.group_override_tier(active_bp_count, ggpis)
         
         if override_tier:
-            rate = Decimal(str(rules[override_tier]['rate']))
+            rate = override_tier.rate
             commission_amount = ggpis * rate
             
             commissions['commissions'].append({
                 'type': 'group_override',
-                'tier': override_tier.title(),
+                'tier': override_tier.name,
                 'active_bps': active_bp_count,
                 'base_amount': float(ggpis),
                 'rate': float(rate),
                 'amount': float(commission_amount),
-                'description': f'Group Override - {override_tier.title()} ({active_bp_count} Active BPs)'
+                'description': f'Group Override - {override_tier.name} ({active_bp_count} Active BPs)'
             })
             
             commissions['qualifications']['group_override'] = {
-                'tier': override_tier.title(),
+                'tier': override_tier.name,
                 'active_bps': active_bp_count,
                 'rate': float(rate)
             }
@@ -197,32 +600,44 @@ class CommissionEngine:
     def _calculate_lifetime_incentive(self, commissions: Dict, reseller: Reseller,
                                     month: str, gppis: Decimal):
         """Calculate lifetime incentive for IBO on downline IBOs"""
-        min_gppis = self.rules['lifetime_incentive']['min_gppis']
+        min_gppis = self.plan.lifetime_min_gppis
         
         # Check if reseller qualifies (≥₱10K GPPIS)
         if gppis < min_gppis:
             return
         
-        # Find direct IBO downlines with ≥₱10K GPPIS
+        # Find direct IBO downlines
         direct_ibos = Reseller.query.filter_by(
             sponsor_id=reseller.id,
             level='IBO'
         ).all()
         
+        self._apply_lifetime_incentive(commissions, gppis, [
+            (ibo.full_name, self._get_gppis(ibo.id, month)) for ibo in direct_ibos
+        ])
+    
+    def _apply_lifetime_incentive(self, commissions: Dict, gppis: Decimal,
+                                  direct_ibos: List[Tuple[str, Decimal]]):
+        """Add the lifetime incentive line from (name, gppis) of direct IBOs"""
+        min_gppis = self.plan.lifetime_min_gppis
+        
+        if gppis < min_gppis:
+            return
+        
         qualifying_ibos = []
         total_qualifying_gppis = Decimal('0')
         
-        for ibo in direct_ibos:
-            ibo_gppis = self._get_gppis(ibo.id, month)
+        # Only direct IBOs with ≥₱10K GPPIS qualify
+        for name, ibo_gppis in direct_ibos:
             if ibo_gppis >= min_gppis:
                 qualifying_ibos.append({
-                    'name': ibo.full_name,
+                    'name': name,
                     'gppis': float(ibo_gppis)
                 })
                 total_qualifying_gppis += ibo_gppis
         
         if qualifying_ibos:
-            rate = Decimal(str(self.rules['lifetime_incentive']['rate']))
+            rate = self.plan.lifetime_rate
             commission_amount = total_qualifying_gppis * rate
             
             commissions['commissions'].append({
@@ -239,31 +654,31 @@ class CommissionEngine:
                                 month: str, gppis: Decimal, ggpis: Decimal):
         """Calculate BD service fee commissions"""
         # Check if BD is active (≥₱10K GPPIS)
-        if gppis < self.rules['active_thresholds']['BD']:
+        if gppis < self.plan.active_thresholds['BD']:
             return
         
         # Count active IBOs in entire downline
         active_ibos_count = self._count_active_ibos_downline(reseller.id, month)
         
-        # Check minimum IBO requirement
-        if active_ibos_count < self.rules['bd_service_fee']['min_active_ibos']:
+        self._apply_bd_service_fee(commissions, gppis, ggpis, active_ibos_count)
+    
+    def _apply_bd_service_fee(self, commissions: Dict, gppis: Decimal, ggpis: Decimal,
+                              active_ibos_count: int):
+        """Add the BD service fee line for a known active IBO count"""
+        plan = self.plan
+        if gppis < plan.active_thresholds['BD']:
             return
         
-        # Determine service fee tier
-        rules = self.rules['bd_service_fee']
-        tier = None
+        # Check minimum IBO requirement
+        if active_ibos_count < plan.service_fee_min_active_ibos:
+            return
         
-        if ggpis >= rules['tier3']['min_ggpis']:
-            tier = 'tier3'
-        elif ggpis >= rules['tier2']['min_ggpis']:
-            tier = 'tier2'
-        elif ggpis >= rules['tier1']['min_ggpis']:
-            tier = 'tier1'
+        tier = plan.service_fee_tier(ggpis)
         
         if tier:
-            rate = Decimal(str(rules[tier]['rate']))
+            rate = tier.rate
             commission_amount = ggpis * rate
-            tier_name = f"Tier {tier[-1]}"
+            tier_name = tier.name
             
             commissions['commissions'].append({
                 'type': 'bd_service_fee',
@@ -281,35 +696,20 @@ class CommissionEngine:
                 'rate': float(rate)
             }
     
-    def _count_active_ibos_downline(self, reseller_id: int, month: str, visited=None) -> int:
+    def _count_active_ibos_downline(self, reseller_id: int, month: str) -> int:
         """Count all active IBOs in entire downline tree"""
-        if visited is None:
-            visited = set()
-        
-        if reseller_id in visited:
-            return 0
-        
-        visited.add(reseller_id)
+        aggregate = self._get_group_aggregate(reseller_id, month)
+        if aggregate:
+            return aggregate.active_ibos_downline
         
-        count = 0
-        downlines = Reseller.query.filter_by(sponsor_id=reseller_id).all()
-        
-        for downline in downlines:
-            # Count if this downline is an active IBO
-            if downline.level == 'IBO':
-                downline_gppis = self._get_gppis(downline.id, month)
-                if downline_gppis >= self.rules['active_thresholds']['IBO_BD_CALC']:
-                    count += 1
-            
-            # Recursively count in their downlines
-            count += self._count_active_ibos_downline(downline.id, month, visited.copy())
-        
-        return count
+        return self.hierarchy_index.count_active_in_downline(
+            reseller_id, month, 'IBO', self.plan.active_thresholds['IBO_BD_CALC']
+        )
     
     def _calculate_bd_override(self, commissions: Dict, reseller: Reseller,
                              month: str, ggpis: Decimal):
         """Calculate BD override on direct BD downlines"""
-        min_ggpis = self.rules['bd_override']['min_ggpis_both']
+        min_ggpis = self.plan.bd_override_min_ggpis
         
         # Check if this BD qualifies (≥₱1M GGPIS)
         if ggpis < min_ggpis:
@@ -321,20 +721,31 @@ class CommissionEngine:
             level='BD'
         ).all()
         
+        self._apply_bd_override(commissions, ggpis, [
+            (bd.full_name, self._calculate_ggpis(bd.id, month)) for bd in direct_bds
+        ])
+    
+    def _apply_bd_override(self, commissions: Dict, ggpis: Decimal,
+                           direct_bds: List[Tuple[str, Decimal]]):
+        """Add the BD override line from (name, ggpis) of direct BDs"""
+        min_ggpis = self.plan.bd_override_min_ggpis
+        
+        if ggpis < min_ggpis:
+            return
+        
         qualifying_bds = []
         total_qualifying_ggpis = Decimal('0')
         
-        for bd in direct_bds:
-            bd_ggpis = self._calculate_ggpis(bd.id, month)
+        for name, bd_ggpis in direct_bds:
             if bd_ggpis >= min_ggpis:
                 qualifying_bds.append({
-                    'name': bd.full_name,
+                    'name': name,
                     'ggpis': float(bd_ggpis)
                 })
                 total_qualifying_ggpis += bd_ggpis
         
         if qualifying_bds:
-            rate = Decimal(str(self.rules['bd_override']['rate']))
+            rate = self.plan.bd_override_rate
             commission_amount = total_qualifying_ggpis * rate
             
             commissions['commissions'].append({
@@ -350,13 +761,17 @@ class CommissionEngine:
     def _check_promotion_eligibility(self, reseller: Reseller, month: str, 
                                    gppis: Decimal) -> Dict:
         """Check BP promotion eligibility to IBO"""
-        threshold = self.rules['promotion']['bp_to_ibo_threshold']
-        progress = (gppis / threshold) * 100
-        
         # Get previous month GPPIS for 2-month requirement
         prev_month = self._get_previous_month(month)
         prev_gppis = self._get_gppis(reseller.id, prev_month)
         
+        return self._promotion_eligibility(gppis, prev_gppis)
+    
+    def _promotion_eligibility(self, gppis: Decimal, prev_gppis: Decimal) -> Dict:
+        """Build the BP promotion eligibility block from two months of GPPIS"""
+        threshold = self.plan.promotion_threshold
+        progress = (gppis / threshold) * 100
+        
         consecutive_qualified = (gppis >= threshold and prev_gppis >= threshold)
         
         return {
@@ -371,14 +786,14 @@ class CommissionEngine:
     
     def _get_previous_month(self, month: str) -> str:
         """Get previous month string (YYYY-MM format)"""
-        year, month_num = map(int, month.split('-'))
-        if month_num == 1:
-            return f"{year-1}-12"
-        else:
-            return f"{year}-{month_num-1:02d}"
+        return previous_month(month)
     
     def get_promotion_candidates(self, month: str) -> List[Dict]:
         """Get all BP promotion candidates for a specific month"""
+        with month_data_scope(), use_rule_plan(get_rule_plan(month)):
+            return self._get_promotion_candidates(month)
+    
+    def _get_promotion_candidates(self, month: str) -> List[Dict]:
         bps = Reseller.query.filter_by(level='BP').all()
         candidates = []
         
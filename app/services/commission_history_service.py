@@ -0,0 +1,68 @@
+# app/services/commission_history_service.py - Commission History Breakdown
+
+from database.models import db, CommissionCalculation
+from config import Config
+from typing import Dict, List
+import logging
+
+class CommissionHistoryService:
+    """
+    Month x commission type totals for one or many resellers.
+    One grouped query over the (reseller_id, month, commission_type) index
+    returns every reseller's most recent months at once.
+    """
+    
+    def __init__(self):
+        self.logger = logging.getLogger(__name__)
+    
+    def get_history(self, reseller_id: int, months: int = 6) -> List[Dict]:
+        """Most recent `months` months with commissions, newest first"""
+        return self.get_breakdown([reseller_id], months).get(reseller_id, [])
+    
+    def get_breakdown(self, reseller_ids: List[int], months: int = 6) -> Dict[int, List[Dict]]:
+        """
+        {reseller_id: [{month, total_commission, breakdown}, ...]} in one query
+        Each reseller gets its own `months` most recent months with commissions
+        """
+        months = max(1, min(months, Config.COMMISSION_HISTORY_MAX_MONTHS))
+        if not reseller_ids:
+            return {}
+        
+        totals = db.session.query(
+            CommissionCalculation.reseller_id,
+            CommissionCalculation.month,
+            CommissionCalculation.commission_type,
+            db.func.sum(CommissionCalculation.commission_amount).label('amount')
+        ).filter(
+            CommissionCalculation.reseller_id.in_(reseller_ids)
+        ).group_by(
+            CommissionCalculation.reseller_id,
+            CommissionCalculation.month,
+            CommissionCalculation.commission_type
+        ).subquery()
+        
+        ranked = db.session.query(
+            totals,
+            db.func.dense_rank().over(
+                partition_by=totals.c.reseller_id,
+                order_by=totals.c.month.desc()
+            ).label('month_rank')
+        ).subquery()
+        
+        rows = db.session.query(
+            ranked.c.reseller_id, ranked.c.month, ranked.c.commission_type, ranked.c.amount
+        ).filter(
+            ranked.c.month_rank <= months
+        ).order_by(
+            ranked.c.reseller_id, ranked.c.month.desc(), ranked.c.commission_type
+        ).all()
+        
+        history = {reseller_id: [] for reseller_id in reseller_ids}
+        for reseller_id, month, commission_type, amount in rows:
+            entries = history[reseller_id]
+            if not entries or entries[-1]['month'] != month:
+                entries.append({'month': month, 'total_commission': 0.0, 'breakdown': {}})
+            entries[-1]['breakdown'][commission_type] = float(amount)
+            entries[-1]['total_commission'] += float(amount)
+        
+        return history
@@ -0,0 +1,359 @@
+# app/services/commission_quote_service.py - Point-of-Sale Commission Quotes
+
+from database.models import (
+    db, Reseller, MonthlySales, GroupSalesAggregate, SALES_PRODUCT_COLUMNS, product_breakdown
+)
+from services.commission_engine import PRODUCTS
+from services.group_sales_service import GroupSalesService, threshold_step
+from services.hierarchy_index import get_hierarchy_index
+from services.rule_plan import CompiledRulePlan, get_rule_plan
+from services.sales_ledger_service import parse_sale_amount
+from datetime import datetime
+from decimal import Decimal
+from sqlalchemy import case
+from typing import Dict, List, Optional, Tuple
+import logging
+
+class CommissionQuoteService:
+    """
+    Previews how one sale would change the seller's and every upline's
+    commissions. Only the upline chain is read: the month's maintained
+    group sales rows, the seller's product columns and, for uplines whose
+    lifetime incentive or BD override can move, one grouped sum over their
+    direct downlines. Nothing is written; a month without group sales rows
+    yet is read through the hierarchy index instead.
+    """
+    
+    def __init__(self, group_sales_service: GroupSalesService = None):
+        self.group_sales_service = group_sales_service or GroupSalesService()
+        self.hierarchy_index = get_hierarchy_index()
+        self.logger = logging.getLogger(__name__)
+    
+    def quote(self, reseller_id: int, product: str, amount, month: Optional[str] = None) -> Dict:
+        """
+        Commission changes if reseller_id booked a confirmed `amount` of `product`
+        in `month` (default: this month). Lists the seller and each upline whose
+        commissions change, with before/after amounts per commission type.
+        """
+        if product not in SALES_PRODUCT_COLUMNS:
+            raise ValueError(f"Unknown product {product!r}")
+        amount = parse_sale_amount(amount)
+        month = month or datetime.utcnow().strftime('%Y-%m')
+        try:
+            datetime.strptime(month, '%Y-%m')
+        except ValueError:
+            raise ValueError(f"Invalid month {month!r}")
+        
+        chain = self.hierarchy_index.get_upline(reseller_id)
+        if not chain:
+            raise ValueError(f"Reseller {reseller_id} not found")
+        
+        plan = get_rule_plan(month)
+        seeded = self.group_sales_service.is_seeded(month)
+        
+        rows = self._load_chain(chain, month)
+        if not seeded:
+            self._read_group_sales(rows, chain, month, plan)
+        gppis = rows[reseller_id]['gppis']
+        products = rows[reseller_id]['products']
+        
+        # What the sale changes: the seller's GPPIS, everyone's GGPIS and the active counts
+        thresholds = plan.active_thresholds
+        level = chain[0][1]
+        new_gppis = gppis + amount
+        ibo_step = threshold_step(level, 'IBO', thresholds['IBO_BD_CALC'], gppis, new_gppis)
+        bp_step = threshold_step(level, 'BP', thresholds['BP'], gppis, new_gppis)
+        
+        after = {}
+        for depth, (node_id, _) in enumerate(chain):
+            row = rows[node_id]
+            after[node_id] = dict(
+                row,
+                gppis=new_gppis if depth == 0 else row['gppis'],
+                ggpis=row['ggpis'] + amount,
+                active_ibos=row['active_ibos'] + (ibo_step if depth > 0 else 0),
+                active_bps=row['active_bps'] + (bp_step if depth == 1 else 0)
+            )
+        
+        # The ledger books the sale into its product column as well as GPPIS
+        new_products = list(products)
+        new_products[PRODUCTS.index(product)] += amount
+        
+        # A direct downline on the chain moves its sponsor's lifetime / BD override base
+        base_change = {}
+        for depth, (node_id, node_level) in enumerate(chain[1:], start=1):
+            child_id, child_level = chain[depth - 1]
+            if node_level == 'IBO' and child_level == 'IBO' and depth == 1:
+                base_change[node_id] = (self._lifetime_share(plan, new_gppis) -
+                                        self._lifetime_share(plan, gppis))
+            elif node_level == 'BD' and child_level == 'BD':
+                base_change[node_id] = (self._bd_override_share(plan, after[child_id]['ggpis']) -
+                                        self._bd_override_share(plan, rows[child_id]['ggpis']))
+        
+        # The full base is only needed where the line can move: the reseller
+        # starts or stops qualifying, or a qualifying reseller's base changes
+        sponsors = []
+        for node_id, node_level in chain:
+            if node_level == 'IBO':
+                qualifies = [row['gppis'] >= plan.lifetime_min_gppis for row in (rows[node_id], after[node_id])]
+            elif node_level == 'BD':
+                qualifies = [row['ggpis'] >= plan.bd_override_min_ggpis for row in (rows[node_id], after[node_id])]
+            else:
+                continue
+            if qualifies[0] != qualifies[1] or (qualifies[1] and base_change.get(node_id)):
+                sponsors.append(node_id)
+        if seeded:
+            direct_sums = self._load_direct_sums(sponsors, month, plan)
+        else:
+            direct_sums = self._read_direct_sums(sponsors, month, plan)
+        
+        resellers = []
+        for depth, (node_id, node_level) in enumerate(chain):
+            lines = []
+            
+            if depth == 0 and node_level in ['BP', 'IBO', 'BD']:
+                lines.append(self._line(
+                    'outright_discount',
+                    self._outright_discount(plan, node_level, gppis, products),
+                    self._outright_discount(plan, node_level, new_gppis, tuple(new_products))
+                ))
+            
+            if node_level == 'IBO':
+                lines.append(self._tier_line(
+                    'group_override',
+                    self._group_override(plan, rows[node_id]),
+                    self._group_override(plan, after[node_id])
+                ))
+                lifetime_base = direct_sums.get(node_id, {}).get('lifetime', Decimal('0'))
+                lines.append(self._line(
+                    'lifetime_incentive',
+                    self._lifetime_incentive(plan, rows[node_id]['gppis'], lifetime_base),
+                    self._lifetime_incentive(plan, after[node_id]['gppis'],
+                                             lifetime_base + base_change.get(node_id, 0))
+                ))
+            
+            if node_level == 'BD':
+                lines.append(self._tier_line(
+                    'bd_service_fee',
+                    self._bd_service_fee(plan, rows[node_id]),
+                    self._bd_service_fee(plan, after[node_id])
+                ))
+                override_base = direct_sums.get(node_id, {}).get('bd_override', Decimal('0'))
+                lines.append(self._line(
+                    'bd_override',
+                    self._bd_override(plan, rows[node_id]['ggpis'], override_base),
+                    self._bd_override(plan, after[node_id]['ggpis'],
+                                      override_base + base_change.get(node_id, 0))
+                ))
+            
+            changed = [line for line in lines if line['delta'] or line.get('tier_changed')]
+            if depth > 0 and not changed:
+                continue
+            
+            resellers.append({
+                'reseller_id': node_id,
+                'reseller_name': rows[node_id]['name'],
+                'level': node_level,
+                'depth': depth,
+                'gppis': {'before': float(rows[node_id]['gppis']), 'after': float(after[node_id]['gppis'])},
+                'ggpis': {'before': float(rows[node_id]['ggpis']), 'after': float(after[node_id]['ggpis'])},
+                'commissions': changed,
+                'delta': sum(line['delta'] for line in changed)
+            })
+        
+        return {
+            'reseller_id': reseller_id,
+            'month': month,
+            'product': product,
+            'amount': float(amount),
+            'resellers': resellers,
+            'total_delta': sum(entry['delta'] for entry in resellers)
+        }
+    
+    def _load_chain(self, chain: List[Tuple[int, str]], month: str) -> Dict[int, Dict]:
+        """
+        Name, personal sales and maintained group sales figures for every
+        reseller on the chain, in one query
+        """
+        zero = Decimal('0')
+        rows = db.session.query(
+            Reseller.id,
+            Reseller.first_name,
+            Reseller.last_name,
+            MonthlySales.gppis,
+            MonthlySales.premium_sales,
+            MonthlySales.standard_sales,
+            MonthlySales.basic_sales,
+            GroupSalesAggregate.ggpis,
+            GroupSalesAggregate.active_bps,
+            GroupSalesAggregate.active_ibos_downline
+        ).outerjoin(
+            MonthlySales,
+            (MonthlySales.reseller_id == Reseller.id) & (MonthlySales.month == month)
+        ).outerjoin(
+            GroupSalesAggregate,
+            (GroupSalesAggregate.reseller_id == Reseller.id) & (GroupSalesAggregate.month == month)
+        ).filter(Reseller.id.in_([node_id for node_id, _ in chain])).all()
+        
+        # Resellers who joined after the month was seeded have no aggregate row yet
+        chain_rows = {}
+        for (node_id, first_name, last_name, gppis, premium, standard, basic,
+             ggpis, active_bps, active_ibos) in rows:
+            chain_rows[node_id] = {
+                'name': f"{first_name} {last_name}",
+                'gppis': gppis or zero,
+                'products': (premium or zero, standard or zero, basic or zero),
+                'ggpis': ggpis or zero,
+                'active_bps': active_bps or 0,
+                'active_ibos': active_ibos or 0
+            }
+        return chain_rows
+    
+    def _load_direct_sums(self, sponsors: List[int], month: str,
+                          plan: CompiledRulePlan) -> Dict[int, Dict]:
+        """
+        Qualifying direct-downline bases for lifetime incentive and BD override,
+        before the sale, for the given sponsors in one grouped query
+        """
+        if not sponsors:
+            return {}
+        
+        zero = Decimal('0')
+        lifetime = db.func.sum(case(
+            ((Reseller.level == 'IBO') & (GroupSalesAggregate.gppis >= plan.lifetime_min_gppis),
+             GroupSalesAggregate.gppis),
+            else_=0
+        ))
+        bd_override = db.func.sum(case(
+            ((Reseller.level == 'BD') & (GroupSalesAggregate.ggpis >= plan.bd_override_min_ggpis),
+             GroupSalesAggregate.ggpis),
+            else_=0
+        ))
+        sums = db.session.query(Reseller.sponsor_id, lifetime, bd_override).join(
+            GroupSalesAggregate,
+            (GroupSalesAggregate.reseller_id == Reseller.id) & (GroupSalesAggregate.month == month)
+        ).filter(
+            Reseller.sponsor_id.in_(sponsors),
+            Reseller.level.in_(['IBO', 'BD'])
+        ).group_by(Reseller.sponsor_id).all()
+        
+        return {
+            sponsor_id: {
+                'lifetime': Decimal(str(lifetime_sum or zero)),
+                'bd_override': Decimal(str(override_sum or zero))
+            }
+            for sponsor_id, lifetime_sum, override_sum in sums
+        }
+    
+    def _read_group_sales(self, rows: Dict[int, Dict], chain: List[Tuple[int, str]],
+                          month: str, plan: CompiledRulePlan):
+        """
+        Fill GGPIS and active counts for a month that has not been seeded,
+        from hierarchy index reads as CommissionEngine does, without seeding it
+        """
+        chain_ids = [node_id for node_id, _ in chain]
+        active_bps = dict(db.session.query(Reseller.sponsor_id, db.func.count(Reseller.id)).join(
+            MonthlySales,
+            (MonthlySales.reseller_id == Reseller.id) & (MonthlySales.month == month)
+        ).filter(
+            Reseller.sponsor_id.in_(chain_ids),
+            Reseller.level == 'BP',
+            MonthlySales.gppis >= plan.active_thresholds['BP']
+        ).group_by(Reseller.sponsor_id).all())
+        
+        for node_id, node_level in chain:
+            row = rows[node_id]
+            row['ggpis'] = self.hierarchy_index.group_sales(node_id, month)
+            row['active_bps'] = active_bps.get(node_id, 0)
+            if node_level == 'BD':
+                row['active_ibos'] = self.hierarchy_index.count_active_in_downline(
+                    node_id, month, 'IBO', plan.active_thresholds['IBO_BD_CALC']
+                )
+    
+    def _read_direct_sums(self, sponsors: List[int], month: str,
+                          plan: CompiledRulePlan) -> Dict[int, Dict]:
+        """_load_direct_sums for a month that has not been seeded"""
+        if not sponsors:
+            return {}
+        
+        zero = Decimal('0')
+        direct = db.session.query(
+            Reseller.id, Reseller.sponsor_id, Reseller.level, MonthlySales.gppis
+        ).outerjoin(
+            MonthlySales,
+            (MonthlySales.reseller_id == Reseller.id) & (MonthlySales.month == month)
+        ).filter(
+            Reseller.sponsor_id.in_(sponsors),
+            Reseller.level.in_(['IBO', 'BD'])
+        ).all()
+        
+        sums = {sponsor_id: {'lifetime': zero, 'bd_override': zero} for sponsor_id in sponsors}
+        for child_id, sponsor_id, level, gppis in direct:
+            if level == 'IBO':
+                sums[sponsor_id]['lifetime'] += self._lifetime_share(plan, gppis or zero)
+            else:
+                ggpis = self.hierarchy_index.group_sales(child_id, month)
+                sums[sponsor_id]['bd_override'] += self._bd_override_share(plan, ggpis)
+        return sums
+    
+    def _outright_discount(self, plan: CompiledRulePlan, level: str, gppis: Decimal,
+                           products: Tuple[Decimal, ...]) -> Decimal:
+        """Mirrors CommissionEngine._calculate_outright_discount, on the stored products"""
+        if gppis <= 0:
+            return Decimal('0')
+        products = product_breakdown(gppis, products)
+        
+        rates = plan.outright_rates[level]
+        return sum(
+            (sales_amount * rates[product] for product, sales_amount in zip(PRODUCTS, products)
+             if sales_amount > 0),
+            Decimal('0')
+        )
+    
+    def _group_override(self, plan: CompiledRulePlan, row: Dict) -> Tuple[Decimal, Optional[str]]:
+        tier = plan.group_override_tier(row['active_bps'], row['ggpis'])
+        if not tier:
+            return Decimal('0'), None
+        return row['ggpis'] * tier.rate, tier.name
+    
+    def _bd_service_fee(self, plan: CompiledRulePlan, row: Dict) -> Tuple[Decimal, Optional[str]]:
+        if (row['gppis'] < plan.active_thresholds['BD'] or
+                row['active_ibos'] < plan.service_fee_min_active_ibos):
+            return Decimal('0'), None
+        tier = plan.service_fee_tier(row['ggpis'])
+        if not tier:
+            return Decimal('0'), None
+        return row['ggpis'] * tier.rate, tier.name
+    
+    def _lifetime_share(self, plan: CompiledRulePlan, gppis: Decimal) -> Decimal:
+        """What a direct IBO adds to its sponsor's lifetime incentive base"""
+        return gppis if gppis >= plan.lifetime_min_gppis else Decimal('0')
+    
+    def _lifetime_incentive(self, plan: CompiledRulePlan, gppis: Decimal, base: Decimal) -> Decimal:
+        if gppis < plan.lifetime_min_gppis:
+            return Decimal('0')
+        return base * plan.lifetime_rate
+    
+    def _bd_override_share(self, plan: CompiledRulePlan, ggpis: Decimal) -> Decimal:
+        """What a direct BD adds to its sponsor's BD override base"""
+        return ggpis if ggpis >= plan.bd_override_min_ggpis else Decimal('0')
+    
+    def _bd_override(self, plan: CompiledRulePlan, ggpis: Decimal, base: Decimal) -> Decimal:
+        if ggpis < plan.bd_override_min_ggpis:
+            return Decimal('0')
+        return base * plan.bd_override_rate
+    
+    def _line(self, commission_type: str, before: Decimal, after: Decimal) -> Dict:
+        return {
+            'type': commission_type,
+            'before': float(before),
+            'after': float(after),
+            'delta': float(after - before)
+        }
+    
+    def _tier_line(self, commission_type: str, before: Tuple[Decimal, Optional[str]],
+                   after: Tuple[Decimal, Optional[str]]) -> Dict:
+        line = self._line(commission_type, before[0], after[0])
+        line['tier'] = {'before': before[1], 'after': after[1]}
+        line['tier_changed'] = before[1] != after[1]
+        return line
@@ -0,0 +1,234 @@
+# app/services/group_sales_service.py - Maintained Group Sales (GGPIS) Aggregate
+
+from database.models import db, GroupSalesAggregate
+from services.commission_engine import CommissionEngine
+from services.hierarchy_index import get_hierarchy_index
+from services.rule_plan import get_rule_plan, use_rule_plan
+from config import Config
+from collections import defaultdict
+from decimal import Decimal
+from sqlalchemy import bindparam
+from typing import Dict, List, Optional, Tuple
+import logging
+
+def threshold_step(level: str, counted_level: str, threshold: Decimal,
+                   old_gppis: Decimal, new_gppis: Decimal) -> int:
+    """+1/-1 when a reseller of counted_level crosses the threshold, else 0"""
+    if level != counted_level:
+        return 0
+    return int(new_gppis >= threshold) - int(old_gppis >= threshold)
+
+class GroupSalesService:
+    """
+    Keeps GroupSalesAggregate rows in step with sales changes.
+    A change of +Δ for one reseller is pushed up the upline chain only,
+    so sales entry cost depends on tree depth rather than network size.
+    """
+    
+    def __init__(self, commission_engine: CommissionEngine = None):
+        self.commission_engine = commission_engine or CommissionEngine()
+        self.hierarchy_index = get_hierarchy_index()
+        self.logger = logging.getLogger(__name__)
+    
+    def is_seeded(self, month: str) -> bool:
+        """Check whether the aggregate has been built for a month"""
+        return db.session.query(
+            GroupSalesAggregate.query.filter_by(month=month).exists()
+        ).scalar()
+    
+    def get_aggregate(self, reseller_id: int, month: str) -> Optional[GroupSalesAggregate]:
+        """Get the maintained aggregate row for a reseller and month"""
+        return GroupSalesAggregate.query.filter_by(
+            reseller_id=reseller_id,
+            month=month
+        ).first()
+    
+    def seed_month(self, month: str) -> int:
+        """
+        (Re)build the aggregate for a month from current sales in one pass
+        Does not commit; runs inside the caller's transaction
+        """
+        aggregates = self.commission_engine.aggregate_month(month)
+        
+        GroupSalesAggregate.query.filter_by(month=month).delete(synchronize_session=False)
+        if aggregates:
+            db.session.execute(db.insert(GroupSalesAggregate), list(aggregates.values()))
+        
+        self.logger.info(f"Seeded group sales for {month}: {len(aggregates)} resellers")
+        return len(aggregates)
+    
+    def invalidate(self, months: List[str] = None):
+        """Drop maintained aggregates so they are rebuilt on next use"""
+        query = GroupSalesAggregate.query
+        if months:
+            query = query.filter(GroupSalesAggregate.month.in_(months))
+        query.delete(synchronize_session=False)
+    
+    def apply_sales_change(self, reseller_id: int, month: str,
+                           old_gppis: Decimal, new_gppis: Decimal):
+        """
+        Propagate a GPPIS change to the reseller and each of its uplines
+        Must run after the MonthlySales change is flushed; does not commit
+        """
+        if not self.is_seeded(month):
+            # Seeding reads the already flushed sales, so nothing is left to propagate
+            self.seed_month(month)
+            return
+        
+        chain = self.hierarchy_index.get_upline(reseller_id)
+        chain_ids = [node_id for node_id, _ in chain]
+        ancestor_ids = chain_ids[1:]
+        level = chain[0][1]
+        delta = new_gppis - old_gppis
+        thresholds = get_rule_plan(month).active_thresholds
+        
+        self._ensure_rows(chain_ids, month)
+        chain_rows = GroupSalesAggregate.query.filter(
+            GroupSalesAggregate.month == month,
+            GroupSalesAggregate.reseller_id.in_(chain_ids)
+        )
+        
+        if delta:
+            chain_rows.update(
+                {GroupSalesAggregate.ggpis: GroupSalesAggregate.ggpis + delta},
+                synchronize_session=False
+            )
+        
+        # Active IBO counts change for every upline when an IBO crosses the BD threshold
+        ibo_step = threshold_step(level, 'IBO', thresholds['IBO_BD_CALC'], old_gppis, new_gppis)
+        if ibo_step and ancestor_ids:
+            GroupSalesAggregate.query.filter(
+                GroupSalesAggregate.month == month,
+                GroupSalesAggregate.reseller_id.in_(ancestor_ids)
+            ).update(
+                {GroupSalesAggregate.active_ibos_downline:
+                     GroupSalesAggregate.active_ibos_downline + ibo_step},
+                synchronize_session=False
+            )
+        
+        # Only the direct sponsor's active BP count depends on a BP's status
+        bp_step = threshold_step(level, 'BP', thresholds['BP'], old_gppis, new_gppis)
+        if bp_step and ancestor_ids:
+            GroupSalesAggregate.query.filter_by(
+                month=month,
+                reseller_id=ancestor_ids[0]
+            ).update(
+                {GroupSalesAggregate.active_bps: GroupSalesAggregate.active_bps + bp_step},
+                synchronize_session=False
+            )
+        
+        GroupSalesAggregate.query.filter_by(month=month, reseller_id=reseller_id).update(
+            {GroupSalesAggregate.gppis: new_gppis},
+            synchronize_session=False
+        )
+        
+        # Re-evaluate status and tier for the affected chain only
+        levels = dict(chain)
+        with use_rule_plan(get_rule_plan(month)):
+            for row in chain_rows.populate_existing().all():
+                row_level = levels[row.reseller_id]
+                row.active_status = row.gppis >= thresholds[row_level]
+                row.qualified_tier = self.commission_engine.qualified_tier(
+                    row_level, row.gppis, row.ggpis, row.active_bps, row.active_ibos_downline
+                )
+    
+    def apply_sales_changes(self, month: str, changes: Dict[int, Tuple[Decimal, Decimal]]):
+        """
+        Propagate many GPPIS changes ({reseller_id: (old, new)}) at once
+        Deltas are summed per upline first, so a sponsor shared by many
+        changed resellers is updated once. Large batches reseed the month in
+        one pass instead. Must run after the sales are flushed; does not commit.
+        """
+        if not changes:
+            return
+        if not self.is_seeded(month) or len(changes) >= Config.GROUP_SALES_RESEED_MIN_CHANGES:
+            self.seed_month(month)
+            return
+        
+        thresholds = get_rule_plan(month).active_thresholds
+        levels = {}
+        ggpis_delta = defaultdict(Decimal)
+        ibo_delta = defaultdict(int)
+        bp_delta = defaultdict(int)
+        
+        for reseller_id, (old_gppis, new_gppis) in changes.items():
+            chain = self.hierarchy_index.get_upline(reseller_id)
+            levels.update(chain)
+            level = chain[0][1]
+            ancestor_ids = [node_id for node_id, _ in chain[1:]]
+            
+            delta = new_gppis - old_gppis
+            for node_id, _ in chain:
+                ggpis_delta[node_id] += delta
+            
+            ibo_step = threshold_step(level, 'IBO', thresholds['IBO_BD_CALC'], old_gppis, new_gppis)
+            if ibo_step:
+                for node_id in ancestor_ids:
+                    ibo_delta[node_id] += ibo_step
+            
+            bp_step = threshold_step(level, 'BP', thresholds['BP'], old_gppis, new_gppis)
+            if bp_step and ancestor_ids:
+                bp_delta[ancestor_ids[0]] += bp_step
+        
+        affected = list(levels)
+        self._ensure_rows(affected, month)
+        
+        table = GroupSalesAggregate.__table__
+        increments = [
+            {'row_month': month, 'row_reseller_id': node_id, 'ggpis_delta': ggpis_delta[node_id],
+             'ibo_delta': ibo_delta[node_id], 'bp_delta': bp_delta[node_id]}
+            for node_id in affected
+            if ggpis_delta[node_id] or ibo_delta[node_id] or bp_delta[node_id]
+        ]
+        if increments:
+            db.session.execute(
+                table.update().where(
+                    table.c.month == bindparam('row_month'),
+                    table.c.reseller_id == bindparam('row_reseller_id')
+                ).values(
+                    ggpis=table.c.ggpis + bindparam('ggpis_delta'),
+                    active_ibos_downline=table.c.active_ibos_downline + bindparam('ibo_delta'),
+                    active_bps=table.c.active_bps + bindparam('bp_delta')
+                ),
+                increments
+            )
+        db.session.execute(
+            table.update().where(
+                table.c.month == bindparam('row_month'),
+                table.c.reseller_id == bindparam('row_reseller_id')
+            ).values(gppis=bindparam('new_gppis')),
+            [{'row_month': month, 'row_reseller_id': reseller_id, 'new_gppis': new_gppis}
+             for reseller_id, (_, new_gppis) in changes.items()]
+        )
+        
+        # Re-evaluate status and tier for the affected chains only
+        with use_rule_plan(get_rule_plan(month)):
+            for start in range(0, len(affected), Config.MONTH_CLOSE_BATCH_SIZE):
+                rows = GroupSalesAggregate.query.filter(
+                    GroupSalesAggregate.month == month,
+                    GroupSalesAggregate.reseller_id.in_(affected[start:start + Config.MONTH_CLOSE_BATCH_SIZE])
+                ).populate_existing().all()
+                for row in rows:
+                    row_level = levels[row.reseller_id]
+                    row.active_status = row.gppis >= thresholds[row_level]
+                    row.qualified_tier = self.commission_engine.qualified_tier(
+                        row_level, row.gppis, row.ggpis, row.active_bps, row.active_ibos_downline
+                    )
+    
+    def _ensure_rows(self, reseller_ids: List[int], month: str):
+        """Create zeroed rows for resellers that joined after the month was seeded"""
+        existing = {
+            reseller_id for (reseller_id,) in db.session.query(
+                GroupSalesAggregate.reseller_id
+            ).filter(
+                GroupSalesAggregate.month == month,
+                GroupSalesAggregate.reseller_id.in_(reseller_ids)
+            )
+        }
+        missing = [reseller_id for reseller_id in reseller_ids if reseller_id not in existing]
+        if missing:
+            db.session.execute(db.insert(GroupSalesAggregate), [
+                {'reseller_id': reseller_id, 'month': month, 'gppis': 0, 'ggpis': 0,
+                 'active_status': False, 'active_bps': 0, 'active_ibos_downline': 0}
+                for reseller_id in missing
+            ])
@@ -0,0 +1,272 @@
+# app/services/hierarchy_index.py - Ancestor/Descendant Index Queries
+
+from database.models import db, Reseller, MonthlySales, ResellerClosure, ResellerTour
+from services import subtree_aggregates
+from services.rule_plan import get_rule_plan
+from config import Config
+from abc import ABC, abstractmethod
+from decimal import Decimal
+from typing import Dict, List, Tuple
+
+class HierarchyIndex(ABC):
+    """
+    Downline and upline queries over a subtree relation of (id, depth) rows.
+    Subclasses decide how that relation is produced; every method here is
+    then a single join or aggregate against it.
+    """
+    
+    @abstractmethod
+    def _subtree(self, reseller_id: int):
+        """Selectable of (id, depth) for the reseller (depth 0) and all downlines"""
+    
+    @abstractmethod
+    def _upline(self, reseller_id: int):
+        """Selectable of (id, depth) for the reseller (depth 0) and all uplines"""
+    
+    def on_sales_changes(self, changes: Dict[Tuple[int, str], Decimal]):
+        """
+        Hook for backends that keep in-memory state; called after each
+        committed sales write with {(reseller_id, month): new gppis}
+        """
+        pass
+    
+    def get_downlines(self, reseller_id: int) -> List[Reseller]:
+        """Get all downlines, nearest levels first"""
+        subtree = self._subtree(reseller_id)
+        return Reseller.query.join(
+            subtree, subtree.c.id == Reseller.id
+        ).filter(
+            subtree.c.depth > 0
+        ).order_by(subtree.c.depth, Reseller.id).all()
+    
+    def get_upline(self, reseller_id: int) -> List[Tuple[int, str]]:
+        """Get (id, level) for the reseller followed by each upline to the root"""
+        upline = self._upline(reseller_id)
+        rows = db.session.query(Reseller.id, Reseller.level).join(
+            upline, upline.c.id == Reseller.id
+        ).order_by(upline.c.depth).all()
+        
+        return [(upline_id, level) for upline_id, level in rows]
+    
+    def is_downline(self, reseller_id: int, candidate_id: int) -> bool:
+        """Check whether candidate_id sits in reseller_id's subtree (or is it)"""
+        subtree = self._subtree(reseller_id)
+        return db.session.query(
+            db.select(subtree.c.id).where(subtree.c.id == candidate_id).exists()
+        ).scalar()
+    
+    def count_downlines(self, reseller_id: int) -> int:
+        """Count all downlines"""
+        subtree = self._subtree(reseller_id)
+        return db.session.query(db.func.count()).select_from(subtree).filter(
+            subtree.c.depth > 0
+        ).scalar() or 0
+    
+    def count_downlines_by_level(self, reseller_id: int) -> Dict[str, int]:
+        """Count all downlines grouped by level (BP, IBO, BD)"""
+        subtree = self._subtree(reseller_id)
+        rows = db.session.query(
+            Reseller.level,
+            db.func.count(Reseller.id)
+        ).join(
+            subtree, subtree.c.id == Reseller.id
+        ).filter(
+            subtree.c.depth > 0
+        ).group_by(Reseller.level).all()
+        
+        return {level: count for level, count in rows}
+    
+    def count_active_downlines(self, reseller_id: int, month: str) -> Dict[str, int]:
+        """Count downlines meeting their level's active threshold, by level"""
+        thresholds = get_rule_plan(month).active_thresholds
+        threshold = db.case(
+            *[(Reseller.level == level, thresholds[level]) for level in ['BP', 'IBO', 'BD']]
+        )
+        
+        subtree = self._subtree(reseller_id)
+        rows = db.session.query(
+            Reseller.level,
+            db.func.count(Reseller.id)
+        ).join(
+            subtree, subtree.c.id == Reseller.id
+        ).join(
+            MonthlySales, db.and_(
+                MonthlySales.reseller_id == Reseller.id,
+                MonthlySales.month == month
+            )
+        ).filter(
+            subtree.c.depth > 0,
+            MonthlySales.gppis >= threshold
+        ).group_by(Reseller.level).all()
+        
+        active_counts = {'BP': 0, 'IBO': 0, 'BD': 0}
+        active_counts.update({level: count for level, count in rows})
+        return active_counts
+    
+    def count_active_in_downline(self, reseller_id: int, month: str,
+                                 level: str, threshold) -> int:
+        """Count downlines of one level whose GPPIS meets the threshold"""
+        subtree = self._subtree(reseller_id)
+        return db.session.query(db.func.count(MonthlySales.id)).join(
+            subtree, subtree.c.id == MonthlySales.reseller_id
+        ).join(
+            Reseller, Reseller.id == MonthlySales.reseller_id
+        ).filter(
+            subtree.c.depth > 0,
+            Reseller.level == level,
+            MonthlySales.month == month,
+            MonthlySales.gppis >= threshold
+        ).scalar() or 0
+    
+    def group_sales(self, reseller_id: int, month: str) -> Decimal:
+        """Sum GPPIS of the reseller and all downlines (GGPIS)"""
+        subtree = self._subtree(reseller_id)
+        total = db.session.query(db.func.sum(MonthlySales.gppis)).join(
+            subtree, subtree.c.id == MonthlySales.reseller_id
+        ).filter(
+            MonthlySales.month == month
+        ).scalar()
+        
+        return total if total is not None else Decimal('0')
+
+class ClosureHierarchyIndex(HierarchyIndex):
+    """Reads subtrees and uplines from the maintained reseller_closure table"""
+    
+    def _subtree(self, reseller_id: int):
+        return db.select(
+            ResellerClosure.descendant_id.label('id'),
+            ResellerClosure.depth
+        ).where(ResellerClosure.ancestor_id == reseller_id).subquery('subtree')
+    
+    def _upline(self, reseller_id: int):
+        return db.select(
+            ResellerClosure.ancestor_id.label('id'),
+            ResellerClosure.depth
+        ).where(ResellerClosure.descendant_id == reseller_id).subquery('upline')
+
+class RecursiveCteHierarchyIndex(HierarchyIndex):
+    """
+    Walks sponsor links with WITH RECURSIVE (SQLite and PostgreSQL)
+    Needs no extra table; each row carries the ids visited so far, so a
+    sponsor cycle stops at the first repeat instead of recurring
+    """
+    
+    def __init__(self):
+        super().__init__()
+        self.max_depth = Config.HIERARCHY_MAX_DEPTH
+    
+    def _path_start(self, column):
+        """',<id>,' - the visited path of a walk's first row"""
+        return db.cast(db.literal(',') + db.cast(column, db.Text) + ',', db.Text)
+    
+    def _path_step(self, path, column):
+        """The path extended by one id, and the condition that the id is new"""
+        marker = db.literal(',') + db.cast(column, db.Text) + ','
+        return db.cast(path + db.cast(column, db.Text) + ',', db.Text), ~path.contains(marker)
+    
+    def _subtree(self, reseller_id: int):
+        subtree = db.select(
+            Reseller.id.label('id'),
+            db.literal(0).label('depth'),
+            self._path_start(Reseller.id).label('path')
+        ).where(Reseller.id == reseller_id).cte('subtree', recursive=True)
+        
+        child = db.aliased(Reseller)
+        path, unvisited = self._path_step(subtree.c.path, child.id)
+        return subtree.union_all(
+            db.select(child.id, subtree.c.depth + 1, path).where(
+                child.sponsor_id == subtree.c.id,
+                unvisited,
+                subtree.c.depth < self.max_depth
+            )
+        )
+    
+    def _upline(self, reseller_id: int):
+        upline = db.select(
+            Reseller.id.label('id'),
+            Reseller.sponsor_id.label('sponsor_id'),
+            db.literal(0).label('depth'),
+            self._path_start(Reseller.id).label('path')
+        ).where(Reseller.id == reseller_id).cte('upline', recursive=True)
+        
+        sponsor = db.aliased(Reseller)
+        path, unvisited = self._path_step(upline.c.path, sponsor.id)
+        return upline.union_all(
+            db.select(sponsor.id, sponsor.sponsor_id, upline.c.depth + 1, path).where(
+                sponsor.id == upline.c.sponsor_id,
+                unvisited,
+                upline.c.depth < self.max_depth
+            )
+        )
+
+class EulerTourHierarchyIndex(HierarchyIndex):
+    """
+    Subtrees are contiguous reseller_tour label ranges. GGPIS and active
+    counts come from per-month Fenwick trees in O(log N); sales changes
+    are O(log N) point updates. The trees live in this process only.
+    """
+    
+    def _subtree(self, reseller_id: int):
+        root = db.aliased(ResellerTour)
+        return db.select(
+            ResellerTour.reseller_id.label('id'),
+            (ResellerTour.depth - root.depth).label('depth')
+        ).where(
+            root.reseller_id == reseller_id,
+            ResellerTour.tour_in >= root.tour_in,
+            ResellerTour.tour_in <= root.tour_out
+        ).subquery('subtree')
+    
+    def _upline(self, reseller_id: int):
+        node = db.aliased(ResellerTour)
+        return db.select(
+            ResellerTour.reseller_id.label('id'),
+            (node.depth - ResellerTour.depth).label('depth')
+        ).where(
+            node.reseller_id == reseller_id,
+            ResellerTour.tour_in <= node.tour_in,
+            ResellerTour.tour_out >= node.tour_in
+        ).subquery('upline')
+    
+    def on_sales_changes(self, changes: Dict[Tuple[int, str], Decimal]):
+        subtree_aggregates.apply_sales_changes(changes)
+    
+    def group_sales(self, reseller_id: int, month: str) -> Decimal:
+        aggregates = subtree_aggregates.get_month_aggregates(month)
+        if not aggregates.covers(reseller_id):
+            return super().group_sales(reseller_id, month)
+        return aggregates.group_sales(reseller_id)
+    
+    def count_active_in_downline(self, reseller_id: int, month: str,
+                                 level: str, threshold) -> int:
+        aggregates = subtree_aggregates.get_month_aggregates(month)
+        count = None
+        if aggregates.covers(reseller_id):
+            count = aggregates.count_active(reseller_id, level, threshold)
+        if count is None:
+            return super().count_active_in_downline(reseller_id, month, level, threshold)
+        return count
+    
+    def count_active_downlines(self, reseller_id: int, month: str) -> Dict[str, int]:
+        aggregates = subtree_aggregates.get_month_aggregates(month)
+        if not aggregates.covers(reseller_id):
+            return super().count_active_downlines(reseller_id, month)
+        
+        thresholds = get_rule_plan(month).active_thresholds
+        return {
+            level: aggregates.count_active(reseller_id, level, thresholds[level])
+            for level in ['BP', 'IBO', 'BD']
+        }
+
+HIERARCHY_INDEXES = {
+    'closure': ClosureHierarchyIndex,
+    'cte': RecursiveCteHierarchyIndex,
+    'euler': EulerTourHierarchyIndex
+}
+
+def get_hierarchy_index(name: str = None) -> HierarchyIndex:
+    """Create the traversal backend selected by Config.HIERARCHY_INDEX"""
+    name = name or Config.HIERARCHY_INDEX
+    if name not in HIERARCHY_INDEXES:
+        raise ValueError(f"Unknown hierarchy index '{name}'")
+    return HIERARCHY_INDEXES[name]()
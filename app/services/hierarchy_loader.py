@@ -0,0 +1,40 @@
+# app/services/hierarchy_loader.py - Bulk Reseller Graph Loader
+
+from database.models import Reseller, Organization
+from sqlalchemy.orm.attributes import set_committed_value
+from typing import Dict, List
+import logging
+
+class HierarchyLoader:
+    """
+    Loads every reseller and organization in two queries and wires the
+    sponsor, downlines and organization relationships in memory, so
+    to_dict and tree building never fall back to per-node lazy loads
+    """
+    
+    def __init__(self):
+        self.logger = logging.getLogger(__name__)
+    
+    def load(self) -> List[Reseller]:
+        """Load the whole graph; returns root resellers (no sponsor) in id order"""
+        resellers = Reseller.query.order_by(Reseller.id).all()
+        organizations = {o.id: o for o in Organization.query.all()}
+        
+        by_id = {reseller.id: reseller for reseller in resellers}
+        children: Dict[int, List[Reseller]] = {reseller.id: [] for reseller in resellers}
+        roots = []
+        
+        for reseller in resellers:
+            sponsor = by_id.get(reseller.sponsor_id)
+            set_committed_value(reseller, 'sponsor', sponsor)
+            set_committed_value(reseller, 'organization', organizations.get(reseller.organization_id))
+            if sponsor is not None:
+                children[sponsor.id].append(reseller)
+            elif reseller.sponsor_id is None:
+                roots.append(reseller)
+        
+        for reseller in resellers:
+            set_committed_value(reseller, 'downlines', children[reseller.id])
+        
+        self.logger.debug(f"Loaded {len(resellers)} resellers, {len(organizations)} organizations")
+        return roots
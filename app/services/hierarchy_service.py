@@ -1,13 +1,36 @@
 # app/services/hierarchy_service.py - MLM Hierarchy Management Service
 
 from database.models import (
-    db, Reseller, Organization, MonthlySales, 
-    CommissionCalculation, MonthlySummary
+    db, Reseller, Organization, MonthlySales, DEFAULT_PRODUCT_SPLIT, SALES_PRODUCT_COLUMNS,
+    MonthlySummary, ResellerTour, bump_month_versions, bump_reseller_versions,
+    monthly_sales_upsert, get_data_versions, GLOBAL_SCOPE
 )
 from services.commission_engine import CommissionEngine
-from decimal import Decimal
-from typing import Dict, List, Optional
+from services.commission_history_service import CommissionHistoryService
+from services.group_sales_service import GroupSalesService
+from services.hierarchy_index import get_hierarchy_index
+from services.hierarchy_loader import HierarchyLoader
+from services.month_data import activate_month_data, current_month_data, deactivate_month_data
+from services.rule_plan import get_rule_plan
+from services.search_index import get_search_index
+from config import Config
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+from decimal import Decimal, InvalidOperation
+from flask import current_app
+from sqlalchemy.pool import StaticPool
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+import base64
+import contextvars
+import itertools
+import json
 import logging
+import threading
+
+# Optional sections of the reseller details payload, in response order
+DETAIL_SECTIONS = ('organization', 'sales_history', 'commission_history',
+                   'downline_summary', 'current_performance')
+MONTH_SECTIONS = ('downline_summary', 'current_performance')
 
 class HierarchyService:
     """
@@ -16,6 +39,12 @@ class HierarchyService:
     
     def __init__(self):
         self.commission_engine = CommissionEngine()
+        self.group_sales_service = GroupSalesService(self.commission_engine)
+        self.hierarchy_index = get_hierarchy_index()
+        self.hierarchy_loader = HierarchyLoader()
+        self.commission_history_service = CommissionHistoryService()
+        self._member_stats_cache = {}
+        self._member_stats_lock = threading.Lock()
         self.logger = logging.getLogger(__name__)
     
     def get_complete_hierarchy(self) -> List[Dict]:
@@ -24,8 +53,8 @@ class HierarchyService:
         Returns nested structure with all downlines
         """
         try:
-            # Get root resellers (those without sponsors)
-            root_resellers = Reseller.query.filter_by(sponsor_id=None).all()
+            # Two queries in total; every node below serializes from memory
+            root_resellers = self.hierarchy_loader.load()
             
             hierarchy = []
             for root in root_resellers:
@@ -39,29 +68,532 @@ class HierarchyService:
     
     def _build_reseller_tree(self, reseller: Reseller) -> Dict:
         """
-        Recursively build reseller tree with all downlines
+        Build reseller tree with all downlines
+        Walks iteratively, so deep sponsor chains cannot hit the recursion limit
         """
-        # Get basic reseller data
+        tree = self._tree_node(reseller)
+        stack = [(reseller, tree)]
+        
+        while stack:
+            current, current_data = stack.pop()
+            for downline in current.direct_downlines:
+                child_data = self._tree_node(downline)
+                current_data['children'].append(child_data)
+                stack.append((downline, child_data))
+        
+        return tree
+    
+    def _tree_node(self, reseller: Reseller) -> Dict:
+        """Reseller data plus organization info, with children filled in by the caller"""
         reseller_data = reseller.to_dict()
         
-        # Add organization info
         if reseller.organization:
             reseller_data['organization'] = reseller.organization.to_dict()
         
-        # Get direct downlines
-        downlines = Reseller.query.filter_by(sponsor_id=reseller.id).all()
         reseller_data['children'] = []
+        return reseller_data
+    
+    def list_members(self, filters: Dict = None, sort: str = 'id', descending: bool = False,
+                     cursor: Optional[str] = None, limit: int = None,
+                     month: Optional[str] = None) -> Dict:
+        """
+        One page of the member listing, filtered, sorted and paged in SQL
+        filters may hold level, organization_id, territory and active.
+        Paging seeks past the cursor's sort key instead of using OFFSET, so
+        every page costs the same however deep the reader goes. Sorting by
+        monthly_sales walks the month's sales index, so it adds the has_sales
+        filter: members with a sales row for that month, in the page and the
+        stats alike.
+        """
+        filters = dict(filters or {})
+        limit = min(limit or Config.ITEMS_PER_PAGE, Config.MAX_ITEMS_PER_PAGE)
+        month = month or self._latest_sales_month()
         
-        for downline in downlines:
-            reseller_data['children'].append(self._build_reseller_tree(downline))
+        sponsor = db.aliased(Reseller)
+        child = db.aliased(Reseller)
+        monthly_sales = db.func.coalesce(MonthlySales.gppis, 0)
+        downline_count = db.select(db.func.count(child.id)).where(
+            child.sponsor_id == Reseller.id
+        ).correlate(Reseller).scalar_subquery()
         
-        return reseller_data
+        sort_columns = {
+            'id': [Reseller.id],
+            'name': [Reseller.first_name, Reseller.last_name, Reseller.id],
+            'join_date': [Reseller.join_date, Reseller.id],
+            'monthly_sales': [MonthlySales.gppis, MonthlySales.reseller_id]
+        }
+        if sort not in sort_columns:
+            raise ValueError(f"Unsupported sort '{sort}'")
+        columns = sort_columns[sort]
+        if sort == 'monthly_sales':
+            filters['has_sales'] = True
+        
+        criteria = self._member_criteria(filters)
+        sales_join = db.and_(MonthlySales.reseller_id == Reseller.id, MonthlySales.month == month)
+        
+        query = db.session.query(
+            Reseller, sponsor.first_name, sponsor.last_name, monthly_sales,
+            downline_count, ResellerTour.depth
+        ).outerjoin(
+            sponsor, sponsor.id == Reseller.sponsor_id
+        ).outerjoin(
+            ResellerTour, ResellerTour.reseller_id == Reseller.id
+        ).filter(*criteria)
+        if filters.get('has_sales'):
+            # Inner join so (month, gppis, reseller_id) index order is the page order
+            query = query.join(MonthlySales, sales_join)
+        else:
+            query = query.outerjoin(MonthlySales, sales_join)
+        
+        if cursor:
+            after = self._decode_cursor(cursor, sort)
+            key = db.tuple_(*columns)
+            query = query.filter(key < db.tuple_(*after) if descending else key > db.tuple_(*after))
+        
+        order = [column.desc() if descending else column.asc() for column in columns]
+        rows = query.order_by(*order).limit(limit + 1).all()
+        
+        members = []
+        for reseller, sponsor_first, sponsor_last, sales, downlines, depth in rows[:limit]:
+            members.append({
+                'id': reseller.id,
+                'employee_code': reseller.employee_code,
+                'name': reseller.full_name,
+                'email': reseller.email,
+                'level': reseller.level,
+                'organization_id': reseller.organization_id,
+                'territory': reseller.territory,
+                'sponsor': f"{sponsor_first} {sponsor_last}" if sponsor_first else 'N/A',
+                'join_date': reseller.join_date.isoformat() if reseller.join_date else None,
+                'status': 'Active' if reseller.active_status else 'Inactive',
+                'hierarchy_level': depth or 0,
+                'monthly_sales': float(sales),
+                'downline_count': downlines
+            })
+        
+        next_cursor = None
+        if len(rows) > limit:
+            reseller, _, _, sales, _, _ = rows[limit - 1]
+            next_cursor = self._encode_cursor(sort, reseller, sales)
+        
+        return {
+            'members': members,
+            'next_cursor': next_cursor,
+            'sort': sort,
+            'direction': 'desc' if descending else 'asc',
+            'limit': limit,
+            'month': month,
+            'filters': filters,
+            'stats': self._member_stats(filters, criteria, month)
+        }
+    
+    def _member_criteria(self, filters: Dict) -> List:
+        criteria = []
+        if filters.get('level'):
+            criteria.append(Reseller.level == filters['level'])
+        if filters.get('organization_id'):
+            criteria.append(Reseller.organization_id == filters['organization_id'])
+        if filters.get('territory'):
+            criteria.append(Reseller.territory == filters['territory'])
+        if filters.get('active') is not None:
+            criteria.append(Reseller.active_status.is_(bool(filters['active'])))
+        if filters.get('has_sales'):
+            # Against the month's MonthlySales join, outer or inner
+            criteria.append(MonthlySales.id.isnot(None))
+        return criteria
+    
+    def _member_stats(self, filters: Dict, criteria: List, month: str) -> Dict:
+        """
+        Totals over the whole filtered set, computed once per filter set and
+        data version instead of on every page
+        """
+        key = (tuple(sorted(filters.items())), month)
+        version = get_data_versions([GLOBAL_SCOPE]).get(GLOBAL_SCOPE, (0, None))[0]
+        with self._member_stats_lock:
+            cached = self._member_stats_cache.get(key)
+        if cached and cached[0] == version:
+            return dict(cached[1])
+        
+        stats = self._count_members(criteria, month)
+        with self._member_stats_lock:
+            if len(self._member_stats_cache) >= Config.MEMBER_STATS_CACHE_SIZE:
+                self._member_stats_cache.clear()
+            self._member_stats_cache[key] = (version, stats)
+        return dict(stats)
+    
+    def _count_members(self, criteria: List, month: str) -> Dict:
+        """Totals over the whole filtered set, in one aggregate query"""
+        total, active, sales = db.session.query(
+            db.func.count(Reseller.id),
+            db.func.sum(db.case((Reseller.active_status.is_(True), 1), else_=0)),
+            db.func.sum(MonthlySales.gppis)
+        ).outerjoin(
+            MonthlySales, db.and_(MonthlySales.reseller_id == Reseller.id, MonthlySales.month == month)
+        ).filter(*criteria).one()
+        
+        return {
+            'total_members': total,
+            'active_members': active or 0,
+            'inactive_members': total - (active or 0),
+            'total_sales': float(sales or 0)
+        }
+    
+    def _latest_sales_month(self) -> Optional[str]:
+        return db.session.query(db.func.max(MonthlySales.month)).scalar()
+    
+    def _encode_cursor(self, sort: str, reseller: Reseller, monthly_sales) -> str:
+        """Opaque seek cursor holding the last row's sort key"""
+        if sort == 'name':
+            key = [reseller.first_name, reseller.last_name, reseller.id]
+        elif sort == 'join_date':
+            key = [reseller.join_date.isoformat() if reseller.join_date else None, reseller.id]
+        elif sort == 'monthly_sales':
+            key = [str(monthly_sales), reseller.id]
+        else:
+            key = [reseller.id]
+        return base64.urlsafe_b64encode(json.dumps(key).encode()).decode()
+    
+    def _decode_cursor(self, cursor: str, sort: str) -> List:
+        try:
+            key = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        except (ValueError, TypeError) as e:
+            raise ValueError(f"Invalid cursor: {str(e)}")
+        
+        expected = {'name': 3, 'join_date': 2, 'monthly_sales': 2}.get(sort, 1)
+        if not isinstance(key, list) or len(key) != expected:
+            raise ValueError("Invalid cursor for this sort")
+        
+        try:
+            if sort == 'join_date':
+                key[0] = date.fromisoformat(key[0])
+            elif sort == 'monthly_sales':
+                key[0] = Decimal(key[0])
+                if not key[0].is_finite():
+                    raise ValueError("sales key is not a number")
+        except (ValueError, TypeError, InvalidOperation) as e:
+            raise ValueError(f"Invalid cursor: {str(e)}")
+        return key
+    
+    def get_hierarchy_page(self, root_id: Optional[int] = None, depth: int = 1,
+                           cursor: Optional[int] = None, limit: int = None) -> Dict:
+        """
+        Get a depth-limited slice of the hierarchy for on-demand expansion
+        Expands `depth` levels below root_id (or below the top, so depth 1 is
+        the top-level resellers), at most `limit` children per sponsor in id
+        order. Every node carries a has_children count; a truncated child list
+        carries a next_cursor to pass back with root=<that node>.
+        """
+        limit = max(1, min(limit or Config.ITEMS_PER_PAGE, Config.MAX_ITEMS_PER_PAGE))
+        depth = max(0, min(depth, Config.HIERARCHY_PAGE_MAX_DEPTH))
+        
+        if root_id is None:
+            top = self._child_page(Reseller.sponsor_id.is_(None), cursor, limit)
+            more = bool(top) and top[0]['siblings'] > len(top)
+            next_cursor = top[-1]['id'] if more else None
+            frontier, levels = top, depth - 1
+        else:
+            root = self._node_rows(Reseller.id == root_id).first()
+            if root is None:
+                raise ValueError(f"Reseller {root_id} not found")
+            top = [self._node_dict(root)]
+            frontier, levels = top, depth
+        
+        total = len(top)
+        uncounted = []
+        for level in range(levels):
+            if not frontier or total >= Config.HIERARCHY_PAGE_MAX_NODES:
+                break
+            
+            # The cursor pages the root's own children
+            after_id = cursor if root_id is not None and level == 0 else None
+            by_id = {node['id']: node for node in frontier}
+            children = self._child_page(Reseller.sponsor_id.in_(by_id), after_id, limit)
+            
+            for node in frontier:
+                node['children'] = []
+            for child in children:
+                by_id[child['sponsor_id']]['children'].append(child)
+            
+            for node in frontier:
+                page = node['children']
+                remaining = page[0]['siblings'] if page else 0
+                if remaining > len(page):
+                    node['next_cursor'] = page[-1]['id']
+                if after_id is None:
+                    node['has_children'] = remaining
+                else:
+                    uncounted.append(node)
+            
+            frontier = children
+            total += len(children)
+        
+        # Nodes left unexpanded still report how many children they have
+        uncounted.extend(node for node in frontier if 'children' not in node)
+        self._fill_child_counts(uncounted)
+        
+        nodes = list(self._walk(top))
+        for node in nodes:
+            node.pop('siblings', None)
+        
+        if root_id is not None:
+            next_cursor = top[0].get('next_cursor')
+        
+        return {
+            'root': root_id,
+            'depth': depth,
+            'nodes': top,
+            'organizations': self._organizations_for(nodes),
+            'next_cursor': next_cursor
+        }
+    
+    def _node_rows(self, *criteria):
+        """Only the columns a tree node needs, never the full entity"""
+        return db.session.query(
+            Reseller.id, Reseller.employee_code, Reseller.first_name, Reseller.last_name,
+            Reseller.level, Reseller.position, Reseller.sponsor_id, Reseller.organization_id,
+            Reseller.active_status, Reseller.territory, Reseller.avatar_initials
+        ).filter(*criteria)
+    
+    def _node_dict(self, row) -> Dict:
+        return {
+            'id': row.id,
+            'employee_code': row.employee_code,
+            'full_name': f"{row.first_name} {row.last_name}",
+            'level': row.level,
+            'position': row.position,
+            'sponsor_id': row.sponsor_id,
+            'organization_id': row.organization_id,
+            'active_status': row.active_status,
+            'territory': row.territory,
+            'avatar_initials': row.avatar_initials
+        }
+    
+    def _child_page(self, sponsor_filter, after_id: Optional[int], limit: int) -> List[Dict]:
+        """
+        First `limit` children of each matching sponsor after after_id, in one query
+        Each child carries its sponsor's remaining child count as 'siblings'
+        """
+        criteria = [sponsor_filter]
+        if after_id is not None:
+            criteria.append(Reseller.id > after_id)
+        
+        ranked = self._node_rows(*criteria).add_columns(
+            db.func.row_number().over(
+                partition_by=Reseller.sponsor_id, order_by=Reseller.id
+            ).label('rank'),
+            db.func.count().over(partition_by=Reseller.sponsor_id).label('siblings')
+        ).subquery()
+        
+        rows = db.session.query(ranked).filter(
+            ranked.c.rank <= limit
+        ).order_by(ranked.c.sponsor_id, ranked.c.id).all()
+        
+        nodes = []
+        for row in rows:
+            node = self._node_dict(row)
+            node['siblings'] = row.siblings
+            nodes.append(node)
+        return nodes
+    
+    def _fill_child_counts(self, nodes: List[Dict]):
+        """Set has_children from one grouped count over the given nodes"""
+        if not nodes:
+            return
+        counts = dict(db.session.query(
+            Reseller.sponsor_id, db.func.count(Reseller.id)
+        ).filter(
+            Reseller.sponsor_id.in_([node['id'] for node in nodes])
+        ).group_by(Reseller.sponsor_id).all())
+        for node in nodes:
+            node['has_children'] = counts.get(node['id'], 0)
+    
+    def _walk(self, nodes: List[Dict]):
+        stack = list(nodes)
+        while stack:
+            node = stack.pop()
+            yield node
+            stack.extend(node.get('children', []))
+    
+    def _organizations_for(self, nodes) -> Dict[int, Dict]:
+        """Organizations referenced by the nodes, serialized once each"""
+        organization_ids = {node['organization_id'] for node in nodes}
+        if not organization_ids:
+            return {}
+        return {
+            organization.id: organization.to_dict()
+            for organization in Organization.query.filter(Organization.id.in_(organization_ids))
+        }
+    
+    def iter_hierarchy(self, root_id: Optional[int] = None) -> Iterator[Dict]:
+        """
+        Yield every node of the tree (or of root_id's subtree) in pre-order
+        with its depth. Rows come off a server-side cursor in Euler-tour
+        order, so nothing is held beyond the current batch.
+        """
+        query = self._node_rows().add_columns(
+            ResellerTour.depth
+        ).join(
+            ResellerTour, ResellerTour.reseller_id == Reseller.id
+        )
+        
+        base_depth = 0
+        if root_id is not None:
+            root = ResellerTour.query.get(root_id)
+            if root is None:
+                raise ValueError(f"Reseller {root_id} not found")
+            query = query.filter(ResellerTour.tour_in.between(root.tour_in, root.tour_out))
+            base_depth = root.depth
+        
+        for row in query.order_by(ResellerTour.tour_in).yield_per(Config.HIERARCHY_STREAM_BATCH_SIZE):
+            node = self._node_dict(row)
+            node['depth'] = row.depth - base_depth
+            yield node
+    
+    def get_hierarchy_columnar(self, root_id: Optional[int] = None) -> Dict:
+        """
+        Get the tree as parallel arrays plus deduplicated lookup tables
+        Nodes are in pre-order, so parent_index always points at an earlier
+        entry (-1 for roots) and the tree can be rebuilt in one linear pass
+        """
+        ids = []
+        parent_index = []
+        level_code = []
+        org_index = []
+        position_index = []
+        territory_index = []
+        employee_codes = []
+        full_names = []
+        avatar_initials = []
+        active = []
+        
+        levels = ['BP', 'IBO', 'BD']
+        level_lookup = {level: code for code, level in enumerate(levels)}
+        organization_ids = {}
+        positions = {}
+        territories = {}
+        index_of = {}
+        
+        for node in self.iter_hierarchy(root_id):
+            index_of[node['id']] = len(ids)
+            ids.append(node['id'])
+            parent_index.append(index_of.get(node['sponsor_id'], -1) if node['depth'] else -1)
+            level_code.append(level_lookup.setdefault(node['level'], len(level_lookup)))
+            org_index.append(organization_ids.setdefault(node['organization_id'], len(organization_ids)))
+            position_index.append(positions.setdefault(node['position'], len(positions)))
+            territory_index.append(territories.setdefault(node['territory'], len(territories)))
+            employee_codes.append(node['employee_code'])
+            full_names.append(node['full_name'])
+            avatar_initials.append(node['avatar_initials'])
+            active.append(1 if node['active_status'] else 0)
+        
+        if root_id is not None and not ids:
+            raise ValueError(f"Reseller {root_id} not found")
+        
+        organizations = {
+            organization.id: organization.to_dict()
+            for organization in Organization.query.filter(Organization.id.in_(organization_ids))
+        } if organization_ids else {}
+        
+        return {
+            'format': 'columnar',
+            'root': root_id,
+            'count': len(ids),
+            'ids': ids,
+            'parent_index': parent_index,
+            'level_code': level_code,
+            'org_index': org_index,
+            'position_index': position_index,
+            'territory_index': territory_index,
+            'employee_code': employee_codes,
+            'full_name': full_names,
+            'avatar_initials': avatar_initials,
+            'active': active,
+            'levels': sorted(level_lookup, key=level_lookup.get),
+            'organizations': [organizations.get(org_id) for org_id in organization_ids],
+            'positions': list(positions),
+            'territories': list(territories)
+        }
+    
+    def stream_hierarchy(self, root_id: Optional[int] = None, fmt: str = 'json') -> Iterator[str]:
+        """
+        Encode iter_hierarchy incrementally, in buffered chunks
+        'json' is the nested API envelope; 'ndjson' is one flat row per line
+        """
+        nodes = self.iter_hierarchy(root_id)
+        # Look up the root before the response starts so a bad id is still an error
+        first = next(nodes, None)
+        if root_id is not None and first is None:
+            raise ValueError(f"Reseller {root_id} not found")
+        
+        rows = itertools.chain([first], nodes) if first else iter(())
+        encode = self._encode_ndjson if fmt == 'ndjson' else self._encode_nested
+        return self._buffered(encode(rows))
+    
+    def _encode_ndjson(self, nodes: Iterator[Dict]) -> Iterator[str]:
+        for node in nodes:
+            yield json.dumps(node) + '\n'
+    
+    def _encode_nested(self, nodes: Iterator[Dict]) -> Iterator[str]:
+        """
+        Emit pre-ordered (node, depth) rows as nested children arrays
+        Each node is left open until a row at the same or a shallower depth
+        arrives, so only the depth counter is carried between rows
+        """
+        yield '{"success": true, "data": ['
+        previous = None
+        for node in nodes:
+            depth = node.pop('depth')
+            if previous is not None:
+                if depth > previous:
+                    separator = ''
+                else:
+                    separator = ']}' * (previous - depth + 1) + ', '
+                yield separator
+            yield json.dumps(node)[:-1] + ', "children": ['
+            previous = depth
+        if previous is not None:
+            yield ']}' * (previous + 1)
+        yield ']}'
     
-    def get_reseller_details(self, reseller_id: int) -> Dict:
+    def _buffered(self, parts: Iterator[str], size: int = 64 * 1024) -> Iterator[str]:
+        """Join small encoded parts into chunks of roughly `size` characters"""
+        buffer = []
+        length = 0
+        try:
+            for part in parts:
+                buffer.append(part)
+                length += len(part)
+                if length >= size:
+                    yield ''.join(buffer)
+                    buffer = []
+                    length = 0
+        except Exception as e:
+            # Headers are already sent; the client sees a truncated body
+            self.logger.error(f"Error streaming hierarchy: {str(e)}")
+            raise
+        if buffer:
+            yield ''.join(buffer)
+    
+    def resolve_detail_sections(self, fields: Optional[List[str]] = None) -> List[str]:
+        """Validate a sparse fieldset; None means every section"""
+        if not fields:
+            return list(DETAIL_SECTIONS)
+        unknown = [field for field in fields if field not in DETAIL_SECTIONS]
+        if unknown:
+            raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+        return [section for section in DETAIL_SECTIONS if section in fields]
+    
+    def get_reseller_details(self, reseller_id: int, fields: Optional[List[str]] = None,
+                             month: Optional[str] = None, months: int = 6) -> Dict:
         """
         Get detailed information for a specific reseller including
         sales history, commission totals, and downline summary
+        Only the sections named in `fields` are computed; the header is always
+        returned. `month` drives the month-dependent sections and defaults to
+        the latest month with sales.
         """
+        sections = self.resolve_detail_sections(fields)
+        
         reseller = Reseller.query.get(reseller_id)
         if not reseller:
             raise ValueError(f"Reseller {reseller_id} not found")
@@ -71,27 +603,24 @@ class HierarchyService:
             details = reseller.to_dict()
             
             # Organization info
-            if reseller.organization:
+            if 'organization' in sections and reseller.organization:
                 details['organization'] = reseller.organization.to_dict()
             
-            # Sales history (last 6 months)
-            sales_history = self._get_sales_history(reseller_id, months=6)
-            details['sales_history'] = sales_history
-            
-            # Commission history
-            commission_history = self._get_commission_history(reseller_id, months=6)
-            details['commission_history'] = commission_history
-            
-            # Downline summary
-            downline_summary = self._get_downline_summary(reseller_id)
-            details['downline_summary'] = downline_summary
+            if any(section in MONTH_SECTIONS for section in sections):
+                month = month or self._latest_sales_month() or date.today().strftime('%Y-%m')
+                details['month'] = month
             
-            # Current month performance
-            current_month = "2024-07"  # For demo purposes
-            current_performance = self.commission_engine.calculate_monthly_commissions(
-                reseller_id, current_month
-            )
-            details['current_performance'] = current_performance
+            builders = {
+                'sales_history': lambda: self._get_sales_history(reseller_id, months),
+                'commission_history': lambda: self._get_commission_history(reseller_id, months),
+                'downline_summary': lambda: self._get_downline_summary(reseller_id, month),
+                'current_performance': lambda: self.commission_engine.calculate_monthly_commissions(
+                    reseller_id, month
+                )
+            }
+            details.update(self._run_sections(
+                {section: builders[section] for section in sections if section in builders}
+            ))
             
             return details
             
@@ -99,6 +628,35 @@ class HierarchyService:
             self.logger.error(f"Error getting reseller details for {reseller_id}: {str(e)}")
             raise
     
+    def _run_sections(self, builders: Dict[str, Callable[[], object]]) -> Dict:
+        """
+        Compute independent detail sections, side by side when there is more
+        than one. Each thread gets its own app context (and so its own
+        session) and its own month data context, inside a copy of this
+        request's context variables; MonthDataContext is not thread-safe.
+        """
+        workers = min(Config.RESELLER_DETAIL_WORKERS, len(builders))
+        # A StaticPool hands every thread the same connection (in-memory SQLite)
+        if workers <= 1 or isinstance(db.engine.pool, StaticPool):
+            return {section: build() for section, build in builders.items()}
+        
+        app = current_app._get_current_object()
+        
+        def run(build):
+            token = activate_month_data()
+            try:
+                with app.app_context():
+                    return build()
+            finally:
+                deactivate_month_data(token)
+        
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = {
+                section: pool.submit(contextvars.copy_context().run, run, build)
+                for section, build in builders.items()
+            }
+            return {section: future.result() for section, future in futures.items()}
+    
     def _get_sales_history(self, reseller_id: int, months: int = 6) -> List[Dict]:
         """Get sales history for the specified number of months"""
         sales_records = db.session.query(MonthlySales).filter(
@@ -109,41 +667,9 @@ class HierarchyService:
     
     def _get_commission_history(self, reseller_id: int, months: int = 6) -> List[Dict]:
         """Get commission history for the specified number of months"""
-        # Get unique months from commission calculations
-        commission_months = db.session.query(
-            CommissionCalculation.month,
-            db.func.sum(CommissionCalculation.commission_amount).label('total')
-        ).filter(
-            CommissionCalculation.reseller_id == reseller_id
-        ).group_by(
-            CommissionCalculation.month
-        ).order_by(
-            CommissionCalculation.month.desc()
-        ).limit(months).all()
-        
-        history = []
-        for month, total in commission_months:
-            # Get detailed breakdown for this month
-            month_commissions = CommissionCalculation.query.filter_by(
-                reseller_id=reseller_id,
-                month=month
-            ).all()
-            
-            breakdown = {}
-            for comm in month_commissions:
-                if comm.commission_type not in breakdown:
-                    breakdown[comm.commission_type] = 0
-                breakdown[comm.commission_type] += float(comm.commission_amount)
-            
-            history.append({
-                'month': month,
-                'total_commission': float(total),
-                'breakdown': breakdown
-            })
-        
-        return history
+        return self.commission_history_service.get_history(reseller_id, months)
     
-    def _get_downline_summary(self, reseller_id: int) -> Dict:
+    def _get_downline_summary(self, reseller_id: int, month: str) -> Dict:
         """Get summary of all downlines including counts by level"""
         # Count direct downlines by level
         direct_counts = db.session.query(
@@ -155,124 +681,141 @@ class HierarchyService:
         
         direct_summary = {level: count for level, count in direct_counts}
         
-        # Count total downlines (recursive)
+        # Count total downlines (whole subtree)
         total_downlines = self._count_total_downlines(reseller_id)
+        total_by_level = self.hierarchy_index.count_downlines_by_level(reseller_id)
         
-        # Get active downlines for current month
-        current_month = "2024-07"
-        active_downlines = self._count_active_downlines(reseller_id, current_month)
+        # Get active downlines for the requested month
+        active_downlines = self._count_active_downlines(reseller_id, month)
         
         return {
             'direct_downlines': direct_summary,
             'total_downlines': total_downlines,
+            'total_by_level': total_by_level,
             'active_downlines': active_downlines,
             'total_count': sum(direct_summary.values())
         }
     
-    def _count_total_downlines(self, reseller_id: int, visited=None) -> int:
-        """Recursively count all downlines"""
-        if visited is None:
-            visited = set()
-        
-        if reseller_id in visited:
-            return 0
-        
-        visited.add(reseller_id)
-        
-        # Get direct downlines
-        direct_downlines = Reseller.query.filter_by(sponsor_id=reseller_id).all()
-        count = len(direct_downlines)
-        
-        # Add counts from each downline's tree
-        for downline in direct_downlines:
-            count += self._count_total_downlines(downline.id, visited.copy())
-        
-        return count
+    def _count_total_downlines(self, reseller_id: int) -> int:
+        """Count all downlines"""
+        return self.hierarchy_index.count_downlines(reseller_id)
     
     def _count_active_downlines(self, reseller_id: int, month: str) -> Dict:
         """Count active downlines by level for a specific month"""
-        from config import Config
-        
-        active_counts = {'BP': 0, 'IBO': 0, 'BD': 0}
+        return self.hierarchy_index.count_active_downlines(reseller_id, month)
+    
+    def _get_all_downlines(self, reseller_id: int) -> List[Reseller]:
+        """Get all downlines"""
+        return self.hierarchy_index.get_downlines(reseller_id)
+    
+    def move_reseller(self, reseller_id: int, new_sponsor_id: Optional[int]) -> bool:
+        """
+        Move a reseller (and its whole subtree) under a new sponsor
+        The closure table and group sales aggregates follow through the
+        Reseller update listeners
+        """
+        reseller = Reseller.query.get(reseller_id)
+        if not reseller:
+            raise ValueError(f"Reseller {reseller_id} not found")
         
-        # Get all downlines recursively
-        all_downlines = self._get_all_downlines(reseller_id)
+        if new_sponsor_id is not None:
+            if not Reseller.query.get(new_sponsor_id):
+                raise ValueError(f"Sponsor {new_sponsor_id} not found")
+            if self.hierarchy_index.is_downline(reseller_id, new_sponsor_id):
+                raise ValueError(f"Reseller {new_sponsor_id} is in the downline of {reseller_id}")
         
-        for downline in all_downlines:
-            # Get sales for the month
-            sales = MonthlySales.query.filter_by(
-                reseller_id=downline.id,
-                month=month
-            ).first()
+        try:
+            reseller.sponsor_id = new_sponsor_id
+            db.session.commit()
             
-            gppis = sales.gppis if sales else Decimal('0')
+            self.logger.info(f"Moved reseller {reseller_id} under sponsor {new_sponsor_id}")
+            return True
             
-            # Check if active based on level requirements
-            threshold = Config.COMMISSION_RULES['active_thresholds'][downline.level]
-            if gppis >= threshold:
-                active_counts[downline.level] += 1
-        
-        return active_counts
-    
-    def _get_all_downlines(self, reseller_id: int, visited=None) -> List[Reseller]:
-        """Get all downlines recursively"""
-        if visited is None:
-            visited = set()
-        
-        if reseller_id in visited:
-            return []
-        
-        visited.add(reseller_id)
-        
-        all_downlines = []
-        direct_downlines = Reseller.query.filter_by(sponsor_id=reseller_id).all()
-        
-        for downline in direct_downlines:
-            all_downlines.append(downline)
-            all_downlines.extend(self._get_all_downlines(downline.id, visited.copy()))
-        
-        return all_downlines
+        except Exception as e:
+            db.session.rollback()
+            self.logger.error(f"Error moving reseller: {str(e)}")
+            return False
     
-    def update_monthly_sales(self, reseller_id: int, month: str, amount: float) -> bool:
+    def update_monthly_sales(self, reseller_id: int, month: str, amount,
+                             expected_version: Optional[int] = None) -> Optional[Dict]:
         """
-        Update monthly sales for a reseller
-        Creates new record if doesn't exist, updates if it does
+        Set a reseller's manually entered sales for the month
+        Creates new record if doesn't exist, updates if it does, in one
+        INSERT ... ON CONFLICT round trip. A signed string amount ("+1500",
+        "-200") adjusts the manual figure instead of replacing it. Confirmed
+        ledger sales stay on top, so the returned gppis is manual + ledger.
+        Returns the written record, or None when expected_version no longer
+        matches (or a negative delta would take the manual figure below zero).
         """
         try:
-            # Find existing record
-            sales_record = MonthlySales.query.filter_by(
-                reseller_id=reseller_id,
-                month=month
-            ).first()
+            datetime.strptime(month or '', '%Y-%m')
+        except ValueError:
+            raise ValueError(f"Invalid month {month!r}")
+        value, additive = self._parse_sales_amount(amount)
+        if not Reseller.query.get(reseller_id):
+            raise ValueError(f"Reseller {reseller_id} not found")
+        
+        try:
+            now = datetime.utcnow()
+            statement = monthly_sales_upsert({
+                'reseller_id': reseller_id,
+                'month': month,
+                'gppis': value,
+                # Product breakdown (simplified for demo). A delta leaves the
+                # stored products alone; product_breakdown splits the rest on read
+                **{
+                    column: Decimal('0') if additive else value * share
+                    for column, share in zip(SALES_PRODUCT_COLUMNS.values(), DEFAULT_PRODUCT_SPLIT)
+                },
+                'previous_gppis': Decimal('0'),
+                'version': 1,
+                'created_at': now,
+                'updated_at': now
+            }, additive=additive, expected_version=expected_version, update_only=additive and value < 0)
+            row = db.session.execute(statement).first()
             
-            if sales_record:
-                # Update existing record
-                sales_record.gppis = Decimal(str(amount))
-                # Update product breakdown (simplified for demo)
-                sales_record.premium_sales = Decimal(str(amount * 0.4))
-                sales_record.standard_sales = Decimal(str(amount * 0.4))
-                sales_record.basic_sales = Decimal(str(amount * 0.2))
-            else:
-                # Create new record
-                sales_record = MonthlySales(
-                    reseller_id=reseller_id,
-                    month=month,
-                    gppis=Decimal(str(amount)),
-                    premium_sales=Decimal(str(amount * 0.4)),
-                    standard_sales=Decimal(str(amount * 0.4)),
-                    basic_sales=Decimal(str(amount * 0.2))
-                )
-                db.session.add(sales_record)
+            if row is None:
+                db.session.rollback()
+                self.logger.info(f"Sales update for reseller {reseller_id}, month {month} was rejected")
+                return None
+            
+            _, new_gppis, old_gppis, version = row
+            
+            # Push the change up the upline chain in the same transaction
+            month_data = current_month_data()
+            if month_data:
+                month_data.invalidate(month)
+            self.group_sales_service.apply_sales_change(reseller_id, month, old_gppis, new_gppis)
+            bump_month_versions(month)
+            bump_reseller_versions(reseller_id)
             
             db.session.commit()
+            self.hierarchy_index.on_sales_changes({(reseller_id, month): new_gppis})
             
-            self.logger.info(f"Updated sales for reseller {reseller_id}, month {month}: ₱{amount:,.2f}")
-            return True
+            self.logger.info(f"Updated sales for reseller {reseller_id}, month {month}: ₱{new_gppis:,.2f}")
+            return {
+                'reseller_id': reseller_id,
+                'month': month,
+                'gppis': float(new_gppis),
+                'previous_gppis': float(old_gppis),
+                'version': version
+            }
             
         except Exception as e:
             db.session.rollback()
             self.logger.error(f"Error updating sales: {str(e)}")
-            return False
+            raise
+    
+    def _parse_sales_amount(self, amount) -> Tuple[Decimal, bool]:
+        """(value, additive): signed strings are deltas, anything else an absolute amount"""
+        additive = isinstance(amount, str) and amount.strip()[:1] in ('+', '-')
+        try:
+            value = Decimal(str(amount).strip())
+        except (InvalidOperation, ValueError):
+            raise ValueError(f"Invalid amount {amount!r}")
+        if not value.is_finite() or (value < 0 and not additive):
+            raise ValueError(f"Invalid amount {amount!r}")
+        return value.quantize(Decimal('0.01')), additive
     
     def get_dashboard_stats(self, month: str) -> Dict:
         """
@@ -293,11 +836,11 @@ class HierarchyService:
             reseller_counts = {level: count for level, count in level_counts}
             
             # Count active resellers by level
-            from config import Config
+            thresholds = get_rule_plan(month).active_thresholds
             active_counts = {'BP': 0, 'IBO': 0, 'BD': 0}
             
             for level in ['BP', 'IBO', 'BD']:
-                threshold = Config.COMMISSION_RULES['active_thresholds'][level]
+                threshold = thresholds[level]
                 
                 # Count active resellers for this level
                 active_count = db.session.query(
@@ -310,8 +853,18 @@ class HierarchyService:
                 
                 active_counts[level] = active_count
             
-            # Calculate total commissions (estimated)
-            estimated_commissions = float(total_sales) * 0.15  # Average 15% commission rate
+            # Serve commission totals from the month close when it has run
+            closed_commissions = db.session.query(
+                db.func.count(MonthlySummary.id),
+                db.func.sum(MonthlySummary.total_commissions)
+            ).filter(MonthlySummary.month == month).one()
+            
+            commissions_closed = bool(closed_commissions[0])
+            if commissions_closed:
+                estimated_commissions = float(closed_commissions[1] or 0)
+            else:
+                # Calculate total commissions (estimated)
+                estimated_commissions = float(total_sales) * 0.15  # Average 15% commission rate
             
             # Top performers
             top_performers = db.session.query(
@@ -339,6 +892,7 @@ class HierarchyService:
             return {
                 'total_sales': float(total_sales),
                 'estimated_commissions': estimated_commissions,
+                'commissions_closed': commissions_closed,
                 'total_resellers': sum(reseller_counts.values()),
                 'reseller_counts': reseller_counts,
                 'active_counts': active_counts,
@@ -357,16 +911,28 @@ class HierarchyService:
     def search_resellers(self, query: str, limit: int = 20) -> List[Dict]:
         """
         Search resellers by name, email, or employee code
+        Ranked by the search index; best match first
         """
-        search_pattern = f"%{query}%"
+        limit = min(limit or 20, Config.SEARCH_MAX_RESULTS)
+        reseller_ids = get_search_index().search(query, limit)
+        if not reseller_ids:
+            return []
         
-        resellers = Reseller.query.filter(
-            db.or_(
-                Reseller.first_name.ilike(search_pattern),
-                Reseller.last_name.ilike(search_pattern),
-                Reseller.email.ilike(search_pattern),
-                Reseller.employee_code.ilike(search_pattern)
-            )
-        ).limit(limit).all()
+        rows = db.session.query(
+            Reseller.id, Reseller.employee_code, Reseller.first_name, Reseller.last_name,
+            Reseller.email, Reseller.level, Reseller.sponsor_id, Reseller.avatar_initials
+        ).filter(Reseller.id.in_(reseller_ids)).all()
+        by_id = {row.id: row for row in rows}
         
-        return [reseller.to_dict() for reseller in resellers]
\ No newline at end of file
+        return [
+            {
+                'id': row.id,
+                'employee_code': row.employee_code,
+                'full_name': f"{row.first_name} {row.last_name}",
+                'email': row.email,
+                'level': row.level,
+                'sponsor_id': row.sponsor_id,
+                'avatar_initials': row.avatar_initials
+            }
+            for row in (by_id.get(reseller_id) for reseller_id in reseller_ids) if row
+        ]
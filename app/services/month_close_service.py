@@ -0,0 +1,196 @@
+# app/services/month_close_service.py - Month-End Close Pipeline
+
+from database.models import (
+    db, Reseller, CommissionCalculation, MonthlySummary, bump_month_versions
+)
+from services.commission_engine import CommissionEngine
+from services.parallel_close_executor import ParallelCloseExecutor
+from services.vectorized_engine import VectorizedCommissionEngine
+from config import Config
+from datetime import datetime
+from decimal import Decimal, ROUND_HALF_UP
+from typing import Dict, List
+import logging
+
+# Commission types rolled up into each MonthlySummary total
+SUMMARY_BUCKETS = {
+    'outright_discount': 'outright_commissions',
+    'group_override': 'override_commissions',
+    'bd_service_fee': 'override_commissions',
+    'bd_override': 'override_commissions',
+    'lifetime_incentive': 'incentive_commissions'
+}
+
+# Engines a close can run on; 'vectorized' requires numpy
+CLOSE_ENGINES = ('orm', 'vectorized')
+
+class MonthCloseService:
+    """
+    Runs the month-end close and stores its results so readers can
+    serve commissions from MonthlySummary / CommissionCalculation rows
+    """
+    
+    def __init__(self, commission_engine: CommissionEngine = None, engine: str = None):
+        self.commission_engine = commission_engine or CommissionEngine()
+        self.executor = ParallelCloseExecutor(self.commission_engine)
+        self.engine = engine or Config.MONTH_CLOSE_ENGINE
+        if self.engine not in CLOSE_ENGINES:
+            raise ValueError(f"Unknown month close engine '{self.engine}'")
+        self.batch_size = Config.MONTH_CLOSE_BATCH_SIZE
+        self.logger = logging.getLogger(__name__)
+    
+    def close_month(self, month: str) -> Dict:
+        """
+        Calculate all commissions for the month and persist them
+        Re-running a month replaces its previously stored rows
+        """
+        results = self.calculate(month, self.engine)
+        return self.persist(month, results)
+    
+    def calculate(self, month: str, engine: str = 'orm') -> Dict[int, Dict]:
+        """Every reseller's close results from the given engine, without storing them"""
+        try:
+            datetime.strptime(month or '', '%Y-%m')
+        except ValueError:
+            raise ValueError(f"Invalid month {month!r}")
+        if engine == 'vectorized':
+            return VectorizedCommissionEngine().close_month(month).close_results()
+        return self.executor.close_month(month)
+    
+    def compare_engines(self, month: str, limit: int = 20) -> Dict:
+        """
+        Close the month with both engines and diff the rows each would store
+        Nothing is written; an empty mismatch list means the vectorized
+        engine can replace the ORM close for this month
+        """
+        sponsors = dict(db.session.query(Reseller.id, Reseller.sponsor_id).all())
+        stored = {}
+        for engine in CLOSE_ENGINES:
+            results = self.calculate(month, engine)
+            stored[engine] = (
+                {row['reseller_id']: row for row in self._build_summaries(month, results, sponsors)},
+                self._lines_by_reseller(self._build_commission_lines(month, results))
+            )
+        
+        (orm_summaries, orm_lines), (vec_summaries, vec_lines) = stored['orm'], stored['vectorized']
+        mismatches = []
+        for reseller_id in sorted(set(orm_summaries) | set(vec_summaries)):
+            expected = (orm_summaries.get(reseller_id), orm_lines.get(reseller_id, []))
+            actual = (vec_summaries.get(reseller_id), vec_lines.get(reseller_id, []))
+            if expected != actual:
+                mismatches.append({'reseller_id': reseller_id, 'orm': expected, 'vectorized': actual})
+        
+        return {
+            'month': month,
+            'resellers': len(orm_summaries),
+            'mismatched': len(mismatches),
+            'mismatches': mismatches[:limit]
+        }
+    
+    def _lines_by_reseller(self, lines: List[Dict]) -> Dict[int, List[Dict]]:
+        grouped = {}
+        for line in lines:
+            grouped.setdefault(line['reseller_id'], []).append(line)
+        return grouped
+    
+    def persist(self, month: str, results: Dict[int, Dict]) -> Dict:
+        """Write one summary per reseller and one row per commission line"""
+        sponsors = dict(db.session.query(Reseller.id, Reseller.sponsor_id).all())
+        
+        summaries = self._build_summaries(month, results, sponsors)
+        lines = self._build_commission_lines(month, results)
+        
+        try:
+            CommissionCalculation.query.filter_by(month=month).delete(synchronize_session=False)
+            MonthlySummary.query.filter_by(month=month).delete(synchronize_session=False)
+            
+            # Deletes, every batch and the version bump commit together, so a
+            # failure part way leaves the previous close in place
+            self._bulk_insert(MonthlySummary, summaries)
+            self._bulk_insert(CommissionCalculation, lines)
+            
+            # Bulk rows bypass the flush hooks; publish the month once it is complete
+            bump_month_versions(month)
+            db.session.commit()
+            
+        except Exception as e:
+            db.session.rollback()
+            self.logger.error(f"Error persisting month close for {month}: {str(e)}")
+            raise
+        
+        self.logger.info(
+            f"Persisted {month}: {len(summaries)} summaries, {len(lines)} commission lines"
+        )
+        
+        return {
+            'month': month,
+            'summaries': len(summaries),
+            'commission_lines': len(lines),
+            'total_commissions': float(sum((row['total_commissions'] for row in summaries), Decimal('0')))
+        }
+    
+    def _bulk_insert(self, model, rows: List[Dict]):
+        """Insert rows with one executemany per batch; the caller commits"""
+        for start in range(0, len(rows), self.batch_size):
+            db.session.execute(db.insert(model), rows[start:start + self.batch_size])
+    
+    def _build_summaries(self, month: str, results: Dict[int, Dict],
+                         sponsors: Dict[int, int]) -> List[Dict]:
+        """Map close results onto MonthlySummary rows"""
+        active_downlines = {}
+        for reseller_id, result in results.items():
+            sponsor_id = sponsors.get(reseller_id)
+            if sponsor_id is not None and result['active_status']:
+                active_downlines[sponsor_id] = active_downlines.get(sponsor_id, 0) + 1
+        
+        rows = []
+        for reseller_id, result in results.items():
+            totals = {column: Decimal('0') for column in set(SUMMARY_BUCKETS.values())}
+            for line in result['commissions']:
+                column = SUMMARY_BUCKETS.get(line['type'])
+                if column:
+                    totals[column] += _to_money(line['amount'])
+            
+            qualifications = result['qualifications']
+            tier = (qualifications.get('group_override') or
+                    qualifications.get('bd_service_fee') or {}).get('tier')
+            promotion = qualifications.get('promotion') or {}
+            
+            rows.append({
+                'reseller_id': reseller_id,
+                'month': month,
+                'gppis': _to_money(result['gppis']),
+                'ggpis': _to_money(result['ggpis']),
+                # Sum of the stored (rounded) lines, whichever engine produced them
+                'total_commissions': sum(totals.values(), Decimal('0')),
+                'active_status': result['active_status'],
+                'group_override_tier': tier,
+                'active_downlines_count': active_downlines.get(reseller_id, 0),
+                'promotion_eligible': bool(promotion.get('eligible', False)),
+                **totals
+            })
+        
+        return rows
+    
+    def _build_commission_lines(self, month: str, results: Dict[int, Dict]) -> List[Dict]:
+        """Map every commission line onto a CommissionCalculation row"""
+        rows = []
+        for reseller_id, result in results.items():
+            for line in result['commissions']:
+                rows.append({
+                    'reseller_id': reseller_id,
+                    'source_reseller_id': None,
+                    'commission_type': line['type'],
+                    'month': month,
+                    'base_amount': _to_money(line['base_amount']),
+                    'commission_rate': Decimal(str(line['rate'])),
+                    'commission_amount': _to_money(line['amount']),
+                    'tier_name': line.get('tier') or line.get('product'),
+                    'notes': line.get('description')
+                })
+        
+        return rows
+
+def _to_money(value) -> Decimal:
+    """Round a computed amount to centavos for Numeric(12, 2) columns"""
+    return Decimal(str(value)).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
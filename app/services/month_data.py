@@ -0,0 +1,127 @@
+# app/services/month_data.py - Request-Scoped Month Sales Data
+
+from database.models import db, MonthlySales, product_breakdown
+from contextlib import contextmanager
+from contextvars import ContextVar
+from decimal import Decimal
+from typing import Dict, List, Optional, Tuple
+
+_current_month_data: ContextVar = ContextVar('month_data', default=None)
+
+def previous_month(month: str) -> str:
+    """Get previous month string (YYYY-MM format)"""
+    year, month_num = map(int, month.split('-'))
+    if month_num == 1:
+        return f"{year-1}-12"
+    else:
+        return f"{year}-{month_num-1:02d}"
+
+def month_range(start: str, end: str) -> List[str]:
+    """Months from start to end inclusive (YYYY-MM format)"""
+    start_year, start_month = map(int, start.split('-'))
+    end_year, end_month = map(int, end.split('-'))
+    if not (1 <= start_month <= 12 and 1 <= end_month <= 12):
+        raise ValueError(f"Invalid month range {start}..{end}")
+    
+    months = []
+    year, month_num = start_year, start_month
+    while (year, month_num) <= (end_year, end_month):
+        months.append(f"{year}-{month_num:02d}")
+        year, month_num = (year + 1, 1) if month_num == 12 else (year, month_num + 1)
+    
+    if not months:
+        raise ValueError(f"Month range {start}..{end} is empty")
+    return months
+
+class MonthDataContext:
+    """
+    GPPIS for whole months, loaded once and shared for the life of a
+    request or batch job. Loading a month also loads the month before it,
+    which promotion checks need.
+    """
+    
+    def __init__(self):
+        self._sales: Dict[str, Dict[int, Decimal]] = {}
+        self._products: Dict[str, Dict[int, Tuple[Decimal, Decimal, Decimal]]] = {}
+    
+    def load(self, months: List[str], with_previous: bool = True):
+        """Load any of the given months (plus their previous months) not yet loaded"""
+        wanted = []
+        for month in months:
+            candidates = (month, previous_month(month)) if with_previous else (month,)
+            for candidate in candidates:
+                if candidate not in self._sales and candidate not in wanted:
+                    wanted.append(candidate)
+        
+        if not wanted:
+            return
+        
+        rows = db.session.query(
+            MonthlySales.month,
+            MonthlySales.reseller_id,
+            MonthlySales.gppis,
+            MonthlySales.premium_sales,
+            MonthlySales.standard_sales,
+            MonthlySales.basic_sales
+        ).filter(MonthlySales.month.in_(wanted)).all()
+        
+        zero = Decimal('0')
+        loaded = {month: {} for month in wanted}
+        products = {month: {} for month in wanted}
+        for month, reseller_id, gppis, premium, standard, basic in rows:
+            loaded[month][reseller_id] = gppis if gppis is not None else zero
+            if premium or standard or basic:
+                products[month][reseller_id] = product_breakdown(gppis, (premium, standard, basic))
+        self._sales.update(loaded)
+        self._products.update(products)
+    
+    def sales(self, month: str) -> Dict[int, Decimal]:
+        """All GPPIS for a month keyed by reseller id"""
+        self.load([month])
+        return self._sales[month]
+    
+    def gppis(self, reseller_id: int, month: str) -> Decimal:
+        """GPPIS of one reseller for a month"""
+        return self.sales(month).get(reseller_id, Decimal('0'))
+    
+    def product_sales(self, month: str) -> Dict[int, Tuple[Decimal, Decimal, Decimal]]:
+        """
+        (premium, standard, basic) sales for a month, for rows that record any;
+        the part of GPPIS the columns do not cover is split by default
+        """
+        self.load([month])
+        return self._products[month]
+    
+    def invalidate(self, month: str = None):
+        """Forget loaded months after a sales write"""
+        if month:
+            self._sales.pop(month, None)
+            self._products.pop(month, None)
+        else:
+            self._sales.clear()
+            self._products.clear()
+
+def current_month_data() -> Optional[MonthDataContext]:
+    """The month data context active for this request or job, if any"""
+    return _current_month_data.get()
+
+def activate_month_data(context: MonthDataContext = None):
+    """Make a context current; returns a token for deactivate_month_data"""
+    return _current_month_data.set(context or MonthDataContext())
+
+def deactivate_month_data(token):
+    _current_month_data.reset(token)
+
+@contextmanager
+def month_data_scope():
+    """Reuse the active context, or provide one for the duration of the block"""
+    context = current_month_data()
+    if context is not None:
+        yield context
+        return
+    
+    token = activate_month_data()
+    try:
+        yield current_month_data()
+    finally:
+        deactivate_month_data(token)
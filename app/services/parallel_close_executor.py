@@ -0,0 +1,169 @@
+# app/services/parallel_close_executor.py - Parallel Month-End Close
+
+from services.commission_engine import CommissionEngine, NetworkNode
+from services.rule_plan import CompiledRulePlan, get_rule_plan, use_rule_plan
+from config import Config
+from concurrent.futures import ProcessPoolExecutor
+from decimal import Decimal
+from typing import Dict, List, Set, Tuple
+import heapq
+import logging
+import multiprocessing
+
+# More partitions than workers keeps every worker busy when subtrees are uneven
+PARTITIONS_PER_WORKER = 4
+
+class ParallelCloseExecutor:
+    """
+    Month-end close spread over a process pool.
+    The network is cut into balanced subtree partitions that workers close
+    independently; sponsors above the cuts are closed afterwards in this
+    process from the (GGPIS, active IBO) figures returned for each cut.
+    """
+    
+    def __init__(self, commission_engine: CommissionEngine = None, workers: int = None):
+        self.commission_engine = commission_engine or CommissionEngine()
+        self.workers = workers or Config.MONTH_CLOSE_WORKERS
+        self.min_resellers = Config.MONTH_CLOSE_PARALLEL_MIN_RESELLERS
+        self.logger = logging.getLogger(__name__)
+    
+    def close_month(self, month: str) -> Dict[int, Dict]:
+        """Calculate commissions for every reseller, in parallel when worthwhile"""
+        engine = self.commission_engine
+        
+        nodes, children = engine._load_network()
+        if self.workers <= 1 or len(nodes) < self.min_resellers:
+            return engine.close_month(month)
+        
+        with use_rule_plan(get_rule_plan(month)) as plan:
+            return self._close_partitioned(month, nodes, children, plan)
+    
+    def _close_partitioned(self, month: str, nodes: Dict[int, NetworkNode],
+                           children: Dict[int, List[int]], plan: CompiledRulePlan) -> Dict[int, Dict]:
+        engine = self.commission_engine
+        prev_month = engine._get_previous_month(month)
+        sales = engine._load_sales([month, prev_month])
+        month_sales, prev_sales = sales[month], sales[prev_month]
+        product_sales = engine._load_product_sales(month)
+        
+        order, unreachable = engine._post_order(nodes, children)
+        sizes = self._subtree_sizes(order, children)
+        
+        target = max(1, len(order) // (self.workers * PARTITIONS_PER_WORKER))
+        units, top = self._split(nodes, children, sizes, target)
+        partitions = self._pack(units, sizes, self.workers * PARTITIONS_PER_WORKER)
+        
+        payloads = [
+            self._build_payload(month, roots, nodes, children, month_sales, prev_sales,
+                                product_sales, plan)
+            for roots in partitions
+        ]
+        
+        results = {}
+        seeded = {}
+        context = multiprocessing.get_context(Config.MONTH_CLOSE_START_METHOD)
+        with ProcessPoolExecutor(max_workers=self.workers, mp_context=context) as pool:
+            for partition_results, partition_roots in pool.map(_close_partition, payloads):
+                results.update(partition_results)
+                seeded.update(partition_roots)
+        
+        # Sponsors above the cuts, still in post-order
+        top_order = [reseller_id for reseller_id in order if reseller_id in top]
+        results.update(engine._close_nodes(
+            top_order, nodes, children, month, month_sales, prev_sales, seeded, product_sales
+        ))
+        
+        for reseller_id in unreachable:
+            self.logger.warning(f"Reseller {reseller_id} is not reachable from a root sponsor")
+            results[reseller_id] = engine.calculate_monthly_commissions(reseller_id, month)
+        
+        self.logger.info(
+            f"Closed {month} for {len(results)} resellers across {len(payloads)} partitions "
+            f"on {self.workers} workers ({len(top_order)} sponsors closed above the cuts)"
+        )
+        
+        return results
+    
+    def _subtree_sizes(self, order: List[int], children: Dict[int, List[int]]) -> Dict[int, int]:
+        """Number of resellers in each subtree, from a post-order"""
+        sizes = {}
+        for reseller_id in order:
+            sizes[reseller_id] = 1 + sum(sizes[c] for c in children.get(reseller_id, []))
+        return sizes
+    
+    def _split(self, nodes: Dict[int, NetworkNode], children: Dict[int, List[int]],
+               sizes: Dict[int, int], target: int) -> Tuple[List[int], Set[int]]:
+        """
+        Cut the forest into subtrees of at most target resellers
+        Returns the subtree roots and the sponsors left above the cuts
+        """
+        units = []
+        top = set()
+        stack = [n.id for n in nodes.values() if n.sponsor_id not in nodes and n.id in sizes]
+        
+        while stack:
+            reseller_id = stack.pop()
+            if sizes[reseller_id] <= target or not children.get(reseller_id):
+                units.append(reseller_id)
+            else:
+                top.add(reseller_id)
+                stack.extend(children[reseller_id])
+        
+        return units, top
+    
+    def _pack(self, units: List[int], sizes: Dict[int, int], count: int) -> List[List[int]]:
+        """Spread subtrees over partitions, largest first onto the lightest"""
+        heap = [(0, index, []) for index in range(min(count, len(units)))]
+        for reseller_id in sorted(units, key=lambda r: sizes[r], reverse=True):
+            load, index, roots = heapq.heappop(heap)
+            roots.append(reseller_id)
+            heapq.heappush(heap, (load + sizes[reseller_id], index, roots))
+        
+        return [roots for _, _, roots in heap if roots]
+    
+    def _build_payload(self, month: str, roots: List[int], nodes: Dict[int, NetworkNode],
+                       children: Dict[int, List[int]], sales: Dict[int, Decimal],
+                       prev_sales: Dict[int, Decimal],
+                       product_sales: Dict[int, Tuple[Decimal, Decimal, Decimal]],
+                       plan: CompiledRulePlan) -> Tuple:
+        """Collect the detached data a worker needs for its subtrees"""
+        part_nodes = {}
+        part_children = {}
+        stack = list(roots)
+        
+        while stack:
+            reseller_id = stack.pop()
+            part_nodes[reseller_id] = nodes[reseller_id]
+            kids = children.get(reseller_id, [])
+            if kids:
+                part_children[reseller_id] = kids
+                stack.extend(kids)
+        
+        return (
+            month,
+            roots,
+            part_nodes,
+            part_children,
+            {r: sales[r] for r in part_nodes if r in sales},
+            {r: prev_sales[r] for r in part_nodes if r in prev_sales},
+            {r: product_sales[r] for r in part_nodes if r in product_sales},
+            plan
+        )
+
+def _close_partition(payload: Tuple) -> Tuple[Dict[int, Dict], Dict[int, Tuple[Decimal, int]]]:
+    """
+    Worker entry point: close a set of whole subtrees without touching the database
+    Returns their results plus (ggpis, active_ibos) for each subtree root
+    """
+    month, roots, nodes, children, sales, prev_sales, product_sales, plan = payload
+    
+    engine = CommissionEngine()
+    
+    with use_rule_plan(plan):
+        order, _ = engine._post_order(nodes, children)
+        ggpis, active_ibos = engine._aggregate_nodes(order, nodes, children, sales)
+        results = engine._close_aggregated(
+            order, nodes, children, month, sales, prev_sales, ggpis, active_ibos, product_sales
+        )
+    
+    return results, {r: (ggpis[r], active_ibos[r]) for r in roots}
@@ -0,0 +1,222 @@
+# app/services/rule_plan.py - Compiled, Effective-Dated Commission Rules
+
+from database.models import db, CommissionRule, GroupSalesAggregate
+from config import Config
+from bisect import bisect_right
+from calendar import monthrange
+from collections import namedtuple
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import date
+from decimal import Decimal
+from sqlalchemy import event
+from types import MappingProxyType
+from typing import Dict, List, Optional
+import copy
+import logging
+import threading
+
+GroupOverrideTier = namedtuple('GroupOverrideTier', ['key', 'name', 'min_active_bps', 'min_ggpis', 'rate'])
+ServiceFeeTier = namedtuple('ServiceFeeTier', ['key', 'name', 'min_ggpis', 'rate'])
+RuleRow = namedtuple('RuleRow', ['id', 'name', 'rule_type', 'level', 'product_category',
+                                 'parameters', 'effective_date'])
+
+logger = logging.getLogger(__name__)
+
+def _decimal(value) -> Decimal:
+    return Decimal(str(value))
+
+class CompiledRulePlan:
+    """
+    Immutable lookup tables built once from a rules dict: Decimal
+    thresholds and rates, per-level product rate maps and tier
+    breakpoints sorted for bisect lookups
+    """
+    
+    def __init__(self, rules: Dict, effective_date: Optional[date] = None):
+        self.rules = rules
+        self.effective_date = effective_date
+        
+        self.active_thresholds = MappingProxyType({
+            key: _decimal(value) for key, value in rules['active_thresholds'].items()
+        })
+        
+        outright = {}
+        for product, rates in rules['outright_discount'].items():
+            for level, rate in rates.items():
+                outright.setdefault(level, {})[product] = _decimal(rate)
+        self.outright_rates = MappingProxyType({
+            level: MappingProxyType(rates) for level, rates in outright.items()
+        })
+        
+        self.group_override_tiers = tuple(sorted((
+            GroupOverrideTier(key, key.title(), tier['min_active_bps'],
+                              _decimal(tier['min_ggpis']), _decimal(tier['rate']))
+            for key, tier in rules['group_override'].items()
+        ), key=lambda tier: tier.min_ggpis))
+        self._group_override_breakpoints = tuple(t.min_ggpis for t in self.group_override_tiers)
+        
+        service_fee = rules['bd_service_fee']
+        self.service_fee_tiers = tuple(sorted((
+            ServiceFeeTier(key, f"Tier {key[-1]}", _decimal(tier['min_ggpis']), _decimal(tier['rate']))
+            for key, tier in service_fee.items() if key.startswith('tier')
+        ), key=lambda tier: tier.min_ggpis))
+        self._service_fee_breakpoints = tuple(t.min_ggpis for t in self.service_fee_tiers)
+        self.service_fee_min_active_ibos = service_fee['min_active_ibos']
+        
+        self.lifetime_rate = _decimal(rules['lifetime_incentive']['rate'])
+        self.lifetime_min_gppis = _decimal(rules['lifetime_incentive']['min_gppis'])
+        self.bd_override_rate = _decimal(rules['bd_override']['rate'])
+        self.bd_override_min_ggpis = _decimal(rules['bd_override']['min_ggpis_both'])
+        self.promotion_threshold = _decimal(rules['promotion']['bp_to_ibo_threshold'])
+    
+    def __reduce__(self):
+        # MappingProxyType does not pickle; rebuild from the rules dict instead
+        return (CompiledRulePlan, (self.rules, self.effective_date))
+    
+    def group_override_tier(self, active_bps: int, ggpis: Decimal) -> Optional[GroupOverrideTier]:
+        """Highest tier met on both GGPIS and active BP count"""
+        index = bisect_right(self._group_override_breakpoints, ggpis) - 1
+        while index >= 0:
+            tier = self.group_override_tiers[index]
+            if active_bps >= tier.min_active_bps:
+                return tier
+            index -= 1
+        return None
+    
+    def service_fee_tier(self, ggpis: Decimal) -> Optional[ServiceFeeTier]:
+        """Highest BD service fee tier reached by GGPIS"""
+        index = bisect_right(self._service_fee_breakpoints, ggpis) - 1
+        return self.service_fee_tiers[index] if index >= 0 else None
+
+def _apply_rule(rules: Dict, rule: RuleRow):
+    """Overlay one CommissionRule row onto a Config-shaped rules dict"""
+    params = rule.parameters or {}
+    
+    if rule.rule_type == 'outright_discount':
+        rules['outright_discount'].setdefault(rule.product_category, {})[rule.level] = params['rate']
+    elif rule.rule_type == 'group_override':
+        tier = rules['group_override'].setdefault(params['tier'], {})
+        tier.update({k: params[k] for k in ('min_active_bps', 'min_ggpis', 'rate') if k in params})
+    elif rule.rule_type == 'bd_service_fee':
+        tier = rules['bd_service_fee'].setdefault(f"tier{params['tier']}", {})
+        tier.update({k: params[k] for k in ('min_ggpis', 'rate') if k in params})
+        if 'min_active_ibos' in params:
+            rules['bd_service_fee']['min_active_ibos'] = params['min_active_ibos']
+    elif rule.rule_type == 'lifetime_incentive':
+        incentive = rules['lifetime_incentive']
+        if 'rate' in params:
+            incentive['rate'] = params['rate']
+        if 'min_gppis' in params or 'min_gppis_both' in params:
+            incentive['min_gppis'] = params.get('min_gppis', params.get('min_gppis_both'))
+    elif rule.rule_type == 'bd_override':
+        rules['bd_override'].update(params)
+    elif rule.rule_type == 'active_threshold':
+        rules['active_thresholds'][rule.level] = params['threshold']
+    elif rule.rule_type == 'promotion':
+        rules['promotion'].update(params)
+    else:
+        logger.warning(f"Ignoring unknown commission rule type '{rule.rule_type}' ({rule.name})")
+
+def _rule_key(rule: RuleRow):
+    """Rows sharing a key supersede each other by effective date"""
+    params = rule.parameters or {}
+    return (rule.rule_type, rule.level, rule.product_category, params.get('tier'))
+
+def compile_rule_plan(rules: List[RuleRow], effective_date: Optional[date]) -> CompiledRulePlan:
+    """Compile Config defaults overlaid with the rows in effect"""
+    compiled = copy.deepcopy(Config.COMMISSION_RULES)
+    
+    latest = {}
+    for rule in sorted(rules, key=lambda r: (r.effective_date or date.min, r.id)):
+        latest[_rule_key(rule)] = rule
+    for rule in latest.values():
+        try:
+            _apply_rule(compiled, rule)
+        except (KeyError, TypeError) as e:
+            logger.error(f"Skipping malformed commission rule {rule.id} ({rule.name}): {str(e)}")
+    
+    return CompiledRulePlan(compiled, effective_date)
+
+class RulePlanCache:
+    """
+    Compiled plans cached per effective period. The active rule rows are
+    loaded once; any CommissionRule write drops everything and moves the
+    generation on, so results cached against older rules stop matching.
+    """
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.generation = 0
+        self.clear()
+    
+    def clear(self):
+        self._rules = None
+        self._periods = []
+        self._plans = {}
+        self.generation += 1
+    
+    def get(self, month: Optional[str] = None) -> CompiledRulePlan:
+        with self._lock:
+            if self._rules is None:
+                self._rules = _load_rules()
+                self._periods = sorted({r.effective_date or date.min for r in self._rules})
+            
+            cutoff = _month_end(month) if month else date.today()
+            index = bisect_right(self._periods, cutoff)
+            period = self._periods[index - 1] if index else None
+            
+            plan = self._plans.get(period)
+            if plan is None:
+                in_effect = [r for r in self._rules if (r.effective_date or date.min) <= cutoff]
+                plan = compile_rule_plan(in_effect, period)
+                self._plans[period] = plan
+            return plan
+
+def _load_rules() -> List[RuleRow]:
+    """Active rule rows as plain tuples, safe to keep across sessions"""
+    rows = db.session.query(
+        CommissionRule.id, CommissionRule.name, CommissionRule.rule_type,
+        CommissionRule.level, CommissionRule.product_category,
+        CommissionRule.parameters, CommissionRule.effective_date
+    ).filter(CommissionRule.active.is_(True)).all()
+    return [RuleRow(*row) for row in rows]
+
+def _month_end(month: str) -> date:
+    year, month_num = map(int, month.split('-'))
+    return date(year, month_num, monthrange(year, month_num)[1])
+
+_cache = RulePlanCache()
+_active_plan: ContextVar = ContextVar('rule_plan', default=None)
+
+def get_rule_plan(month: Optional[str] = None) -> CompiledRulePlan:
+    """Compiled rules in effect for a month (today's rules when no month is given)"""
+    return _cache.get(month)
+
+def invalidate_rule_plans():
+    """Drop compiled plans; the next lookup reloads CommissionRule rows"""
+    _cache.clear()
+
+def rules_version() -> int:
+    """Counter bumped whenever the compiled rules are dropped in this process"""
+    return _cache.generation
+
+def current_rule_plan() -> Optional[CompiledRulePlan]:
+    return _active_plan.get()
+
+@contextmanager
+def use_rule_plan(plan: CompiledRulePlan):
+    """Make a plan current for the engine calls inside the block"""
+    token = _active_plan.set(plan)
+    try:
+        yield plan
+    finally:
+        _active_plan.reset(token)
+
+@event.listens_for(CommissionRule, 'after_insert')
+@event.listens_for(CommissionRule, 'after_update')
+@event.listens_for(CommissionRule, 'after_delete')
+def _rules_changed(mapper, connection, target):
+    # Stored tiers and active counts were derived from the old rules
+    connection.execute(GroupSalesAggregate.__table__.delete())
+    invalidate_rule_plans()
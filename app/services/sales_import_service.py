@@ -0,0 +1,208 @@
+# app/services/sales_import_service.py - Bulk Monthly Sales Import
+
+from database.models import (
+    db, Reseller, MonthlySales, DEFAULT_PRODUCT_SPLIT, SALES_PRODUCT_COLUMNS,
+    bump_month_versions, bump_reseller_versions, monthly_sales_upsert
+)
+from services.group_sales_service import GroupSalesService
+from services.hierarchy_index import get_hierarchy_index
+from services.month_data import current_month_data
+from config import Config
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+from typing import Dict, Iterable, Iterator, List, Optional, TextIO, Tuple
+import csv
+import itertools
+import json
+import logging
+
+# Product columns a sales row may carry; without any, GPPIS is split by DEFAULT_PRODUCT_SPLIT
+PRODUCT_COLUMNS = tuple(SALES_PRODUCT_COLUMNS.values())
+
+class SalesImportService:
+    """
+    Streams CSV or JSONL sales rows into MonthlySales.
+    Imported amounts replace the manually entered part of each row; sales
+    booked through the ledger stay on top of them. Rows are validated and
+    upserted a chunk at a time with executemany; the group sales recompute
+    is deferred to the end of the batch and applied once per affected
+    month, so a shared upline is updated once.
+    """
+    
+    def __init__(self, group_sales_service: GroupSalesService = None):
+        self.group_sales_service = group_sales_service or GroupSalesService()
+        self.hierarchy_index = get_hierarchy_index()
+        self.chunk_size = Config.SALES_IMPORT_CHUNK_SIZE
+        self.logger = logging.getLogger(__name__)
+    
+    def read_rows(self, stream: TextIO, fmt: str) -> Iterator[Tuple[int, Dict]]:
+        """Yield (line number, raw row) from a CSV or JSONL text stream"""
+        if fmt == 'csv':
+            reader = csv.DictReader(stream)
+            for row in reader:
+                yield reader.line_num, row
+        elif fmt == 'jsonl':
+            for line_no, line in enumerate(stream, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    row = json.loads(line)
+                except ValueError:
+                    row = None
+                yield line_no, row if isinstance(row, dict) else {'_invalid': 'not a JSON object'}
+        else:
+            raise ValueError(f"Unsupported format: {fmt}")
+    
+    def import_rows(self, rows: Iterable[Tuple[int, Dict]]) -> Dict:
+        """
+        Validate and upsert (line number, row) pairs, then recompute once
+        Invalid rows are skipped and reported; the rest commit together
+        """
+        codes = dict(db.session.query(Reseller.employee_code, Reseller.id).all())
+        known_ids = set(codes.values())
+        
+        # (reseller_id, month) -> (GPPIS before the batch, GPPIS after it)
+        changes: Dict[Tuple[int, str], Tuple[Decimal, Decimal]] = {}
+        summary = {'rows': 0, 'inserted': 0, 'updated': 0, 'rejected': 0, 'errors': []}
+        
+        try:
+            rows = iter(rows)
+            while True:
+                chunk = list(itertools.islice(rows, self.chunk_size))
+                if not chunk:
+                    break
+                
+                valid = {}
+                for line_no, raw in chunk:
+                    summary['rows'] += 1
+                    try:
+                        record = self._validate(raw, codes, known_ids)
+                    except ValueError as e:
+                        summary['rejected'] += 1
+                        if len(summary['errors']) < Config.SALES_IMPORT_MAX_ERRORS:
+                            summary['errors'].append({'line': line_no, 'error': str(e)})
+                        continue
+                    # Later rows for the same reseller and month win
+                    valid[(record['reseller_id'], record['month'])] = record
+                
+                inserted, updated = self._upsert_chunk(valid, changes)
+                summary['inserted'] += inserted
+                summary['updated'] += updated
+            
+            months = sorted({month for _, month in changes})
+            self._recompute(months, changes)
+            if months:
+                bump_month_versions(*months)
+                bump_reseller_versions(*{reseller_id for reseller_id, _ in changes})
+            db.session.commit()
+        
+        except Exception as e:
+            db.session.rollback()
+            self.logger.error(f"Error importing sales: {str(e)}")
+            raise
+        
+        self.hierarchy_index.on_sales_changes({key: new_gppis for key, (_, new_gppis) in changes.items()})
+        
+        summary['months'] = months
+        self.logger.info(
+            f"Imported {summary['inserted'] + summary['updated']} sales rows for {', '.join(months) or 'no months'} "
+            f"({summary['inserted']} new, {summary['updated']} updated, {summary['rejected']} rejected)"
+        )
+        return summary
+    
+    def import_stream(self, stream: TextIO, fmt: str) -> Dict:
+        """Import a whole CSV or JSONL text stream"""
+        return self.import_rows(self.read_rows(stream, fmt))
+    
+    def _validate(self, raw: Dict, codes: Dict[str, int], known_ids: set) -> Dict:
+        """Normalize one row into MonthlySales column values"""
+        if '_invalid' in raw:
+            raise ValueError(raw['_invalid'])
+        
+        employee_code = (raw.get('employee_code') or '').strip()
+        if employee_code:
+            reseller_id = codes.get(employee_code)
+            if reseller_id is None:
+                raise ValueError(f"Unknown employee_code {employee_code}")
+        else:
+            try:
+                reseller_id = int(raw.get('reseller_id'))
+            except (TypeError, ValueError):
+                raise ValueError("employee_code or reseller_id is required")
+            if reseller_id not in known_ids:
+                raise ValueError(f"Unknown reseller_id {reseller_id}")
+        
+        month = str(raw.get('month') or '').strip()
+        try:
+            datetime.strptime(month, '%Y-%m')
+        except ValueError:
+            raise ValueError(f"Invalid month {month!r}")
+        
+        gppis = self._amount(raw.get('gppis', raw.get('amount')), 'gppis')
+        if gppis is None:
+            raise ValueError("gppis is required")
+        
+        record = {'reseller_id': reseller_id, 'month': month, 'gppis': gppis}
+        products = [self._amount(raw.get(column), column) for column in PRODUCT_COLUMNS]
+        if all(amount is None for amount in products):
+            products = [gppis * share for share in DEFAULT_PRODUCT_SPLIT]
+        for column, amount in zip(PRODUCT_COLUMNS, products):
+            record[column] = amount if amount is not None else Decimal('0')
+        
+        return record
+    
+    def _amount(self, value, column: str) -> Optional[Decimal]:
+        if value is None or (isinstance(value, str) and not value.strip()):
+            return None
+        try:
+            amount = Decimal(str(value).strip())
+        except InvalidOperation:
+            raise ValueError(f"Invalid {column} {value!r}")
+        if not amount.is_finite() or amount < 0:
+            raise ValueError(f"Invalid {column} {value!r}")
+        return amount.quantize(Decimal('0.01'))
+    
+    def _upsert_chunk(self, records: Dict[Tuple[int, str], Dict],
+                      changes: Dict[Tuple[int, str], Tuple[Decimal, Decimal]]) -> Tuple[int, int]:
+        """Write one chunk: one lookup, then a single executemany upsert"""
+        if not records:
+            return 0, 0
+        
+        existing = {
+            (reseller_id, month): (gppis, manual_gppis)
+            for reseller_id, month, gppis, manual_gppis in db.session.query(
+                MonthlySales.reseller_id, MonthlySales.month, MonthlySales.gppis,
+                MonthlySales.manual_gppis
+            ).filter(
+                MonthlySales.month.in_({month for _, month in records}),
+                MonthlySales.reseller_id.in_({reseller_id for reseller_id, _ in records})
+            )
+        }
+        
+        now = datetime.utcnow()
+        rows = []
+        for key, record in records.items():
+            old_gppis, old_manual = existing.get(key) or (Decimal('0'), Decimal('0'))
+            before = changes[key][0] if key in changes else old_gppis
+            changes[key] = (before, (old_gppis or 0) - old_manual + record['gppis'])
+            rows.append(dict(record, previous_gppis=Decimal('0'), version=1,
+                             created_at=now, updated_at=now))
+        
+        # ON CONFLICT keeps concurrent writers from racing into the unique constraint
+        db.session.execute(monthly_sales_upsert(), rows)
+        
+        updated = sum(1 for key in records if key in existing)
+        return len(records) - updated, updated
+    
+    def _recompute(self, months: List[str], changes: Dict[Tuple[int, str], Tuple[Decimal, Decimal]]):
+        """Push the batch's net GPPIS changes into the group sales aggregate, once per month"""
+        month_data = current_month_data()
+        for month in months:
+            if month_data:
+                month_data.invalidate(month)
+            month_changes = {
+                reseller_id: (old_gppis, new_gppis)
+                for (reseller_id, changed_month), (old_gppis, new_gppis) in changes.items()
+                if changed_month == month and old_gppis != new_gppis
+            }
+            self.group_sales_service.apply_sales_changes(month, month_changes)
@@ -0,0 +1,129 @@
+# app/services/sales_ledger_service.py - Transaction-Level Sales Ledger
+
+from database.models import (
+    db, Reseller, MonthlySales, SalesTransaction, SALES_PRODUCT_COLUMNS, SALES_STATUSES
+)
+from services.group_sales_service import GroupSalesService
+from services.hierarchy_index import get_hierarchy_index
+from services.month_data import current_month_data
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+from typing import Dict, List, Optional
+import logging
+
+def parse_sale_amount(amount) -> Decimal:
+    """A positive sale amount rounded to centavos; ValueError otherwise"""
+    try:
+        value = Decimal(str(amount).strip())
+    except InvalidOperation:
+        raise ValueError(f"Invalid amount {amount!r}")
+    if not value.is_finite() or value <= 0:
+        raise ValueError(f"Invalid amount {amount!r}")
+    return value.quantize(Decimal('0.01'))
+
+class SalesLedgerService:
+    """
+    Records individual sales. Confirmed sales roll up into MonthlySales
+    (GPPIS and the product columns) through the SalesTransaction mapper
+    events, one additive upsert per sale; the resulting GPPIS changes are
+    then pushed up the upline chain, so no write ever rescans a month.
+    """
+    
+    def __init__(self, group_sales_service: GroupSalesService = None):
+        self.group_sales_service = group_sales_service or GroupSalesService()
+        self.hierarchy_index = get_hierarchy_index()
+        self.logger = logging.getLogger(__name__)
+    
+    def record_sale(self, reseller_id: int, product: str, amount, status: str = 'confirmed',
+                    sale_type: Optional[str] = None, transacted_at: Optional[datetime] = None) -> Dict:
+        """Book one sale and return it with the reseller's updated month"""
+        if not Reseller.query.get(reseller_id):
+            raise ValueError(f"Reseller {reseller_id} not found")
+        if product not in SALES_PRODUCT_COLUMNS:
+            raise ValueError(f"Unknown product {product!r}")
+        self._check_status(status)
+        
+        sale = SalesTransaction(
+            reseller_id=reseller_id,
+            product=product,
+            amount=parse_sale_amount(amount),
+            status=status,
+            sale_type=sale_type,
+            transacted_at=transacted_at or datetime.utcnow()
+        )
+        
+        try:
+            db.session.add(sale)
+            self._commit_rollup()
+        except Exception as e:
+            self.logger.error(f"Error recording sale for reseller {reseller_id}: {str(e)}")
+            raise
+        
+        self.logger.info(f"Recorded {status} {product} sale for reseller {reseller_id}: ₱{sale.amount:,.2f}")
+        return self._sale_result(sale)
+    
+    def set_status(self, transaction_id: int, status: str) -> Dict:
+        """Confirm, hold or cancel a sale; the rollup follows"""
+        self._check_status(status)
+        sale = SalesTransaction.query.get(transaction_id)
+        if not sale:
+            raise ValueError(f"Sales transaction {transaction_id} not found")
+        
+        try:
+            sale.status = status
+            self._commit_rollup()
+        except Exception as e:
+            self.logger.error(f"Error updating sales transaction {transaction_id}: {str(e)}")
+            raise
+        
+        return self._sale_result(sale)
+    
+    def get_transactions(self, reseller_id: int, month: str) -> List[Dict]:
+        """A reseller's sales for a month, oldest first"""
+        sales = SalesTransaction.query.filter_by(
+            reseller_id=reseller_id,
+            month=month
+        ).order_by(SalesTransaction.transacted_at, SalesTransaction.id).all()
+        
+        return [sale.to_dict() for sale in sales]
+    
+    def _commit_rollup(self):
+        """Flush (the rollup runs in the mapper events), push changes upline, commit"""
+        try:
+            db.session.flush()
+            changes = db.session.info.pop('sales_rollup', {})
+            
+            month_data = current_month_data()
+            by_month = {}
+            for (reseller_id, month), (old_gppis, new_gppis) in changes.items():
+                by_month.setdefault(month, {})[reseller_id] = (old_gppis, new_gppis)
+            for month, month_changes in by_month.items():
+                if month_data:
+                    month_data.invalidate(month)
+                self.group_sales_service.apply_sales_changes(month, {
+                    reseller_id: change for reseller_id, change in month_changes.items()
+                    if change[0] != change[1]
+                })
+            
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            db.session.info.pop('sales_rollup', None)
+            raise
+        
+        self.hierarchy_index.on_sales_changes({key: new_gppis for key, (_, new_gppis) in changes.items()})
+    
+    def _sale_result(self, sale: SalesTransaction) -> Dict:
+        monthly_sales = MonthlySales.query.filter_by(
+            reseller_id=sale.reseller_id,
+            month=sale.month
+        ).populate_existing().first()
+        
+        return {
+            'transaction': sale.to_dict(),
+            'monthly_sales': monthly_sales.to_dict() if monthly_sales else None
+        }
+    
+    def _check_status(self, status: str):
+        if status not in SALES_STATUSES:
+            raise ValueError(f"Unknown status {status!r}")
@@ -0,0 +1,329 @@
+# app/services/search_index.py - Reseller Name/Email/Code Search Index
+
+from database.models import db, Reseller
+from config import Config
+from abc import ABC, abstractmethod
+from bisect import bisect_left, bisect_right
+from sqlalchemy import event, text
+from typing import Dict, List, Optional, Tuple
+import logging
+import re
+import threading
+
+logger = logging.getLogger(__name__)
+
+def tokenize(value: Optional[str]) -> List[str]:
+    """Lowercase alphanumeric runs; 'maria.santos@sunx.ph' -> maria, santos, sunx, ph"""
+    return re.findall(r'[0-9a-z]+', (value or '').lower())
+
+class ResellerSearchIndex(ABC):
+    """
+    Prefix search over first/last name, email and employee_code.
+    Every query token must prefix-match some indexed token. Matches on
+    name or code rank ahead of email-only matches, best match first within
+    a tier; the email tier is only searched when the first runs short.
+    """
+    
+    def ensure(self):
+        """Create whatever database objects the backend needs"""
+        pass
+    
+    @abstractmethod
+    def search(self, query: str, limit: int = 20) -> List[int]:
+        """Ids of the best `limit` matches, best first"""
+
+class SqliteFtsSearchIndex(ResellerSearchIndex):
+    """
+    FTS5 external-content table over resellers, kept in step by triggers
+    Prefix indexes on 2 and 3 characters keep short typeahead queries cheap
+    """
+    
+    TRIGGERS = {
+        'reseller_search_ai': (
+            "CREATE TRIGGER IF NOT EXISTS reseller_search_ai AFTER INSERT ON resellers BEGIN "
+            "INSERT INTO reseller_search(rowid, first_name, last_name, email, employee_code) "
+            "VALUES (new.id, new.first_name, new.last_name, new.email, new.employee_code); END"
+        ),
+        'reseller_search_ad': (
+            "CREATE TRIGGER IF NOT EXISTS reseller_search_ad AFTER DELETE ON resellers BEGIN "
+            "INSERT INTO reseller_search(reseller_search, rowid, first_name, last_name, email, employee_code) "
+            "VALUES ('delete', old.id, old.first_name, old.last_name, old.email, old.employee_code); END"
+        ),
+        'reseller_search_au': (
+            "CREATE TRIGGER IF NOT EXISTS reseller_search_au "
+            "AFTER UPDATE OF first_name, last_name, email, employee_code ON resellers BEGIN "
+            "INSERT INTO reseller_search(reseller_search, rowid, first_name, last_name, email, employee_code) "
+            "VALUES ('delete', old.id, old.first_name, old.last_name, old.email, old.employee_code); "
+            "INSERT INTO reseller_search(rowid, first_name, last_name, email, employee_code) "
+            "VALUES (new.id, new.first_name, new.last_name, new.email, new.employee_code); END"
+        )
+    }
+    
+    def ensure(self):
+        existing = {name for (name,) in db.session.execute(text(
+            "SELECT name FROM sqlite_master WHERE type = 'trigger' AND name LIKE 'reseller_search_%'"
+        ))}
+        db.session.execute(text(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS reseller_search USING fts5("
+            "first_name, last_name, email, employee_code, "
+            "content='resellers', content_rowid='id', prefix='2 3')"
+        ))
+        for name, ddl in self.TRIGGERS.items():
+            db.session.execute(text(ddl))
+        
+        # Triggers missing means rows may have changed untracked (new or reset database)
+        if existing != set(self.TRIGGERS):
+            db.session.execute(text("INSERT INTO reseller_search(reseller_search) VALUES ('rebuild')"))
+        db.session.commit()
+    
+    def search(self, query: str, limit: int = 20) -> List[int]:
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+        
+        terms = ' AND '.join(f'"{token}"*' for token in tokens)
+        tiers = [f'{{first_name last_name employee_code}} : ({terms})', terms]
+        
+        # bm25 ranks within a tier (lower is better); rowid breaks ties
+        reseller_ids = []
+        for match in tiers:
+            rows = db.session.execute(text(
+                "SELECT rowid FROM reseller_search WHERE reseller_search MATCH :match "
+                "ORDER BY bm25(reseller_search), rowid LIMIT :limit"
+            ), {'match': match, 'limit': limit})
+            for (reseller_id,) in rows:
+                if reseller_id not in reseller_ids:
+                    reseller_ids.append(reseller_id)
+            if len(reseller_ids) >= limit:
+                break
+        return reseller_ids[:limit]
+
+class PostgresTrigramSearchIndex(ResellerSearchIndex):
+    """
+    pg_trgm GIN index over the lowercased search text
+    LIKE '%token%' per token is served by the index; word_similarity ranks
+    """
+    
+    SEARCH_TEXT = "lower(first_name || ' ' || last_name || ' ' || email || ' ' || employee_code)"
+    
+    def ensure(self):
+        db.session.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+        db.session.execute(text(
+            f"CREATE INDEX IF NOT EXISTS ix_resellers_search_trgm ON resellers "
+            f"USING gin (({self.SEARCH_TEXT}) gin_trgm_ops)"
+        ))
+        db.session.commit()
+    
+    def search(self, query: str, limit: int = 20) -> List[int]:
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+        
+        # Tokens are [0-9a-z]+, so they never carry LIKE wildcards
+        params = {f'token{i}': f'%{token}%' for i, token in enumerate(tokens)}
+        conditions = ' AND '.join(f"{self.SEARCH_TEXT} LIKE :token{i}" for i in range(len(tokens)))
+        params.update({'query': ' '.join(tokens), 'limit': limit})
+        
+        rows = db.session.execute(text(
+            f"SELECT id FROM resellers WHERE {conditions} "
+            f"ORDER BY word_similarity(:query, {self.SEARCH_TEXT}) DESC, id LIMIT :limit"
+        ), params)
+        return [reseller_id for (reseller_id,) in rows]
+
+class TokenList:
+    """Parallel token/id lists sorted by token; a prefix is one bisect range"""
+    
+    def __init__(self, entries: List[Tuple[str, int]] = ()):
+        entries = sorted(entries)
+        self.tokens = [token for token, _ in entries]
+        self.ids = [reseller_id for _, reseller_id in entries]
+    
+    def prefix_range(self, prefix: str) -> Tuple[int, int]:
+        start = bisect_left(self.tokens, prefix)
+        return start, bisect_left(self.tokens, prefix + '\uffff', start)
+    
+    def add(self, token: str, reseller_id: int):
+        position = bisect_right(self.tokens, token)
+        self.tokens.insert(position, token)
+        self.ids.insert(position, reseller_id)
+    
+    def remove(self, token: str, reseller_id: int):
+        start = bisect_left(self.tokens, token)
+        end = bisect_right(self.tokens, token, start)
+        position = self.ids.index(reseller_id, start, end)
+        del self.tokens[position], self.ids[position]
+
+class PrefixSearchIndex(ResellerSearchIndex):
+    """
+    In-memory fallback for databases without FTS
+    Name/code tokens and email tokens live in separate sorted lists (the
+    two ranking tiers). Reseller writes in this process are applied
+    incrementally through mapper events.
+    """
+    
+    # Candidates examined per tier before ranking, as a multiple of the limit
+    CANDIDATE_FACTOR = 20
+    
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.loaded = False
+        self.names = TokenList()
+        self.emails = TokenList()
+        self.documents: Dict[int, Tuple[List[str], List[str]]] = {}
+    
+    def ensure(self):
+        with self.lock:
+            if self.loaded:
+                return
+            rows = db.session.query(
+                Reseller.id, Reseller.first_name, Reseller.last_name,
+                Reseller.email, Reseller.employee_code
+            ).all()
+            names, emails = [], []
+            for row in rows:
+                name_tokens, email_tokens = self._document(*row[1:])
+                self.documents[row.id] = (name_tokens, email_tokens)
+                names.extend((token, row.id) for token in name_tokens)
+                emails.extend((token, row.id) for token in email_tokens)
+            self.names = TokenList(names)
+            self.emails = TokenList(emails)
+            self.loaded = True
+    
+    def _document(self, first_name, last_name, email, employee_code) -> Tuple[List[str], List[str]]:
+        names = set(tokenize(first_name) + tokenize(last_name) + tokenize(employee_code))
+        return sorted(names), sorted(set(tokenize(email)) - names)
+    
+    def update(self, reseller_id: int, first_name=None, last_name=None, email=None,
+               employee_code=None, deleted: bool = False):
+        """Replace (or drop) one reseller's tokens"""
+        with self.lock:
+            if not self.loaded:
+                return
+            old_names, old_emails = self.documents.pop(reseller_id, ([], []))
+            for token in old_names:
+                self.names.remove(token, reseller_id)
+            for token in old_emails:
+                self.emails.remove(token, reseller_id)
+            if deleted:
+                return
+            name_tokens, email_tokens = self._document(first_name, last_name, email, employee_code)
+            self.documents[reseller_id] = (name_tokens, email_tokens)
+            for token in name_tokens:
+                self.names.add(token, reseller_id)
+            for token in email_tokens:
+                self.emails.add(token, reseller_id)
+    
+    def search(self, query: str, limit: int = 20) -> List[int]:
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+        
+        with self.lock:
+            # Every token on a name or code first, then matches involving the email
+            reseller_ids = self._scan([self.names], tokens, limit, set(), names_only=True)
+            if len(reseller_ids) < limit:
+                reseller_ids += self._scan(
+                    [self.names, self.emails], tokens, limit - len(reseller_ids),
+                    set(reseller_ids), names_only=False
+                )
+        return reseller_ids
+    
+    def _scan(self, lists: List[TokenList], tokens: List[str], limit: int,
+              seen: set, names_only: bool) -> List[int]:
+        """
+        Walk the narrowest query token's ranges (exact matches sort first)
+        and keep documents whose tokens cover every query token
+        """
+        def ranges(token):
+            return [(tier, tier.prefix_range(token)) for tier in lists]
+        
+        anchor = min(tokens, key=lambda token: sum(end - start for _, (start, end) in ranges(token)))
+        cap = limit * self.CANDIDATE_FACTOR
+        
+        candidates = {}
+        for tier, (start, end) in ranges(anchor):
+            for position in range(start, end):
+                reseller_id = tier.ids[position]
+                if reseller_id in candidates or reseller_id in seen:
+                    continue
+                name_tokens, email_tokens = self.documents[reseller_id]
+                document = name_tokens if names_only else name_tokens + email_tokens
+                if all(any(token.startswith(query_token) for token in document) for query_token in tokens):
+                    inexact = sum(1 for query_token in tokens if query_token not in document)
+                    candidates[reseller_id] = (inexact, reseller_id)
+                    if len(candidates) >= cap:
+                        break
+            if len(candidates) >= cap:
+                break
+        
+        return sorted(candidates, key=candidates.get)[:limit]
+
+# The in-memory fallback is shared by every caller in this process
+_prefix_index = PrefixSearchIndex()
+_indexes: Dict[str, ResellerSearchIndex] = {}
+_indexes_lock = threading.Lock()
+
+SEARCH_INDEXES = {
+    'fts5': SqliteFtsSearchIndex,
+    'trigram': PostgresTrigramSearchIndex,
+    'prefix': lambda: _prefix_index
+}
+
+def _default_backend() -> str:
+    dialect = db.engine.dialect.name
+    if dialect == 'postgresql':
+        return 'trigram'
+    if dialect == 'sqlite':
+        return 'fts5'
+    return 'prefix'
+
+def get_search_index(name: str = None) -> ResellerSearchIndex:
+    """
+    Search backend for the current database, set up on first use
+    Config.SEARCH_INDEX forces one; if its setup fails (no FTS5, no
+    permission for pg_trgm) the in-memory prefix index is used instead
+    """
+    name = name or Config.SEARCH_INDEX or _default_backend()
+    key = f"{db.engine.url}:{name}"
+    index = _indexes.get(key)
+    if index is not None:
+        return index
+    
+    with _indexes_lock:
+        if key in _indexes:
+            return _indexes[key]
+        if name not in SEARCH_INDEXES:
+            raise ValueError(f"Unknown search index '{name}'")
+        
+        index = SEARCH_INDEXES[name]()
+        try:
+            index.ensure()
+        except Exception as e:
+            db.session.rollback()
+            logger.warning(f"Search index '{name}' unavailable, using in-memory prefix index: {str(e)}")
+            index = _prefix_index
+            index.ensure()
+        
+        _indexes[key] = index
+        return index
+
+SEARCHED_FIELDS = ('first_name', 'last_name', 'email', 'employee_code')
+
+@event.listens_for(Reseller, 'after_insert')
+def _prefix_index_insert(mapper, connection, target):
+    _prefix_index.update(
+        target.id, target.first_name, target.last_name, target.email, target.employee_code
+    )
+
+@event.listens_for(Reseller, 'after_update')
+def _prefix_index_upsert(mapper, connection, target):
+    state = db.inspect(target)
+    if not any(state.attrs[field].history.has_changes() for field in SEARCHED_FIELDS):
+        return
+    _prefix_index.update(
+        target.id, target.first_name, target.last_name, target.email, target.employee_code
+    )
+
+@event.listens_for(Reseller, 'after_delete')
+def _prefix_index_delete(mapper, connection, target):
+    _prefix_index.update(target.id, deleted=True)
@@ -0,0 +1,198 @@
+# app/services/subtree_aggregates.py - Fenwick Trees over the Euler Tour
+
+from database.models import (
+    db, Reseller, MonthlySales, ResellerTour, HIERARCHY_SCOPE, get_data_versions, tour_version
+)
+from services.rule_plan import get_rule_plan
+from bisect import bisect_right
+from decimal import Decimal
+from typing import Dict, List, Optional, Tuple
+import threading
+
+class FenwickTree:
+    """Binary indexed tree: O(log N) point updates and prefix sums"""
+    
+    def __init__(self, values: List, zero=0):
+        self.zero = zero
+        self.tree = [zero] + list(values)
+        size = len(self.tree)
+        for index in range(1, size):
+            parent = index + (index & -index)
+            if parent < size:
+                self.tree[parent] += self.tree[index]
+    
+    def add(self, position: int, delta):
+        """Add delta at a 0-based position"""
+        index = position + 1
+        while index < len(self.tree):
+            self.tree[index] += delta
+            index += index & -index
+    
+    def prefix_sum(self, end: int):
+        """Sum of positions [0, end)"""
+        total = self.zero
+        index = end
+        while index > 0:
+            total += self.tree[index]
+            index -= index & -index
+        return total
+    
+    def range_sum(self, start: int, end: int):
+        """Sum of positions [start, end)"""
+        return self.prefix_sum(end) - self.prefix_sum(start)
+
+class MonthSubtreeAggregates:
+    """
+    One month of per-reseller sales laid out in Euler-tour order.
+    Every subtree is a contiguous range, so GGPIS and active counts are
+    two prefix sums, and a sales change is one point update per tree.
+    """
+    
+    def __init__(self, month: str, tour_rows: List[Tuple[int, int, int, str]],
+                 sales: Dict[int, Decimal], data_version: Tuple[int, int]):
+        self.month = month
+        self.plan = get_rule_plan(month)
+        self.version = tour_version()
+        self.data_version = data_version  # (hierarchy, month) versions read before loading
+        self.lock = threading.Lock()
+        
+        zero = Decimal('0')
+        self.labels = [tour_in for _, tour_in, _, _ in tour_rows]
+        self.position = {reseller_id: index for index, (reseller_id, _, _, _) in enumerate(tour_rows)}
+        self.tour_out = {reseller_id: tour_out for reseller_id, _, tour_out, _ in tour_rows}
+        self.level = {reseller_id: level for reseller_id, _, _, level in tour_rows}
+        self.gppis = {reseller_id: sales.get(reseller_id, zero) for reseller_id, _, _, _ in tour_rows}
+        
+        ordered = [reseller_id for reseller_id, _, _, _ in tour_rows]
+        self.sales_tree = FenwickTree([self.gppis[r] for r in ordered], zero)
+        self.flag_trees = {
+            key: FenwickTree([int(self._is_active(r, key)) for r in ordered])
+            for key in self._flag_keys()
+        }
+    
+    def _flag_keys(self) -> List[Tuple[str, int]]:
+        """(level, threshold) pairs that get a counting tree"""
+        thresholds = self.plan.active_thresholds
+        keys = [(level, thresholds[level]) for level in ['BP', 'IBO', 'BD']]
+        keys.append(('IBO', thresholds['IBO_BD_CALC']))
+        return keys
+    
+    def _is_active(self, reseller_id: int, key: Tuple[str, int]) -> bool:
+        level, threshold = key
+        return self.level[reseller_id] == level and self.gppis[reseller_id] >= threshold
+    
+    def covers(self, reseller_id: int) -> bool:
+        return reseller_id in self.position
+    
+    def _range(self, reseller_id: int) -> Tuple[int, int]:
+        """Positions [start, end) of the reseller's subtree, itself first"""
+        start = self.position[reseller_id]
+        return start, bisect_right(self.labels, self.tour_out[reseller_id])
+    
+    def group_sales(self, reseller_id: int) -> Decimal:
+        """GGPIS: GPPIS of the reseller and its whole downline"""
+        with self.lock:
+            start, end = self._range(reseller_id)
+            return self.sales_tree.range_sum(start, end)
+    
+    def count_active(self, reseller_id: int, level: str, threshold) -> Optional[int]:
+        """Active downlines of one level, or None if no tree tracks that threshold"""
+        tree = self.flag_trees.get((level, threshold))
+        if tree is None:
+            return None
+        with self.lock:
+            start, end = self._range(reseller_id)
+            return tree.range_sum(start + 1, end)
+    
+    def update_sales(self, reseller_id: int, gppis: Decimal):
+        """Point update for a changed GPPIS"""
+        with self.lock:
+            position = self.position[reseller_id]
+            old_flags = {key: self._is_active(reseller_id, key) for key in self.flag_trees}
+            
+            self.sales_tree.add(position, gppis - self.gppis[reseller_id])
+            self.gppis[reseller_id] = gppis
+            
+            for key, tree in self.flag_trees.items():
+                step = int(self._is_active(reseller_id, key)) - int(old_flags[key])
+                if step:
+                    tree.add(position, step)
+
+# Shared by every index instance in this process, keyed by month
+_month_aggregates: Dict[str, MonthSubtreeAggregates] = {}
+_build_lock = threading.Lock()
+
+def _data_version(month: str) -> Tuple[int, int]:
+    """(hierarchy, month) data versions; any process's sponsor, level, rule or sales write moves them"""
+    versions = get_data_versions([HIERARCHY_SCOPE, month])
+    return tuple(versions.get(scope, (0, None))[0] for scope in (HIERARCHY_SCOPE, month))
+
+def _is_current(aggregates: Optional[MonthSubtreeAggregates], month: str,
+                data_version: Tuple[int, int]) -> bool:
+    return (aggregates is not None and aggregates.version == tour_version() and
+            aggregates.data_version == data_version and
+            aggregates.plan is get_rule_plan(month))
+
+def get_month_aggregates(month: str) -> MonthSubtreeAggregates:
+    """Get the month's aggregates, (re)building them when the hierarchy, the month's sales or rules changed"""
+    # Read before any rows, so the aggregates are never stamped newer than their inputs
+    data_version = _data_version(month)
+    aggregates = _month_aggregates.get(month)
+    if _is_current(aggregates, month, data_version):
+        return aggregates
+    
+    with _build_lock:
+        aggregates = _month_aggregates.get(month)
+        if _is_current(aggregates, month, data_version):
+            return aggregates
+        
+        tour_rows = db.session.query(
+            ResellerTour.reseller_id,
+            ResellerTour.tour_in,
+            ResellerTour.tour_out,
+            Reseller.level
+        ).join(Reseller, Reseller.id == ResellerTour.reseller_id).order_by(ResellerTour.tour_in).all()
+        
+        sales = dict(db.session.query(MonthlySales.reseller_id, MonthlySales.gppis).filter(
+            MonthlySales.month == month
+        ).all())
+        
+        aggregates = MonthSubtreeAggregates(month, tour_rows, sales, data_version)
+        _month_aggregates[month] = aggregates
+        return aggregates
+
+def apply_sales_changes(changes: Dict[Tuple[int, str], Decimal]):
+    """
+    Keep already loaded months in step with one committed sales write
+    ({(reseller_id, month): gppis}). A month is only updated in place when
+    that write is the one change since it was loaded; otherwise it is dropped
+    and rebuilt on next use.
+    """
+    by_month = {}
+    for (reseller_id, month), gppis in changes.items():
+        by_month.setdefault(month, {})[reseller_id] = gppis
+    
+    for month, month_changes in by_month.items():
+        aggregates = _month_aggregates.get(month)
+        if aggregates is None:
+            continue
+        
+        hierarchy_version, month_version = _data_version(month)
+        with _build_lock:
+            if (aggregates is not _month_aggregates.get(month) or
+                    aggregates.version != tour_version() or
+                    aggregates.data_version != (hierarchy_version, month_version - 1) or
+                    not all(aggregates.covers(reseller_id) for reseller_id in month_changes)):
+                _month_aggregates.pop(month, None)
+                continue
+            
+            for reseller_id, gppis in month_changes.items():
+                aggregates.update_sales(reseller_id, gppis)
+            aggregates.data_version = (hierarchy_version, month_version)
+
+def invalidate(month: str = None):
+    """Drop loaded months so they are rebuilt from the database"""
+    if month:
+        _month_aggregates.pop(month, None)
+    else:
+        _month_aggregates.clear()
@@ -0,0 +1,450 @@
+# app/services/vectorized_engine.py - NumPy Vectorized Commission Engine
+
+from database.models import db, Reseller, MonthlySales, DEFAULT_PRODUCT_SPLIT, SALES_PRODUCT_COLUMNS
+from services.month_data import previous_month
+from services.rule_plan import get_rule_plan
+from typing import Dict, List, Optional
+import logging
+
+try:
+    import numpy as np
+except ImportError:  # Optional dependency, only needed for this engine
+    np = None
+
+LEVEL_CODES = {'BP': 0, 'IBO': 1, 'BD': 2}
+LEVEL_NAMES = ['BP', 'IBO', 'BD']
+
+# Outright discount products in MonthlySales column order, with the default
+# split as integer percentages
+PRODUCT_SPLIT = [
+    (product, int(share * 100)) for product, share in zip(SALES_PRODUCT_COLUMNS, DEFAULT_PRODUCT_SPLIT)
+]
+
+# Amounts are kept as integer centavos; rates as integer basis points
+RATE_SCALE = 10000
+
+def _bp(rate: float) -> int:
+    """Rate as integer basis points (0.05 -> 500)"""
+    return int(round(rate * RATE_SCALE))
+
+def _cents(amount) -> int:
+    return int(round(float(amount) * 100))
+
+def _round_scaled(values, scale: int):
+    """Round non-negative scaled integers to the nearest unit, halves up"""
+    return (values + scale // 2) // scale
+
+class VectorizedCloseResult:
+    """Per-reseller month-close figures as parallel arrays (amounts in centavos)"""
+    
+    def __init__(self, month: str, ids, arrays: Dict):
+        self.month = month
+        self.ids = ids
+        self.arrays = arrays
+        self._index = None
+    
+    def __len__(self):
+        return len(self.ids)
+    
+    def get(self, reseller_id: int) -> Optional[Dict]:
+        """Figures for one reseller in pesos, shaped like a MonthlySummary"""
+        position = int(np.searchsorted(self.ids, reseller_id))
+        if position >= len(self.ids) or self.ids[position] != reseller_id:
+            return None
+        
+        a = self.arrays
+        go_tier = int(a['group_override_tier'][position])
+        sf_tier = int(a['bd_service_fee_tier'][position])
+        return {
+            'reseller_id': reseller_id,
+            'month': self.month,
+            'gppis': a['gppis'][position] / 100,
+            'ggpis': a['ggpis'][position] / 100,
+            'active_status': bool(a['active'][position]),
+            'outright_discount': a['outright_discount'][position] / 100,
+            'group_override': a['group_override'][position] / 100,
+            'lifetime_incentive': a['lifetime_incentive'][position] / 100,
+            'bd_service_fee': a['bd_service_fee'][position] / 100,
+            'bd_override': a['bd_override'][position] / 100,
+            'total_commission': a['total_commission'][position] / 100,
+            'group_override_tier': a['group_override_tiers'][go_tier] if go_tier >= 0 else None,
+            'bd_service_fee_tier': a['bd_service_fee_tiers'][sf_tier] if sf_tier >= 0 else None,
+            'active_ibos_downline': int(a['active_ibos_downline'][position]),
+            'promotion_eligible': bool(a['promotion_eligible'][position])
+        }
+
+    def close_results(self) -> Dict[int, Dict]:
+        """
+        Every reseller's figures shaped like CommissionEngine.close_month results,
+        ready for MonthCloseService.persist (lines carry no per-downline details)
+        """
+        return {
+            reseller_id: self._close_result(position, reseller_id)
+            for position, reseller_id in enumerate(self.ids.tolist())
+        }
+    
+    def _close_result(self, position: int, reseller_id: int) -> Dict:
+        a = self.arrays
+        level = LEVEL_NAMES[a['levels'][position]]
+        gppis = int(a['gppis'][position])
+        ggpis = int(a['ggpis'][position])
+        lines = []
+        qualifications = {}
+        
+        if gppis > 0:
+            for column, (product, _) in enumerate(PRODUCT_SPLIT):
+                base = int(a['outright_bases'][position, column]) / 10000
+                if base > 0:
+                    lines.append({
+                        'type': 'outright_discount',
+                        'product': product,
+                        'base_amount': base,
+                        'rate': int(a['outright_rates'][position, column]) / RATE_SCALE,
+                        'amount': int(a['outright_lines'][position, column]) / 100,
+                        'description': f'{level} Outright Discount - {product}'
+                    })
+        
+        go_tier = int(a['group_override_tier'][position])
+        if go_tier >= 0:
+            tier = a['group_override_tiers'][go_tier]
+            active_bps = int(a['active_bps'][position])
+            rate = int(a['group_override_rates'][go_tier]) / RATE_SCALE
+            lines.append({
+                'type': 'group_override',
+                'tier': tier,
+                'active_bps': active_bps,
+                'base_amount': ggpis / 100,
+                'rate': rate,
+                'amount': int(a['group_override'][position]) / 100,
+                'description': f'Group Override - {tier} ({active_bps} Active BPs)'
+            })
+            qualifications['group_override'] = {'tier': tier, 'active_bps': active_bps, 'rate': rate}
+        
+        qualifying_ibos = int(a['lifetime_qualifying'][position])
+        if level == 'IBO' and gppis >= a['lifetime_min'] and qualifying_ibos:
+            lines.append({
+                'type': 'lifetime_incentive',
+                'qualifying_ibos': qualifying_ibos,
+                'base_amount': int(a['lifetime_base'][position]) / 100,
+                'rate': a['lifetime_rate'] / RATE_SCALE,
+                'amount': int(a['lifetime_incentive'][position]) / 100,
+                'description': f'Lifetime Incentive ({qualifying_ibos} Qualifying IBOs)'
+            })
+        
+        sf_tier = int(a['bd_service_fee_tier'][position])
+        if sf_tier >= 0:
+            tier = a['bd_service_fee_tiers'][sf_tier]
+            active_ibos = int(a['active_ibos_downline'][position])
+            rate = int(a['bd_service_fee_rates'][sf_tier]) / RATE_SCALE
+            lines.append({
+                'type': 'bd_service_fee',
+                'tier': tier,
+                'active_ibos': active_ibos,
+                'base_amount': ggpis / 100,
+                'rate': rate,
+                'amount': int(a['bd_service_fee'][position]) / 100,
+                'description': f'BD Service Fee - {tier} ({active_ibos} Active IBOs)'
+            })
+            qualifications['bd_service_fee'] = {'tier': tier, 'active_ibos': active_ibos, 'rate': rate}
+        
+        qualifying_bds = int(a['bd_override_qualifying'][position])
+        if level == 'BD' and ggpis >= a['bd_override_min'] and qualifying_bds:
+            lines.append({
+                'type': 'bd_override',
+                'qualifying_bds': qualifying_bds,
+                'base_amount': int(a['bd_override_base'][position]) / 100,
+                'rate': a['bd_override_rate'] / RATE_SCALE,
+                'amount': int(a['bd_override'][position]) / 100,
+                'description': f'BD Override ({qualifying_bds} Qualifying BDs)'
+            })
+        
+        if level == 'BP':
+            threshold = a['promotion_threshold']
+            prev_gppis = int(a['prev_gppis'][position])
+            qualifications['promotion'] = {
+                'current_gppis': gppis / 100,
+                'required_gppis': threshold / 100,
+                'progress_percentage': min(gppis / threshold * 100, 100.0),
+                'eligible': gppis >= threshold,
+                'consecutive_months_qualified': gppis >= threshold and prev_gppis >= threshold,
+                'amount_needed': max(threshold - gppis, 0) / 100,
+                'previous_month_gppis': prev_gppis / 100
+            }
+        
+        return {
+            'reseller_id': reseller_id,
+            'level': level,
+            'month': self.month,
+            'gppis': gppis / 100,
+            'ggpis': ggpis / 100,
+            'active_status': bool(a['active'][position]),
+            'commissions': lines,
+            'total_commission': int(a['total_commission'][position]) / 100,
+            'qualifications': qualifications
+        }
+
+class VectorizedCommissionEngine:
+    """
+    Whole-network commission engine over parallel NumPy arrays
+    (parent index, level code, GPPIS in centavos). GGPIS is accumulated
+    level by level in reverse topological order with np.add.at; tiers are
+    threshold / np.searchsorted lookups over the month's rule plan.
+    Produces the same amounts as CommissionEngine to the centavo.
+    """
+    
+    def __init__(self, rules: Dict = None):
+        if np is None:
+            raise ImportError("VectorizedCommissionEngine requires numpy")
+        self.rules = rules  # None follows the rule plan in effect for each month
+        self.logger = logging.getLogger(__name__)
+    
+    def close_month(self, month: str) -> VectorizedCloseResult:
+        """Load the network and the month's sales, then close it"""
+        ids, sponsor_ids, levels = self._load_network()
+        gppis, products = self._load_sales(ids, month)
+        prev_gppis, _ = self._load_sales(ids, previous_month(month))
+        return self.close_arrays(month, ids, sponsor_ids, levels, gppis, prev_gppis, products)
+    
+    def _load_network(self):
+        rows = db.session.execute(
+            db.select(Reseller.id, Reseller.sponsor_id, Reseller.level).order_by(Reseller.id)
+        ).all()
+        ids = np.fromiter((r[0] for r in rows), dtype=np.int64, count=len(rows))
+        sponsor_ids = np.fromiter(
+            (r[1] if r[1] is not None else -1 for r in rows), dtype=np.int64, count=len(rows)
+        )
+        levels = np.fromiter((LEVEL_CODES[r[2]] for r in rows), dtype=np.int8, count=len(rows))
+        return ids, sponsor_ids, levels
+    
+    def _load_sales(self, ids, month: str):
+        """GPPIS and (premium, standard, basic) columns in centavos, aligned with ids"""
+        rows = db.session.execute(
+            db.select(
+                MonthlySales.reseller_id, MonthlySales.gppis, MonthlySales.premium_sales,
+                MonthlySales.standard_sales, MonthlySales.basic_sales
+            ).where(MonthlySales.month == month)
+        ).all()
+        gppis = np.zeros(len(ids), dtype=np.int64)
+        products = np.zeros((len(ids), len(PRODUCT_SPLIT)), dtype=np.int64)
+        if not rows or not len(ids):
+            return gppis, products
+        
+        # Sales rows whose reseller is not in the loaded network are dropped,
+        # not scattered onto whichever neighbour searchsorted lands on
+        reseller_ids = np.fromiter((r[0] for r in rows), dtype=np.int64, count=len(rows))
+        positions = np.minimum(np.searchsorted(ids, reseller_ids), len(ids) - 1)
+        known = ids[positions] == reseller_ids
+        if not known.all():
+            self.logger.warning(
+                f"Ignoring {int((~known).sum())} {month} sales rows for unknown resellers"
+            )
+        
+        row_gppis = np.array([_cents(r[1] or 0) for r in rows], dtype=np.int64)
+        row_products = np.array(
+            [[_cents(amount or 0) for amount in r[2:]] for r in rows], dtype=np.int64
+        )
+        gppis[positions[known]] = row_gppis[known]
+        products[positions[known]] = row_products[known]
+        return gppis, products
+    
+    def close_arrays(self, month: str, ids, sponsor_ids, levels, gppis, prev_gppis=None,
+                     products=None) -> VectorizedCloseResult:
+        """
+        Close a month from arrays sorted by reseller id
+        sponsor_ids uses -1 for roots; gppis are integer centavos; products
+        is an optional (n, 3) array of recorded premium/standard/basic sales
+        """
+        rules = self.rules or get_rule_plan(month).rules
+        count = len(ids)
+        if prev_gppis is None:
+            prev_gppis = np.zeros(count, dtype=np.int64)
+        
+        parent = self._parent_index(ids, sponsor_ids)
+        depth = self._depths(parent)
+        has_parent = parent >= 0
+        
+        is_bp = levels == LEVEL_CODES['BP']
+        is_ibo = levels == LEVEL_CODES['IBO']
+        is_bd = levels == LEVEL_CODES['BD']
+        
+        thresholds = rules['active_thresholds']
+        threshold_by_level = np.array([_cents(thresholds[name]) for name in LEVEL_NAMES])
+        active = gppis >= threshold_by_level[levels]
+        active_ibo_calc = is_ibo & (gppis >= _cents(thresholds['IBO_BD_CALC']))
+        
+        # GGPIS and active IBO counts, deepest level first
+        ggpis = gppis.copy()
+        active_ibos_subtree = active_ibo_calc.astype(np.int64)
+        sort_key = -depth.astype(np.int16) if depth.max(initial=0) < 2 ** 15 else -depth
+        order = np.argsort(sort_key, kind='stable')  # Radix sort on small ints
+        boundaries = np.flatnonzero(np.diff(depth[order])) + 1
+        for level_nodes in np.split(order, boundaries):
+            level_nodes = level_nodes[has_parent[level_nodes]]
+            if len(level_nodes):
+                np.add.at(ggpis, parent[level_nodes], ggpis[level_nodes])
+                np.add.at(active_ibos_subtree, parent[level_nodes], active_ibos_subtree[level_nodes])
+        active_ibos_downline = active_ibos_subtree - active_ibo_calc
+        
+        # Outright discount: product sales x per-level rate, one rounded line per product.
+        # As in product_breakdown, GPPIS the product columns do not cover follows the
+        # default split, and columns adding up to more than GPPIS are ignored
+        remainder = gppis
+        covered = np.zeros(count, dtype=bool)
+        if products is not None:
+            recorded_total = products.sum(axis=1)
+            covered = recorded_total <= gppis
+            remainder = np.where(covered, gppis - recorded_total, gppis)
+        outright_bases = np.zeros((count, len(PRODUCT_SPLIT)), dtype=np.int64)  # centavos x 100
+        outright_lines = np.zeros((count, len(PRODUCT_SPLIT)), dtype=np.int64)
+        outright_rates = np.zeros((count, len(PRODUCT_SPLIT)), dtype=np.int64)
+        for column, (product, split) in enumerate(PRODUCT_SPLIT):
+            rate_by_level = np.array(
+                [_bp(rules['outright_discount'][product][name]) for name in LEVEL_NAMES]
+            )
+            rates = rate_by_level[levels]
+            base = remainder * split
+            if products is not None:
+                base = base + np.where(covered, products[:, column] * 100, 0)
+            outright_bases[:, column] = base
+            outright_lines[:, column] = _round_scaled(base * rates, 100 * RATE_SCALE)
+            outright_rates[:, column] = rates
+        outright_lines[gppis <= 0] = 0
+        outright = outright_lines.sum(axis=1)
+        
+        # Group override: tier index is the lower of the BP-count and GGPIS tiers
+        active_bps = self._count_children(parent, is_bp & active & has_parent, count)
+        go_tiers = sorted(rules['group_override'].items(), key=lambda item: item[1]['min_ggpis'])
+        go_min_bps = np.array([t['min_active_bps'] for _, t in go_tiers])
+        go_min_ggpis = np.array([_cents(t['min_ggpis']) for _, t in go_tiers])
+        go_rates = np.array([_bp(t['rate']) for _, t in go_tiers])
+        if np.any(np.diff(go_min_bps) < 0):
+            raise ValueError("Group override tiers must rise in both active BPs and GGPIS")
+        go_tier = np.minimum(
+            np.searchsorted(go_min_bps, active_bps, side='right'),
+            np.searchsorted(go_min_ggpis, ggpis, side='right')
+        ) - 1
+        go_tier[~is_ibo] = -1
+        group_override = np.where(
+            go_tier >= 0,
+            _round_scaled(ggpis * go_rates[np.maximum(go_tier, 0)], RATE_SCALE),
+            0
+        )
+        
+        # Lifetime incentive on qualifying direct IBOs
+        li = rules['lifetime_incentive']
+        li_min = _cents(li['min_gppis'])
+        qualifying_ibo = is_ibo & (gppis >= li_min) & has_parent
+        li_base = self._sum_children(parent, qualifying_ibo, gppis, count)
+        li_count = self._count_children(parent, qualifying_ibo, count)
+        lifetime = np.where(
+            is_ibo & (gppis >= li_min),
+            _round_scaled(li_base * _bp(li['rate']), RATE_SCALE),
+            0
+        )
+        
+        # BD service fee
+        sf = rules['bd_service_fee']
+        sf_tiers = sorted(
+            ((key, value) for key, value in sf.items() if key.startswith('tier')),
+            key=lambda item: item[1]['min_ggpis']
+        )
+        sf_tier_names = [f"Tier {key[-1]}" for key, _ in sf_tiers]
+        sf_min_ggpis = np.array([_cents(t['min_ggpis']) for _, t in sf_tiers])
+        sf_rates = np.array([_bp(t['rate']) for _, t in sf_tiers])
+        sf_tier = np.searchsorted(sf_min_ggpis, ggpis, side='right') - 1
+        sf_eligible = (is_bd & (gppis >= _cents(thresholds['BD'])) &
+                       (active_ibos_downline >= sf['min_active_ibos']))
+        sf_tier[~sf_eligible] = -1
+        bd_service_fee = np.where(
+            sf_tier >= 0,
+            _round_scaled(ggpis * sf_rates[np.maximum(sf_tier, 0)], RATE_SCALE),
+            0
+        )
+        
+        # BD override on qualifying direct BDs
+        bo = rules['bd_override']
+        bo_min = _cents(bo['min_ggpis_both'])
+        qualifying_bd = is_bd & (ggpis >= bo_min) & has_parent
+        bo_base = self._sum_children(parent, qualifying_bd, ggpis, count)
+        bo_count = self._count_children(parent, qualifying_bd, count)
+        bd_override = np.where(
+            is_bd & (ggpis >= bo_min),
+            _round_scaled(bo_base * _bp(bo['rate']), RATE_SCALE),
+            0
+        )
+        
+        promotion_threshold = _cents(rules['promotion']['bp_to_ibo_threshold'])
+        
+        total = outright + group_override + lifetime + bd_service_fee + bd_override
+        
+        self.logger.info(f"Vectorized close of {month} for {count} resellers: ₱{total.sum() / 100:,.2f}")
+        
+        return VectorizedCloseResult(month, ids, {
+            'levels': levels,
+            'gppis': gppis,
+            'prev_gppis': prev_gppis,
+            'ggpis': ggpis,
+            'active': active,
+            'active_ibos_downline': active_ibos_downline,
+            'active_bps': active_bps,
+            'outright_discount': outright,
+            'outright_bases': outright_bases,
+            'outright_lines': outright_lines,
+            'outright_rates': outright_rates,
+            'group_override': group_override,
+            'group_override_tier': go_tier,
+            'group_override_tiers': [name.title() for name, _ in go_tiers],
+            'group_override_rates': go_rates,
+            'lifetime_incentive': lifetime,
+            'lifetime_base': li_base,
+            'lifetime_qualifying': li_count,
+            'lifetime_rate': _bp(li['rate']),
+            'lifetime_min': li_min,
+            'bd_service_fee': bd_service_fee,
+            'bd_service_fee_tier': sf_tier,
+            'bd_service_fee_tiers': sf_tier_names,
+            'bd_service_fee_rates': sf_rates,
+            'bd_override': bd_override,
+            'bd_override_base': bo_base,
+            'bd_override_qualifying': bo_count,
+            'bd_override_rate': _bp(bo['rate']),
+            'bd_override_min': bo_min,
+            'promotion_threshold': promotion_threshold,
+            'total_commission': total,
+            'promotion_eligible': is_bp & (gppis >= promotion_threshold),
+            'promotion_consecutive': is_bp & (gppis >= promotion_threshold) &
+                                     (prev_gppis >= promotion_threshold)
+        })
+    
+    def _parent_index(self, ids, sponsor_ids):
+        """Map sponsor ids onto array positions (-1 for roots and unknown sponsors)"""
+        if not len(ids):
+            return np.zeros(0, dtype=np.int64)
+        
+        # Direct lookup table by id; ids are (nearly) dense autoincrement keys
+        lookup = np.full(int(ids[-1]) + 2, -1, dtype=np.int64)
+        lookup[ids] = np.arange(len(ids))
+        
+        valid = (sponsor_ids >= 0) & (sponsor_ids <= ids[-1])
+        return np.where(valid, lookup[np.where(valid, sponsor_ids, -1)], -1)
+    
+    def _depths(self, parent):
+        """Depth of every node by pointer jumping, O(log depth) vector steps"""
+        depth = (parent >= 0).astype(np.int64)
+        jump = parent.copy()
+        for _ in range(64):
+            linked = jump >= 0
+            if not linked.any():
+                return depth
+            targets = jump[linked]
+            depth[linked] += depth[targets]
+            jump[linked] = jump[targets]
+        raise ValueError("Sponsor links contain a cycle")
+    
+    def _count_children(self, parent, mask, count: int):
+        return np.bincount(parent[mask], minlength=count).astype(np.int64)
+    
+    def _sum_children(self, parent, mask, values, count: int):
+        totals = np.zeros(count, dtype=np.int64)
+        np.add.at(totals, parent[mask], values[mask])
+        return totals
@@ -64,8 +64,39 @@ class Config:
     DB_POOL_TIMEOUT = 30
     DB_POOL_RECYCLE = 3600
     
+    # Month Close Settings
+    MONTH_CLOSE_BATCH_SIZE = 1000  # Rows per bulk insert round trip
+    MONTH_CLOSE_WORKERS = int(os.environ.get('MONTH_CLOSE_WORKERS') or os.cpu_count() or 1)
+    MONTH_CLOSE_PARALLEL_MIN_RESELLERS = 5000  # Smaller networks close in-process
+    MONTH_CLOSE_START_METHOD = 'spawn'  # Workers never inherit DB connections
+    MONTH_CLOSE_ENGINE = os.environ.get('MONTH_CLOSE_ENGINE', 'orm')  # 'orm' or 'vectorized' (needs numpy)
+    
+    # Sales Import Settings
+    SALES_IMPORT_CHUNK_SIZE = 5000  # Rows validated and written per round trip
+    SALES_IMPORT_MAX_ERRORS = 100  # Rejected rows reported back in detail
+    GROUP_SALES_RESEED_MIN_CHANGES = 500  # Larger batches rebuild the month's group sales in one pass
+    
+    # Hierarchy Traversal Settings
+    HIERARCHY_INDEX = os.environ.get('HIERARCHY_INDEX', 'closure')  # 'closure', 'cte' or 'euler'
+    HIERARCHY_MAX_DEPTH = 1000  # Recursion guard for the 'cte' backend
+    HIERARCHY_PAGE_MAX_DEPTH = 10  # Deepest expansion one /api/hierarchy call may ask for
+    HIERARCHY_PAGE_MAX_NODES = 5000  # Stop expanding once a response holds this many nodes
+    HIERARCHY_STREAM_BATCH_SIZE = 1000  # Rows fetched per round trip when streaming the tree
+    
+    # Search Settings
+    SEARCH_INDEX = os.environ.get('SEARCH_INDEX')  # 'fts5', 'trigram' or 'prefix'; None picks by database
+    SEARCH_MAX_RESULTS = 50
+    
     # Pagination Settings
     ITEMS_PER_PAGE = 50
+    MAX_ITEMS_PER_PAGE = 500  # Upper bound for a client-supplied limit
+    MEMBER_STATS_CACHE_SIZE = 256  # Member listing filter sets whose totals are kept between pages
+    COMMISSION_HISTORY_MAX_MONTHS = 24  # Longest commission history one request may ask for
+    COMMISSION_BATCH_MAX_MONTHS = 12  # Longest month range one batch commissions request may cover
+    COMMISSION_CACHE_SIZE = int(os.environ.get('COMMISSION_CACHE_SIZE') or 20000)  # Cached reseller-month results; 0 disables
+    
+    # Reseller Details Settings
+    RESELLER_DETAIL_WORKERS = 4  # Threads computing requested detail sections side by side
     
     # Logging Configuration
     LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')
@@ -9,16 +9,71 @@ from pathlib import Path
 app_dir = Path(__file__).parent / "app"
 sys.path.insert(0, str(app_dir))
 
-from flask import Flask, render_template, request, jsonify
-from database.models import db, init_db
+from flask import (
+    Flask, Response, render_template, request, jsonify, g, make_response, stream_with_context
+)
+from database.models import (
+    db, init_db, get_data_versions, GLOBAL_SCOPE, HIERARCHY_SCOPE
+)
 from database.sample_data import create_sample_data
+from services.commission_cache import get_commission_cache
 from services.commission_engine import CommissionEngine
+from services.commission_history_service import CommissionHistoryService
+from services.commission_quote_service import CommissionQuoteService
 from services.hierarchy_service import HierarchyService
+from services.month_close_service import MonthCloseService
+from services.sales_import_service import SalesImportService
+from services.sales_ledger_service import SalesLedgerService
+from services.month_data import (
+    activate_month_data, deactivate_month_data, month_range, previous_month
+)
 from config import Config
+from datetime import datetime
+from functools import wraps
+import io
+import itertools
+import json
 import webbrowser
 import threading
 import time
 
+def versioned(scopes_for):
+    """
+    Conditional GET for read endpoints
+    The ETag is built from the data version counters of the scopes the
+    endpoint depends on; a matching If-None-Match (or a fresh
+    If-Modified-Since) gets a 304 before the view runs
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            try:
+                scopes = scopes_for(**kwargs)
+            except ValueError:
+                # Malformed month; let the view report it
+                return view(*args, **kwargs)
+            versions = get_data_versions(scopes)
+            etag = 'v' + '.'.join(str(versions.get(scope, (0, None))[0]) for scope in scopes)
+            stamps = [updated_at for _, updated_at in versions.values()]
+            last_modified = max(stamps) if stamps else None
+            
+            if request.if_none_match:
+                fresh = request.if_none_match.contains(etag)
+            else:
+                since = request.if_modified_since
+                fresh = bool(since and last_modified and
+                             last_modified.replace(microsecond=0) <= since.replace(tzinfo=None))
+            
+            response = Response(status=304) if fresh else make_response(view(*args, **kwargs))
+            if response.status_code in (200, 304):
+                response.set_etag(etag)
+                if last_modified:
+                    response.last_modified = last_modified
+                response.cache_control.no_cache = True
+            return response
+        return wrapper
+    return decorator
+
 def create_app():
     """Create and configure the Flask application"""
     app = Flask(__name__, 
@@ -34,6 +89,22 @@ def create_app():
     # Services
     commission_engine = CommissionEngine()
     hierarchy_service = HierarchyService()
+    month_close_service = MonthCloseService(commission_engine)
+    commission_history_service = CommissionHistoryService()
+    commission_quote_service = CommissionQuoteService(hierarchy_service.group_sales_service)
+    sales_import_service = SalesImportService(hierarchy_service.group_sales_service)
+    sales_ledger_service = SalesLedgerService(hierarchy_service.group_sales_service)
+    
+    # One month data context per request, shared by every engine lookup
+    @app.before_request
+    def open_month_data():
+        g.month_data_token = activate_month_data()
+    
+    @app.teardown_request
+    def close_month_data(exception=None):
+        token = g.pop('month_data_token', None)
+        if token is not None:
+            deactivate_month_data(token)
     
     # =============================================
     # WEB PAGE ROUTES
@@ -49,62 +120,34 @@ def create_app():
         """Dashboard page with overview statistics"""
         return render_template('dashboard.html')
 
+    def member_listing_args():
+        """Filters, sort and seek cursor shared by /members and /api/members"""
+        status = request.args.get('status', '').lower()
+        return {
+            'filters': {
+                'level': request.args.get('level') or None,
+                'organization_id': request.args.get('organization_id', type=int),
+                'territory': request.args.get('territory') or None,
+                'active': {'active': True, 'inactive': False}.get(status)
+            },
+            'sort': request.args.get('sort', 'id'),
+            'descending': request.args.get('direction', 'asc') == 'desc',
+            'cursor': request.args.get('cursor') or None,
+            'limit': request.args.get('limit', type=int),
+            'month': request.args.get('month') or None
+        }
+    
     @app.route('/members')
     def members():
-        """Members management page with real data"""
+        """Members management page with real data, one keyset page at a time"""
         try:
-            # Get all members from hierarchy service
-            hierarchy_data = hierarchy_service.get_complete_hierarchy()
-            
-            # Transform hierarchy data into a flat list for the table
-            members_list = []
-            
-            def extract_members(node, level=0):
-                """Recursively extract members from hierarchy"""
-                member_info = {
-                    'id': node.get('id'),
-                    'name': node.get('name'),
-                    'email': node.get('email', f"{node.get('name', '').lower().replace(' ', '.')}@email.com"),
-                    'level': node.get('level', 'Unknown'),
-                    'sponsor': node.get('sponsor_name', 'N/A'),
-                    'join_date': node.get('join_date', '2024-01-01'),
-                    'status': 'Active' if node.get('active', True) else 'Inactive',
-                    'hierarchy_level': level,
-                    'total_sales': node.get('total_sales', 0),
-                    'monthly_sales': node.get('monthly_sales', 0),
-                    'downline_count': len(node.get('children', []))
-                }
-                members_list.append(member_info)
-                
-                # Process children
-                for child in node.get('children', []):
-                    extract_members(child, level + 1)
-            
-            # Extract members from hierarchy
-            if isinstance(hierarchy_data, list):
-                for root_member in hierarchy_data:
-                    extract_members(root_member)
-            else:
-                extract_members(hierarchy_data)
-            
-            # Sort members by ID
-            members_list.sort(key=lambda x: x['id'])
-            
-            # Calculate summary stats
-            total_members = len(members_list)
-            active_members = len([m for m in members_list if m['status'] == 'Active'])
-            total_sales = sum(m['monthly_sales'] for m in members_list)
-            
-            stats = {
-                'total_members': total_members,
-                'active_members': active_members,
-                'inactive_members': total_members - active_members,
-                'total_sales': total_sales
-            }
+            page = hierarchy_service.list_members(**member_listing_args())
             
             return render_template('members.html', 
-                                 members=members_list, 
-                                 stats=stats)
+                                 members=page['members'], 
+                                 stats=page['stats'],
+                                 page=page,
+                                 args=request.args)
             
         except Exception as e:
             print(f"Error loading members: {e}")
@@ -112,6 +155,8 @@ def create_app():
             return render_template('members.html', 
                                  members=[], 
                                  stats={'total_members': 0, 'active_members': 0, 'inactive_members': 0, 'total_sales': 0},
+                                 page=None,
+                                 args=request.args,
                                  error="Failed to load member data")
 
     @app.route('/commissions')
@@ -129,14 +174,92 @@ def create_app():
     # =============================================
     
     @app.route('/api/hierarchy')
+    @versioned(lambda: [HIERARCHY_SCOPE])
     def get_hierarchy():
-        """Get complete hierarchy data"""
+        """
+        Get hierarchy data
+        With root, depth, cursor or limit only the requested levels are
+        returned; without them, the complete nested tree. stream=1 sends
+        the full tree (or root's subtree) incrementally, as nested JSON or
+        with format=ndjson as one row per line. format=columnar returns
+        parallel arrays with deduplicated organization/position tables
+        """
         try:
-            hierarchy_data = hierarchy_service.get_complete_hierarchy()
+            if request.args.get('format') == 'columnar':
+                return jsonify({
+                    'success': True,
+                    'data': hierarchy_service.get_hierarchy_columnar(
+                        root_id=request.args.get('root', type=int)
+                    )
+                })
+            
+            if request.args.get('stream', type=int):
+                fmt = request.args.get('format', 'json')
+                chunks = hierarchy_service.stream_hierarchy(
+                    root_id=request.args.get('root', type=int), fmt=fmt
+                )
+                mimetype = 'application/x-ndjson' if fmt == 'ndjson' else 'application/json'
+                return Response(stream_with_context(chunks), mimetype=mimetype)
+            
+            paged = any(key in request.args for key in ('root', 'depth', 'cursor', 'limit'))
+            if paged:
+                hierarchy_data = hierarchy_service.get_hierarchy_page(
+                    root_id=request.args.get('root', type=int),
+                    depth=request.args.get('depth', 1, type=int),
+                    cursor=request.args.get('cursor', type=int),
+                    limit=request.args.get('limit', type=int)
+                )
+            else:
+                hierarchy_data = hierarchy_service.get_complete_hierarchy()
             return jsonify({
                 'success': True,
                 'data': hierarchy_data
             })
+        except ValueError as e:
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 404
+        except Exception as e:
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 500
+    
+    @app.route('/api/members')
+    @versioned(lambda: [GLOBAL_SCOPE])
+    def get_members():
+        """Get one keyset page of members; pass next_cursor back as cursor"""
+        try:
+            page = hierarchy_service.list_members(**member_listing_args())
+            return jsonify({
+                'success': True,
+                'data': page
+            })
+        except ValueError as e:
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 400
+        except Exception as e:
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 500
+    
+    @app.route('/api/resellers/search')
+    @versioned(lambda: [HIERARCHY_SCOPE])
+    def search_resellers():
+        """Typeahead search over name, email and employee code"""
+        try:
+            results = hierarchy_service.search_resellers(
+                request.args.get('q', ''),
+                request.args.get('limit', 20, type=int)
+            )
+            return jsonify({
+                'success': True,
+                'data': results
+            })
         except Exception as e:
             return jsonify({
                 'success': False,
@@ -144,14 +267,33 @@ def create_app():
             }), 500
     
     @app.route('/api/reseller/<int:reseller_id>')
+    @versioned(lambda reseller_id: [GLOBAL_SCOPE])
     def get_reseller_details(reseller_id):
-        """Get detailed reseller information"""
+        """Get detailed reseller information, limited to ?fields= sections"""
         try:
-            details = hierarchy_service.get_reseller_details(reseller_id)
+            fields = [f.strip() for f in request.args.get('fields', '').split(',') if f.strip()]
+            month = request.args.get('month') or None
+            if month:
+                datetime.strptime(month, '%Y-%m')
+            months = min(request.args.get('months', 6, type=int), Config.COMMISSION_HISTORY_MAX_MONTHS)
+            sections = hierarchy_service.resolve_detail_sections(fields or None)
+        except ValueError as e:
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 400
+        
+        try:
+            details = hierarchy_service.get_reseller_details(reseller_id, sections, month, max(1, months))
             return jsonify({
                 'success': True,
                 'data': details
             })
+        except ValueError as e:
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 404
         except Exception as e:
             return jsonify({
                 'success': False,
@@ -159,6 +301,7 @@ def create_app():
             }), 500
     
     @app.route('/api/commissions/<int:reseller_id>/<string:month>')
+    @versioned(lambda reseller_id, month: [HIERARCHY_SCOPE, month, previous_month(month)])
     def get_commissions(reseller_id, month):
         """Get commission calculations for reseller and month"""
         try:
@@ -173,30 +316,172 @@ def create_app():
                 'error': str(e)
             }), 500
     
+    @app.route('/api/commissions/batch', methods=['POST'])
+    def get_commissions_batch():
+        """
+        Commissions for many resellers over a month range in one call
+        Body: {"reseller_ids": [..] or "all", "month_from": "YYYY-MM",
+        "month_to": "YYYY-MM", "stream": false}
+        """
+        try:
+            data = request.get_json() or {}
+            reseller_ids = data.get('reseller_ids')
+            if reseller_ids == 'all':
+                reseller_ids = None
+            elif not isinstance(reseller_ids, list) or not reseller_ids:
+                raise ValueError("reseller_ids must be a non-empty list or 'all'")
+            else:
+                reseller_ids = list(dict.fromkeys(int(reseller_id) for reseller_id in reseller_ids))
+            
+            month_from = data.get('month_from') or data.get('month')
+            if not month_from:
+                raise ValueError("month_from is required")
+            months = month_range(month_from, data.get('month_to') or month_from)
+            if len(months) > Config.COMMISSION_BATCH_MAX_MONTHS:
+                raise ValueError(f"At most {Config.COMMISSION_BATCH_MAX_MONTHS} months per batch")
+            
+            batches = commission_engine.calculate_batch(reseller_ids, months)
+            
+            if data.get('stream'):
+                # Validate ids before the first byte goes out
+                first = next(batches)
+                lines = (
+                    json.dumps(result) + '\n'
+                    for _, results in itertools.chain([first], batches)
+                    for result in results.values()
+                )
+                return Response(stream_with_context(lines), mimetype='application/x-ndjson')
+            
+            return jsonify({
+                'success': True,
+                'data': {
+                    month: list(results.values()) for month, results in batches
+                }
+            })
+        except ValueError as e:
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 400
+        except Exception as e:
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 500
+    
+    @app.route('/api/commissions/quote', methods=['POST'])
+    def quote_commissions():
+        """
+        Preview the commission changes one sale would cause, without booking it
+        Body: {"reseller_id": 1, "product": "SUNX-PREMIUM", "amount": 5000,
+        "month": "YYYY-MM" (default: this month)}
+        """
+        try:
+            data = request.get_json() or {}
+            reseller_id = data.get('reseller_id')
+            if reseller_id is None:
+                raise ValueError("reseller_id is required")
+            quote = commission_quote_service.quote(
+                int(reseller_id),
+                data.get('product'),
+                data.get('amount'),
+                data.get('month')
+            )
+            return jsonify({
+                'success': True,
+                'data': quote
+            })
+        except ValueError as e:
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 400
+        except Exception as e:
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 500
+    
+    @app.route('/api/commissions/cache')
+    def get_commission_cache_stats():
+        """Commission result cache size and hit/miss/eviction counters"""
+        try:
+            return jsonify({
+                'success': True,
+                'data': get_commission_cache().stats()
+            })
+        except Exception as e:
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 500
+    
+    @app.route('/api/commissions/history')
+    @versioned(lambda: [GLOBAL_SCOPE])
+    def get_commission_history():
+        """Month x commission type totals for one or more resellers"""
+        try:
+            reseller_ids = [int(i) for i in request.args.get('ids', '').split(',') if i.strip()]
+            if not reseller_ids:
+                raise ValueError("ids is required")
+            months = request.args.get('months', 6, type=int)
+            history = commission_history_service.get_breakdown(reseller_ids, months)
+            return jsonify({
+                'success': True,
+                'data': {str(reseller_id): entries for reseller_id, entries in history.items()}
+            })
+        except ValueError as e:
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 400
+        except Exception as e:
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 500
+    
     @app.route('/api/sales/update', methods=['POST'])
     def update_sales():
-        """Update monthly sales for a reseller"""
+        """
+        Update a reseller's manually entered monthly sales
+        amount may be absolute (15000) or a signed delta ("+1500", "-200");
+        sales booked through /api/sales/transactions stay on top of it.
+        expected_version turns the write into a compare-and-set
+        """
         try:
             data = request.get_json()
             reseller_id = data.get('reseller_id')
             month = data.get('month')
             amount = data.get('amount')
+            expected_version = data.get('expected_version')
             
-            success = hierarchy_service.update_monthly_sales(reseller_id, month, amount)
+            try:
+                if expected_version is not None:
+                    expected_version = int(expected_version)
+                record = hierarchy_service.update_monthly_sales(
+                    reseller_id, month, amount, expected_version
+                )
+            except ValueError as e:
+                return jsonify({
+                    'success': False,
+                    'error': str(e)
+                }), 400
             
-            if success:
+            if record:
                 # Recalculate commissions
                 updated_commissions = commission_engine.calculate_monthly_commissions(reseller_id, month)
                 return jsonify({
                     'success': True,
                     'data': updated_commissions,
+                    'sales': record,
                     'message': 'Sales updated successfully'
                 })
             else:
                 return jsonify({
                     'success': False,
-                    'error': 'Failed to update sales'
-                }), 400
+                    'error': 'Sales record changed or missing; reload and retry'
+                }), 409
                 
         except Exception as e:
             return jsonify({
@@ -204,7 +489,119 @@ def create_app():
                 'error': str(e)
             }), 500
     
+    @app.route('/api/sales/transactions', methods=['GET', 'POST'])
+    def sales_transactions():
+        """List a reseller's sales for a month, or book a new sale"""
+        try:
+            if request.method == 'GET':
+                reseller_id = request.args.get('reseller_id', type=int)
+                month = request.args.get('month')
+                if not reseller_id or not month:
+                    raise ValueError("reseller_id and month are required")
+                return jsonify({
+                    'success': True,
+                    'data': sales_ledger_service.get_transactions(reseller_id, month)
+                })
+            
+            data = request.get_json() or {}
+            transacted_at = data.get('transacted_at')
+            result = sales_ledger_service.record_sale(
+                data.get('reseller_id'),
+                data.get('product'),
+                data.get('amount'),
+                status=data.get('status', 'confirmed'),
+                sale_type=data.get('sale_type'),
+                transacted_at=datetime.fromisoformat(transacted_at) if transacted_at else None
+            )
+            return jsonify({
+                'success': True,
+                'data': result,
+                'message': 'Sale recorded successfully'
+            })
+        except ValueError as e:
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 400
+        except Exception as e:
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 500
+    
+    @app.route('/api/sales/transactions/<int:transaction_id>/status', methods=['POST'])
+    def update_sale_status(transaction_id):
+        """Confirm, hold or cancel a sale"""
+        try:
+            data = request.get_json() or {}
+            result = sales_ledger_service.set_status(transaction_id, data.get('status'))
+            return jsonify({
+                'success': True,
+                'data': result
+            })
+        except ValueError as e:
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 400
+        except Exception as e:
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 500
+    
+    @app.route('/api/sales/bulk', methods=['POST'])
+    def import_sales():
+        """
+        Upsert many monthly sales rows from a CSV or JSONL body
+        The body is read as a stream; group sales are recomputed once at the end
+        """
+        fmt = request.args.get('format')
+        if not fmt:
+            fmt = 'csv' if request.mimetype == 'text/csv' else 'jsonl'
+        if fmt not in ('csv', 'jsonl'):
+            return jsonify({
+                'success': False,
+                'error': f"Unsupported format: {fmt}"
+            }), 400
+        
+        try:
+            stream = io.TextIOWrapper(request.stream, encoding='utf-8', newline='')
+            summary = sales_import_service.import_stream(stream, fmt)
+            return jsonify({
+                'success': True,
+                'data': summary,
+                'message': f"Imported {summary['inserted'] + summary['updated']} sales rows"
+            })
+        except Exception as e:
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 500
+    
+    @app.route('/api/month-close/<string:month>', methods=['POST'])
+    def close_month(month):
+        """Calculate and store commissions for every reseller for a month"""
+        try:
+            summary = month_close_service.close_month(month)
+            return jsonify({
+                'success': True,
+                'data': summary,
+                'message': f'Month {month} closed successfully'
+            })
+        except ValueError as e:
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 400
+        except Exception as e:
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 500
+    
     @app.route('/api/dashboard/stats/<string:month>')
+    @versioned(lambda month: [HIERARCHY_SCOPE, month])
     def get_dashboard_stats(month):
         """Get dashboard statistics for a specific month"""
         try:
@@ -220,6 +617,7 @@ def create_app():
             }), 500
     
     @app.route('/api/promotion/candidates/<string:month>')
+    @versioned(lambda month: [HIERARCHY_SCOPE, month, previous_month(month)])
     def get_promotion_candidates(month):
         """Get BP promotion candidates for a specific month"""
         try:
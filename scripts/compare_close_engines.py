@@ -0,0 +1,55 @@
+# ============================================================================
+# scripts/compare_close_engines.py - Month Close Engine Equivalence Check
+# ============================================================================
+
+import argparse
+import sys
+from pathlib import Path
+
+# Add the project root to Python path
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from main import create_app
+
+def compare_months(months, limit):
+    """Close each month with both engines and print any rows that differ"""
+    from services.month_close_service import MonthCloseService
+    
+    app = create_app()
+    matched = True
+    with app.app_context():
+        service = MonthCloseService()
+        for month in months:
+            report = service.compare_engines(month, limit)
+            if not report['mismatched']:
+                print(f"✅ {month}: {report['resellers']} resellers match to the centavo")
+                continue
+            
+            matched = False
+            print(f"❌ {month}: {report['mismatched']} of {report['resellers']} resellers differ")
+            for mismatch in report['mismatches']:
+                print(f"   reseller {mismatch['reseller_id']}:")
+                print(f"      orm:        {mismatch['orm']}")
+                print(f"      vectorized: {mismatch['vectorized']}")
+    return matched
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Check the vectorized month close against the ORM close (writes nothing)'
+    )
+    parser.add_argument('months', nargs='+', help='Months to compare (YYYY-MM)')
+    parser.add_argument('--limit', type=int, default=20,
+                        help='Mismatched resellers to print per month (default: 20)')
+    args = parser.parse_args()
+    
+    try:
+        return compare_months(args.months, args.limit)
+    except Exception as e:
+        print(f"❌ Comparison failed: {e}")
+        return False
+
+if __name__ == "__main__":
+    success = main()
+    if not success:
+        sys.exit(1)
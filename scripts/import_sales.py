@@ -0,0 +1,68 @@
+# ============================================================================
+# scripts/import_sales.py - Bulk Monthly Sales Importer
+# ============================================================================
+
+import argparse
+import sys
+from pathlib import Path
+
+# Add the project root to Python path
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from main import create_app
+
+def detect_format(path):
+    """Pick csv or jsonl from the file extension"""
+    suffix = Path(path).suffix.lower()
+    if suffix == '.csv':
+        return 'csv'
+    if suffix in ('.jsonl', '.ndjson'):
+        return 'jsonl'
+    return None
+
+def import_file(path, fmt):
+    """Stream one file into MonthlySales and print the summary"""
+    from services.sales_import_service import SalesImportService
+    
+    app = create_app()
+    with app.app_context():
+        service = SalesImportService()
+        if path == '-':
+            summary = service.import_stream(sys.stdin, fmt)
+        else:
+            with open(path, encoding='utf-8', newline='') as stream:
+                summary = service.import_stream(stream, fmt)
+    
+    print(f"✅ Imported {summary['inserted'] + summary['updated']} of {summary['rows']} rows "
+          f"({summary['inserted']} new, {summary['updated']} updated)")
+    if summary['months']:
+        print(f"   Months: {', '.join(summary['months'])}")
+    if summary['rejected']:
+        print(f"⚠️  Rejected {summary['rejected']} rows:")
+        for error in summary['errors']:
+            print(f"   line {error['line']}: {error['error']}")
+    return summary
+
+def main():
+    parser = argparse.ArgumentParser(description='Import monthly sales from CSV or JSONL')
+    parser.add_argument('path', help="CSV/JSONL file, or '-' for stdin")
+    parser.add_argument('--format', choices=['csv', 'jsonl'],
+                        help='Input format (default: from the file extension)')
+    args = parser.parse_args()
+    
+    fmt = args.format or detect_format(args.path)
+    if not fmt:
+        parser.error('cannot tell the format from the file name; pass --format')
+    
+    try:
+        summary = import_file(args.path, fmt)
+    except Exception as e:
+        print(f"❌ Import failed: {e}")
+        return False
+    return not summary['rejected']
+
+if __name__ == "__main__":
+    success = main()
+    if not success:
+        sys.exit(1)